@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# APL CLUSTERING BENCHMARK
+# Compare anlocov.clustering.cluster_apl with the former
+# skmob.preprocessing.clustering.cluster on synthetic APL: most stops at a few
+# places (home, work) plus occasional places. Both must give the same cluster
+# of each APL; the time of both paths is reported. scikit-mobility fails with
+# noise points, so it is only compared with min_samples 1.
+#
+# Run from the project directory: python benchmark/aplClustering.py [APL ...]
+# =============================================================================
+import os, sys, time
+
+import numpy as np
+import pandas as pd
+import skmob as skm
+from skmob.preprocessing import clustering as skm_clustering
+from sklearn.cluster import DBSCAN
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'code'))
+from anlocov import clustering, parameters
+
+# =============================================================================
+# # CONSTANTS DEFINITION
+# =============================================================================
+# Number of APL of each synthetic participant
+APL = [2000, 20000]
+
+# Frequent places around Quito and share of the APL at them
+PLACES = [(-0.180653, -78.467834), (-0.210000, -78.490000), (-0.150000, -78.480000)]
+PLACES_RATE = 0.8
+
+
+def synthetic_apl(numberAPL, seed=0):
+    """
+    Return APL (uid, datetime, lat, lng) with one APL every 1 to 12 hours.
+    """
+    rng = np.random.default_rng(seed)
+    hours = rng.integers(1, 13, numberAPL).cumsum()
+    place = rng.integers(0, len(PLACES), numberAPL)
+    frequent = rng.random(numberAPL) < PLACES_RATE
+    lat = np.where(frequent, np.take([p[0] for p in PLACES], place) + rng.normal(0, 0.0002, numberAPL),
+                   PLACES[0][0] + rng.normal(0, 0.05, numberAPL))
+    lng = np.where(frequent, np.take([p[1] for p in PLACES], place) + rng.normal(0, 0.0002, numberAPL),
+                   PLACES[0][1] + rng.normal(0, 0.05, numberAPL))
+    return pd.DataFrame({'uid': 'synthetic', 'datetime': pd.Timestamp('2020-01-01') + pd.to_timedelta(hours, unit='h'),
+                         'lat': lat, 'lng': lng})
+
+
+def skmob_cluster(dfAPL, params):
+    dfSkmob = skm.TrajDataFrame(dfAPL, latitude='lat', longitude='lng', datetime='datetime', user_id='uid')
+    dfSkmob = skm_clustering.cluster(dfSkmob, cluster_radius_km=params['MIN_CLUSTER_RADIUS_KM'],
+                                     min_samples=params['MIN_SAMPLES_CLUSTER'])
+    return pd.DataFrame(dfSkmob)
+
+
+def sklearn_labels(dfAPL, clusterRadiusKm, minSamples):
+    # DBSCAN labels renumbered as scikit-mobility, noise kept as -1
+    dfAPL = dfAPL.sort_values(['uid', 'datetime'], kind='mergesort', ignore_index=True)
+    db = DBSCAN(eps=clusterRadiusKm / clustering.KMS_PER_RADIAN, min_samples=minSamples, algorithm='ball_tree',
+                metric='haversine').fit(np.radians(dfAPL[['lat', 'lng']].to_numpy()))
+    return clustering.rank_clusters(db.labels_)
+
+
+if __name__ == '__main__':
+    params = parameters.get_parameters()
+    numberAPL = [int(number) for number in sys.argv[1:]] or APL
+    # Compile the kernel (numba) before measuring
+    clustering.cluster_apl(synthetic_apl(100), clusterRadiusKm=params['MIN_CLUSTER_RADIUS_KM'],
+                           minSamples=params['MIN_SAMPLES_CLUSTER'])
+    print('{:>8} {:>9} {:>12} {:>12} {:>10}'.format('APL', 'clusters', 'skmob (s)', 'grid (s)', 'speed-up'))
+    for number in numberAPL:
+        dfAPL = synthetic_apl(number)
+        start = time.perf_counter()
+        dfExpected = skmob_cluster(dfAPL, params)
+        secondsSkmob = time.perf_counter() - start
+        start = time.perf_counter()
+        dfResult = clustering.cluster_apl(dfAPL, clusterRadiusKm=params['MIN_CLUSTER_RADIUS_KM'],
+                                          minSamples=params['MIN_SAMPLES_CLUSTER'])
+        secondsGrid = time.perf_counter() - start
+        np.testing.assert_array_equal(dfExpected['cluster'].to_numpy(), dfResult['cluster'].to_numpy())
+        # Core, border and noise points
+        for minSamples in [3, 10]:
+            np.testing.assert_array_equal(
+                sklearn_labels(dfAPL, params['MIN_CLUSTER_RADIUS_KM'], minSamples),
+                clustering.cluster_apl(dfAPL, clusterRadiusKm=params['MIN_CLUSTER_RADIUS_KM'], minSamples=minSamples)['cluster'].to_numpy())
+        print('{:>8} {:>9} {:>12.3f} {:>12.3f} {:>10.1f}'.format(number, dfResult['cluster'].max() + 1, secondsSkmob,
+                                                                  secondsGrid, secondsSkmob / secondsGrid))
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# FILTER AND COMPRESSION BENCHMARK
+# Compare anlocov.filtering.filter_compress with the former
+# skm_filter.filter(include_loops=True) + skm_compression.compress path on a
+# noisy synthetic GPS stream (dwells, moves, speed outliers and loops). Both
+# must give the same points; the time of both paths is reported.
+#
+# Run from the project directory: python benchmark/filterCompress.py [points ...]
+# e.g. python benchmark/filterCompress.py 5000000
+# =============================================================================
+import os, sys, time
+
+import numpy as np
+import pandas as pd
+import skmob as skm
+from skmob.preprocessing import filtering as skm_filter
+from skmob.preprocessing import compression as skm_compression
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'code'))
+from anlocov import filtering, parameters
+
+# =============================================================================
+# # CONSTANTS DEFINITION
+# =============================================================================
+# Number of points of each synthetic participant
+POINTS = [20000, 100000]
+
+# Reference place (Quito)
+HOME_LAT = -0.180653
+HOME_LON = -78.467834
+
+# Share of points that are speed outliers and loops
+OUTLIER_RATE = 0.01
+LOOP_RATE = 0.005
+
+
+def synthetic_stream(numberPoints, seed=0):
+    """
+    Return a GPS stream (uid, datetime, lat, lng, covidStatus,
+    restrictionLevel) with one point every 10 to 120 seconds.
+    """
+    rng = np.random.default_rng(seed)
+    seconds = rng.integers(10, 121, numberPoints).cumsum()
+    moving = rng.random(numberPoints) < 0.3
+    lat = HOME_LAT + np.cumsum(np.where(moving, rng.normal(0, 0.0005, numberPoints), rng.normal(0, 0.00002, numberPoints)))
+    lng = HOME_LON + np.cumsum(np.where(moving, rng.normal(0, 0.0005, numberPoints), rng.normal(0, 0.00002, numberPoints)))
+    # Speed outliers: isolated jumps of tens of km
+    outliers = rng.random(numberPoints) < OUTLIER_RATE
+    lat[outliers] += rng.normal(0, 0.5, outliers.sum())
+    # Loops: short excursions of a few hundred meters
+    loops = rng.random(numberPoints) < LOOP_RATE
+    lng[loops] += 0.004
+    return pd.DataFrame({'uid': 'synthetic', 'datetime': pd.Timestamp('2020-01-01') + pd.to_timedelta(seconds, unit='s'),
+                         'lat': lat, 'lng': lng, 'covidStatus': 0, 'restrictionLevel': 0})
+
+
+def skmob_filter_compress(dfPoints, params):
+    dfSkmob = skm.TrajDataFrame(dfPoints, user_id='uid', datetime='datetime', longitude='lng', latitude='lat')
+    dfSkmob = skm_filter.filter(dfSkmob, max_speed_kmh=params['MAX_SPEED_KMH'], include_loops=True)
+    numberFiltered = len(dfSkmob)
+    dfSkmob = skm_compression.compress(dfSkmob, spatial_radius_km=params['MIN_SPATIAL_RADIUS_KM'])
+    return pd.DataFrame(dfSkmob), numberFiltered
+
+
+if __name__ == '__main__':
+    params = parameters.get_parameters()
+    points = [int(numberPoints) for numberPoints in sys.argv[1:]] or POINTS
+    # Compile the kernel (numba) before measuring
+    filtering.filter_compress(synthetic_stream(100), maxSpeedKmh=params['MAX_SPEED_KMH'], spatialRadiusKm=params['MIN_SPATIAL_RADIUS_KM'])
+    print('{:>10} {:>8} {:>8} {:>12} {:>10} {:>12} {:>10}'.format('points', 'speed', 'loops', 'compression', 'skmob (s)', 'fused (s)', 'speed-up'))
+    for numberPoints in points:
+        dfPoints = synthetic_stream(numberPoints)
+        start = time.perf_counter()
+        dfExpected, numberFiltered = skmob_filter_compress(dfPoints, params)
+        secondsSkmob = time.perf_counter() - start
+        start = time.perf_counter()
+        dfResult, droppedPoints = filtering.filter_compress(dfPoints, maxSpeedKmh=params['MAX_SPEED_KMH'],
+                                                            spatialRadiusKm=params['MIN_SPATIAL_RADIUS_KM'])
+        secondsFused = time.perf_counter() - start
+        assert numberPoints - droppedPoints['speed'] - droppedPoints['loops'] == numberFiltered
+        columns = ['uid', 'datetime', 'lat', 'lng', 'covidStatus', 'restrictionLevel']
+        pd.testing.assert_frame_equal(dfExpected[columns], dfResult[columns], check_dtype=False, check_exact=True)
+        print('{:>10} {:>8} {:>8} {:>12} {:>10.2f} {:>12.2f} {:>10.1f}'.format(
+            numberPoints, droppedPoints['speed'], droppedPoints['loops'], droppedPoints['compression'],
+            secondsSkmob, secondsFused, secondsSkmob / secondsFused))
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# PIPELINE SCALING BENCHMARK
+# Run both stages (transformation of the GLH JSON file and APL processing) on
+# synthetic users of increasing size (see syntheticGLH.py) and record the
+# seconds, throughput (rows in per second) and memory of every stage
+# from the run reports (anlocov/report.py). Each size runs in a new process,
+# so the memory of a size does not include the previous ones.
+# Results are written in a CSV file named after the git commit; --compare
+# prints the time ratio of each stage against the results of another commit.
+# Files of 50M points need about 6 GB of disk in the temporary directory.
+#
+# Run from the project directory:
+#   python benchmark/pipelineScaling.py [points ...] [--trace-memory] [--compare results.csv]
+# =============================================================================
+import concurrent.futures as cf
+import argparse, csv, json, multiprocessing, os, subprocess, sys, tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'code'))
+
+# =============================================================================
+# # CONSTANTS DEFINITION
+# =============================================================================
+# Points of each synthetic user (up to 50M)
+POINTS = [10000, 100000, 1000000]
+
+RESULT_COLUMNS = ['commit', 'points', 'stage', 'seconds', 'rowsIn', 'rowsOut', 'rowsPerSecond', 'rssMb', 'rssDeltaMb',
+                  'tracedPeakMb', 'tracedGrowthMb']
+
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or 'unknown'
+    except OSError:
+        return 'unknown'
+
+
+def run_size(numberPoints, traceMemory, weekExecutor):
+    """
+    Transform and process a synthetic user of numberPoints points. Return
+    the stages of both run reports.
+    """
+    import syntheticGLH
+    from anlocov import processing, report, transformation
+    with tempfile.TemporaryDirectory() as urlTmp:
+        idFile = 'synthetic{}'.format(numberPoints)
+        urlJSON = os.path.join(urlTmp, idFile + '.json')
+        urlCSV = os.path.join(urlTmp, idFile + '.csv')
+        syntheticGLH.write_glh_json(numberPoints, urlJSON)
+        transformReport = report.RunReport(idFile, traceMemory)
+        with transformReport.stage('transform', numberPoints) as record:
+            record['rowsOut'] = transformation.transform_json_file(urlJSON, urlCSV)[0]
+        transformReport.close()
+        os.remove(urlJSON)
+        processing.process_csv_file(urlCSV, urlTmp, checkpoints=False, weekExecutor=weekExecutor, traceMemory=traceMemory)
+        with open(os.path.join(urlTmp, idFile, report.REPORT_FILE)) as reportFile:
+            stages = json.load(reportFile)['stages']
+    return transformReport.stages + stages
+
+
+def run_benchmark(points, traceMemory=False, weekExecutor='process'):
+    commit = get_commit()
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for numberPoints in points:
+        # The week pool of the processing stage starts inside this worker
+        with cf.ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            stages = pool.submit(run_size, numberPoints, traceMemory, weekExecutor).result()
+        for record in stages:
+            rowsPerSecond = record['rowsIn'] / record['seconds'] if record['rowsIn'] and record['seconds'] else None
+            results.append({'commit': commit, 'points': numberPoints, 'stage': record['stage'],
+                            'seconds': record['seconds'], 'rowsIn': record['rowsIn'], 'rowsOut': record['rowsOut'],
+                            'rowsPerSecond': None if rowsPerSecond is None else round(rowsPerSecond),
+                            'rssMb': record['rssMb'], 'rssDeltaMb': record['rssDeltaMb'],
+                            'tracedPeakMb': record['tracedPeakMb'], 'tracedGrowthMb': record['tracedGrowthMb']})
+    return commit, results
+
+
+def _blank(value):
+    return '' if value is None else value
+
+
+def read_results(urlFile):
+    with open(urlFile, newline='') as resultFile:
+        return {(int(row['points']), row['stage']): row for row in csv.DictReader(resultFile)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time and memory of each stage on synthetic users')
+    parser.add_argument('points', nargs='*', type=int, default=POINTS, help='points of each synthetic user')
+    parser.add_argument('--trace-memory', action='store_true', help='measure the memory of each stage with tracemalloc')
+    parser.add_argument('--week-executor', choices=('process', 'serial'), default='process')
+    parser.add_argument('--output', help='results CSV file (default: pipelineScaling-<commit>.csv)')
+    parser.add_argument('--compare', help='results CSV file of another commit')
+    args = parser.parse_args()
+    commit, results = run_benchmark(args.points, args.trace_memory, args.week_executor)
+    urlOutput = args.output or 'pipelineScaling-{}.csv'.format(commit)
+    with open(urlOutput, 'w', newline='') as resultFile:
+        writer = csv.DictWriter(resultFile, fieldnames=RESULT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(results)
+    baseline = read_results(args.compare) if args.compare else {}
+    print('{:>10} {:>16} {:>10} {:>12} {:>10} {:>10} {:>10} {:>8}'.format('points', 'stage', 'seconds', 'rows/s',
+                                                                           'RSS MB', 'RSS +MB', 'traced +MB', 'ratio'))
+    for result in results:
+        base = baseline.get((result['points'], result['stage']))
+        ratio = float(result['seconds']) / float(base['seconds']) if base and float(base['seconds']) > 0 else None
+        print('{:>10} {:>16} {:>10.3f} {:>12} {:>10} {:>10} {:>10} {:>8}'.format(
+            result['points'], result['stage'], result['seconds'], result['rowsPerSecond'] or '', _blank(result['rssMb']),
+            _blank(result['rssDeltaMb']), _blank(result['tracedGrowthMb']), '' if ratio is None else '{:.2f}'.format(ratio)))
+    print('Results: {}'.format(urlOutput))
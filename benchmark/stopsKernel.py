@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# STOPS KERNEL BENCHMARK
+# Time anlocov.stops.detect_trip_stops against the former loop that called
+# skmob.preprocessing.detection.stops on each trip. Both give the same APL
+# (stops with median coordinates plus the destination point of each trip):
+# code/tests/test_stops.py checks it on the same synthetic trips.
+#
+# Run from the project directory: python benchmark/stopsKernel.py [trips ...]
+# =============================================================================
+import os, sys, time
+
+import numpy as np
+import pandas as pd
+import skmob as skm
+from skmob.preprocessing import detection as skm_detection
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'code'))
+from anlocov import parameters, stops
+
+# =============================================================================
+# # CONSTANTS DEFINITION
+# =============================================================================
+# Number of trips of each synthetic participant
+TRIPS = [100, 1000]
+
+# Points of each trip and reference place (Quito)
+POINTS_TRIP = 60
+HOME_LAT = -0.180653
+HOME_LON = -78.467834
+
+def synthetic_trips(numberTrips, seed=0):
+    """
+    Return trips in the layout of dfTrajTrips (indexed by time t). Each trip
+    alternates dwells and random walk moves with 1 to 3 minutes between points.
+    """
+    rng = np.random.default_rng(seed)
+    n = numberTrips * POINTS_TRIP
+    minutes = rng.integers(1, 4, n).cumsum() + np.repeat(np.arange(numberTrips) * 600, POINTS_TRIP)
+    moving = rng.random(n) < 0.4
+    steps = np.where(moving, rng.normal(0, 0.004, n), rng.normal(0, 0.00005, n))
+    lat = HOME_LAT + np.cumsum(steps)
+    lng = HOME_LON + np.cumsum(np.where(moving, rng.normal(0, 0.004, n), rng.normal(0, 0.00005, n)))
+    t = pd.Timestamp('2020-01-01') + pd.to_timedelta(minutes, unit='min')
+    dfTrips = pd.DataFrame({'uid': 'synthetic', 'timestamp': t, 'lat': lat, 'lng': lng,
+                            'covidStatus': 0, 'restrictionLevel': 0}, index=pd.DatetimeIndex(t, name='t'))
+    dfTrips['idWeek'] = dfTrips.index.to_period('W')
+    dfTrips['numWeek'] = dfTrips['idWeek'].rank(method='dense').astype(int) - 1
+    dfTrips['idTrip'] = np.repeat(np.arange(numberTrips), POINTS_TRIP)
+    dfTrips['idTrip'] = dfTrips['idTrip'] - dfTrips.groupby('numWeek')['idTrip'].transform('min')
+    return dfTrips
+
+
+def skmob_trip_stops(dfTrajTrips, params):
+    # Former loop: one TrajDataFrame and one call to scikit-mobility per trip
+    stopChunks = []
+    for numWeek in dfTrajTrips.idWeek.unique():
+        dfTrajTripsWeek = dfTrajTrips[dfTrajTrips['idWeek'] == numWeek]
+        for numTrip in dfTrajTripsWeek.idTrip.unique():
+            dfTrajTripsTmp = dfTrajTripsWeek[dfTrajTripsWeek['idTrip'] == numTrip]
+            destinationTripPoint = dfTrajTripsTmp.reset_index().iloc[-1:].drop(['t'], axis=1)
+            destinationTripPoint = destinationTripPoint.rename(columns = {'timestamp': 'datetime'})
+            dfTrajTripsTmp = skm.TrajDataFrame(dfTrajTripsTmp, latitude='lat', longitude='lng', datetime='timestamp', user_id='uid')
+            dfTrajTripsTmp = skm_detection.stops(dfTrajTripsTmp, minutes_for_a_stop=params['MIN_MINUTES_FOR_A_STOP'],
+                                                 spatial_radius_km=stops.stop_radius_km(params), leaving_time=False)
+            stopChunks.append(pd.concat([pd.DataFrame(dfTrajTripsTmp), destinationTripPoint]))
+    return pd.concat(stopChunks, ignore_index=True)
+
+
+if __name__ == '__main__':
+    params = parameters.get_parameters()
+    trips = [int(numberTrips) for numberTrips in sys.argv[1:]] or TRIPS
+    # Compile the kernel (numba) before measuring
+    stops.detect_trip_stops(synthetic_trips(2), minutesForAStop=params['MIN_MINUTES_FOR_A_STOP'],
+                            stopRadiusKm=stops.stop_radius_km(params))
+    print('{:>8} {:>8} {:>12} {:>12} {:>10}'.format('trips', 'APL', 'skmob (s)', 'kernel (s)', 'speed-up'))
+    for numberTrips in trips:
+        dfTrajTrips = synthetic_trips(numberTrips)
+        start = time.perf_counter()
+        dfExpected = skmob_trip_stops(dfTrajTrips, params)
+        secondsSkmob = time.perf_counter() - start
+        start = time.perf_counter()
+        dfResult = stops.detect_trip_stops(dfTrajTrips, minutesForAStop=params['MIN_MINUTES_FOR_A_STOP'],
+                                           stopRadiusKm=stops.stop_radius_km(params))
+        secondsKernel = time.perf_counter() - start
+        print('{:>8} {:>8} {:>12.3f} {:>12.3f} {:>10.1f}'.format(numberTrips, len(dfResult), secondsSkmob, secondsKernel,
+                                                                   secondsSkmob / secondsKernel))
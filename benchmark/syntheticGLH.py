@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# SYNTHETIC GOOGLE LOCATION HISTORY
+# Generate realistic GLH data of one user inside the data zone of
+# anlocov/parameters.py (Ecuador): the user sleeps at home, commutes to work
+# on weekdays, sometimes runs an errand in the evening and moves around the
+# city on weekends. Points are recorded about once a minute with GPS noise,
+# phone off periods (time gaps that split trips) and speed outliers (points
+# tens of km away that the speed filter deletes).
+# Points are generated day by day in chunks, so files of 50M points are
+# written without holding them in memory.
+#
+# Run from the project directory:
+#   python benchmark/syntheticGLH.py <points> <file.json> [seed]
+# =============================================================================
+import os, sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'code'))
+from anlocov import parameters
+
+# =============================================================================
+# # CONSTANTS DEFINITION
+# =============================================================================
+# First day of the synthetic history (before COVID_DATE, so every COVID
+# restriction level is covered by long histories)
+WINDOW_START = '2019-06-01'
+
+# Cities of the user (latitude, longitude): Quito, Guayaquil and Cuenca
+CITIES = [(-0.180653, -78.467834), (-2.170998, -79.922359), (-2.900128, -79.005896)]
+
+# Distance (degrees) of home, work and errand places from the city center
+CITY_RADIUS_DEG = 0.08 #~9 km
+
+# Seconds between points and their random variation
+INTERVAL_SECONDS = 60
+INTERVAL_JITTER_SECONDS = 15
+
+# GPS noise (degrees, ~10 m)
+GPS_NOISE_DEG = 0.0001
+
+# Probability of a phone off period in a day and its length (minutes)
+GAP_PROBABILITY = 0.5
+GAP_MINUTES = (40, 300)
+
+# Probability of a speed outlier and its distance (degrees, ~20-60 km)
+OUTLIER_PROBABILITY = 0.001
+OUTLIER_DEG = (0.2, 0.5)
+
+# Probability of an evening errand on weekdays
+ERRAND_PROBABILITY = 0.4
+
+# Days generated in each chunk
+CHUNK_DAYS = 30
+
+MINUTES_DAY = 24 * 60
+
+
+class SyntheticUser:
+    """
+    Home, work and errand places of a synthetic user
+    """
+
+    def __init__(self, seed=0):
+        self.rng = np.random.default_rng(seed)
+        cityLat, cityLon = CITIES[seed % len(CITIES)]
+        self.home = self._place(cityLat, cityLon)
+        self.work = self._place(cityLat, cityLon)
+        self.errands = [self._place(cityLat, cityLon) for _ in range(5)]
+
+    def _place(self, cityLat, cityLon):
+        params = parameters.get_parameters()
+        lat = np.clip(cityLat + self.rng.uniform(-CITY_RADIUS_DEG, CITY_RADIUS_DEG), params['LOW_LAT'], params['TOP_LAT'])
+        lon = np.clip(cityLon + self.rng.uniform(-CITY_RADIUS_DEG, CITY_RADIUS_DEG), params['LEFT_LON'], params['RIGHT_LON'])
+        return lat, lon
+
+    def _day_knots(self, weekday):
+        # Minutes of the day and places where the user starts and ends each move
+        rng = self.rng
+        knots = [(0, self.home)]
+        if weekday < 5:
+            leave = rng.normal(7.5 * 60, 20)
+            arrive = leave + rng.uniform(20, 60)
+            leaveWork = rng.normal(17.5 * 60, 30)
+            arriveHome = leaveWork + rng.uniform(20, 60)
+            knots += [(leave, self.home), (arrive, self.work), (leaveWork, self.work), (arriveHome, self.home)]
+            if rng.random() < ERRAND_PROBABILITY:
+                errand = self.errands[rng.integers(len(self.errands))]
+                start = arriveHome + rng.uniform(30, 90)
+                knots += [(start, self.home), (start + 20, errand), (start + 20 + rng.uniform(10, 60), errand)]
+                knots += [(knots[-1][0] + 20, self.home)]
+        else:
+            t = rng.normal(10 * 60, 60)
+            for _ in range(rng.integers(0, 4)):
+                errand = self.errands[rng.integers(len(self.errands))]
+                previous = knots[-1][1]
+                knots += [(t, previous), (t + 25, errand)]
+                t += 25 + rng.uniform(20, 120)
+            knots += [(t, knots[-1][1]), (t + 25, self.home)]
+        knots += [(MINUTES_DAY, self.home)]
+        minutes = np.minimum(np.maximum.accumulate([knot[0] for knot in knots]), MINUTES_DAY)
+        return minutes, np.array([knot[1][0] for knot in knots]), np.array([knot[1][1] for knot in knots])
+
+    def day_points(self, day):
+        """
+        Return the timestamps (ms), latitudes and longitudes of one day
+        """
+        rng = self.rng
+        numberPoints = int(MINUTES_DAY * 60 / INTERVAL_SECONDS)
+        seconds = np.arange(numberPoints) * INTERVAL_SECONDS + rng.integers(0, INTERVAL_JITTER_SECONDS, numberPoints)
+        minutes = seconds / 60.
+        if rng.random() < GAP_PROBABILITY:
+            gapStart = rng.uniform(0, MINUTES_DAY)
+            keep = (minutes < gapStart) | (minutes > gapStart + rng.uniform(*GAP_MINUTES))
+            seconds, minutes = seconds[keep], minutes[keep]
+        knotMinutes, knotLat, knotLon = self._day_knots(day.weekday())
+        lat = np.interp(minutes, knotMinutes, knotLat) + rng.normal(0, GPS_NOISE_DEG, len(minutes))
+        lon = np.interp(minutes, knotMinutes, knotLon) + rng.normal(0, GPS_NOISE_DEG, len(minutes))
+        outlier = rng.random(len(minutes)) < OUTLIER_PROBABILITY
+        numberOutliers = int(outlier.sum())
+        if numberOutliers:
+            lat[outlier] += rng.choice([-1., 1.], numberOutliers) * rng.uniform(*OUTLIER_DEG, numberOutliers)
+            lon[outlier] += rng.choice([-1., 1.], numberOutliers) * rng.uniform(*OUTLIER_DEG, numberOutliers)
+        timestampMs = day.value // 10**6 + seconds.astype(np.int64) * 1000
+        return timestampMs, lat, lon
+
+
+def iter_synthetic_chunks(numberPoints, seed=0, start=WINDOW_START):
+    """
+    Yield chunks of GLH columns (int64 timestampMs, int32 latitudeE7 and
+    longitudeE7, as anlocov.transformation.iter_location_chunks) with
+    numberPoints points in total
+    """
+    user = SyntheticUser(seed)
+    day = pd.Timestamp(start)
+    remaining = numberPoints
+    while remaining > 0:
+        timestampMs, lat, lon = [], [], []
+        for _ in range(CHUNK_DAYS):
+            dayTimestampMs, dayLat, dayLon = user.day_points(day)
+            timestampMs.append(dayTimestampMs)
+            lat.append(dayLat)
+            lon.append(dayLon)
+            day += pd.Timedelta(days=1)
+        timestampMs = np.concatenate(timestampMs)[:remaining]
+        remaining -= len(timestampMs)
+        yield {'timestampMs': timestampMs,
+               'latitudeE7': np.round(np.concatenate(lat)[:len(timestampMs)] * 1e7).astype(np.int32),
+               'longitudeE7': np.round(np.concatenate(lon)[:len(timestampMs)] * 1e7).astype(np.int32)}
+
+
+def synthetic_glh(numberPoints, seed=0):
+    """
+    Return a DataFrame with the columns datetime, latitude and longitude of
+    the transformed file (input of anlocov.processing.compute_apl)
+    """
+    from anlocov import transformation
+    return pd.concat([transformation.chunk_to_dataframe(chunk) for chunk in iter_synthetic_chunks(numberPoints, seed)],
+                     ignore_index=True)
+
+
+def write_glh_json(numberPoints, urlFile, seed=0):
+    """
+    Write a GLH JSON file (Google Takeout layout) with numberPoints locations
+    """
+    rng = np.random.default_rng(seed)
+    with open(urlFile, 'w') as jsonFile:
+        jsonFile.write('{\n  "locations" : [')
+        separator = ' '
+        for chunk in iter_synthetic_chunks(numberPoints, seed):
+            accuracy = rng.integers(3, 30, len(chunk['timestampMs']))
+            lines = ['{}{{\n    "timestampMs" : "{}",\n    "latitudeE7" : {},\n    "longitudeE7" : {},\n    "accuracy" : {}\n  }}'
+                     .format(separator if i == 0 else ', ', timestampMs, latitudeE7, longitudeE7, pointAccuracy)
+                     for i, (timestampMs, latitudeE7, longitudeE7, pointAccuracy)
+                     in enumerate(zip(chunk['timestampMs'].tolist(), chunk['latitudeE7'].tolist(),
+                                      chunk['longitudeE7'].tolist(), accuracy.tolist()))]
+            jsonFile.write(''.join(lines))
+            separator = ', '
+        jsonFile.write(' ]\n}\n')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        sys.exit('Use: python benchmark/syntheticGLH.py <points> <file.json> [seed]')
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+    write_glh_json(int(sys.argv[1]), sys.argv[2], seed)
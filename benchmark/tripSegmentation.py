@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# TRIP SEGMENTATION BENCHMARK
+# Compare anlocov.trips.week_trips with the former movingpandas path
+# (TrajectoryCollection with min_length and ObservationGapSplitter over a
+# GeoDataFrame) on synthetic weeks with many short trips, whose lengths are
+# close to the 100 m and 200 m thresholds. Both must give the same trips; the
+# time of both paths is reported.
+#
+# Run from the project directory: python benchmark/tripSegmentation.py [weeks ...]
+# =============================================================================
+import datetime as dt
+import os, sys, time
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import movingpandas as mpd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'code'))
+from anlocov import parameters, trips
+
+# =============================================================================
+# # CONSTANTS DEFINITION
+# =============================================================================
+# Number of weeks of each synthetic participant
+WEEKS = [10, 50]
+
+# Points of each week and reference place (Quito)
+POINTS_WEEK = 2000
+HOME_LAT = -0.180653
+HOME_LON = -78.467834
+
+TRIP_COLUMNS = ['uid', 'timestamp', 'lat', 'lng', 'idWeek', 'numWeek', 'idTrip']
+
+
+def synthetic_weeks(numberWeeks, seed=0):
+    """
+    Return points (indexed by time t, columns uid, timestamp, lat, lng,
+    covidStatus, restrictionLevel and idWeek) with 1 to 5 minutes between
+    points, gaps of more than 30 minutes and steps of about 0 to 20 m.
+    """
+    rng = np.random.default_rng(seed)
+    n = numberWeeks * POINTS_WEEK
+    minutes = np.where(rng.random(n) < 0.08, rng.integers(31, 240, n), rng.integers(1, 6, n)).cumsum()
+    lat = HOME_LAT + np.cumsum(rng.normal(0, 0.00008, n))
+    lng = HOME_LON + np.cumsum(rng.normal(0, 0.00008, n))
+    t = pd.Timestamp('2020-01-06') + pd.to_timedelta(minutes, unit='min')
+    dfPoints = pd.DataFrame({'uid': 'synthetic', 'timestamp': t, 'lat': lat, 'lng': lng, 'covidStatus': 0,
+                             'restrictionLevel': 0}, index=pd.DatetimeIndex(t, name='t'))
+    dfPoints['idWeek'] = dfPoints.index.to_period('W')
+    return dfPoints
+
+
+def movingpandas_week_trips(dfWeek, params):
+    # Former path: GeoDataFrame, weekly trajectory and gap splitter
+    dfWeek = gpd.GeoDataFrame(dfWeek, geometry=gpd.points_from_xy(dfWeek.lng, dfWeek.lat)).set_crs(epsg=4326)
+    dfTrajCollection = mpd.TrajectoryCollection(dfWeek, traj_id_col='idWeek', min_length=params['MIN_LENGTH_TRAJ_MTR'])
+    if len(dfTrajCollection) == 0:
+        return None
+    dfTraj = dfTrajCollection.trajectories[0]
+    dfTraj.df['numWeek'] = 0
+    dfTripsTraj = mpd.ObservationGapSplitter(dfTraj).split(gap=dt.timedelta(minutes=params['MIN_TIME_TRIP_GAP_THRESHOLD_MINUTES']),
+                                                           min_length=params['MIN_LENGTH_TRIP_MTR'])
+    tripChunks = []
+    for j in range(0,len(dfTripsTraj)):
+        dfTripDf = dfTripsTraj.trajectories[j].df
+        dfTripDf['idTrip'] = j
+        tripChunks.append(dfTripDf)
+    return pd.concat(tripChunks) if tripChunks else None
+
+
+def segment(dfPoints, params, weekTrips):
+    tripChunks = []
+    for idWeek, dfWeek in dfPoints.groupby('idWeek', sort=True):
+        dfWeekTrips = weekTrips(dfWeek, params)
+        if dfWeekTrips is not None:
+            tripChunks.append(dfWeekTrips)
+    return pd.concat(tripChunks)[TRIP_COLUMNS]
+
+
+if __name__ == '__main__':
+    params = parameters.get_parameters()
+    weeks = [int(numberWeeks) for numberWeeks in sys.argv[1:]] or WEEKS
+    print('{:>8} {:>8} {:>8} {:>14} {:>12} {:>10}'.format('weeks', 'points', 'trips', 'movingpandas (s)', 'native (s)', 'speed-up'))
+    for numberWeeks in weeks:
+        dfPoints = synthetic_weeks(numberWeeks)
+        start = time.perf_counter()
+        dfExpected = segment(dfPoints, params, movingpandas_week_trips)
+        secondsMovingpandas = time.perf_counter() - start
+        start = time.perf_counter()
+        dfResult = segment(dfPoints, params, lambda dfWeek, params: trips.week_trips(dfWeek, params)[1])
+        secondsNative = time.perf_counter() - start
+        pd.testing.assert_frame_equal(dfExpected, dfResult, check_dtype=False, check_exact=True)
+        numberTrips = len(dfResult[['idWeek', 'idTrip']].drop_duplicates())
+        print('{:>8} {:>8} {:>8} {:>14.2f} {:>12.3f} {:>10.1f}'.format(numberWeeks, len(dfPoints), numberTrips,
+                                                                       secondsMovingpandas, secondsNative,
+                                                                       secondsMovingpandas / secondsNative))
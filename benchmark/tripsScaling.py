@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# TRIPS SCALING BENCHMARK
+# Regression benchmark for the accumulation of trips, stops and summaries in
+# anlocov.processing. Synthetic participants with a growing number of trips
+# over the 2020-2021 window are processed and the time per trip is reported.
+# With linear accumulation the time per trip stays flat when the number of
+# trips grows; with the former DataFrame.append loops it grew with the number
+# of trips.
+#
+# Run from the project directory: python benchmark/tripsScaling.py [trips ...]
+# =============================================================================
+import os, sys, tempfile, time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'code'))
+from anlocov import processing
+
+# =============================================================================
+# # CONSTANTS DEFINITION
+# =============================================================================
+# Number of trips of each synthetic participant
+TRIPS = [500, 1000, 2000, 4000]
+
+# Time window of the synthetic participants
+WINDOW_START = '2020-01-01'
+WINDOW_END = '2021-12-31'
+
+# Reference place (Quito) and size of each trip
+HOME_LAT = -0.180653
+HOME_LON = -78.467834
+DWELL_POINTS = 10 #1 point per minute
+MOVE_POINTS = 10 #1 point per minute, ~330 m between points
+STEP_DEG = 0.003
+
+# Maximum growth of the time per trip accepted between the smallest and the
+# largest participant
+MAX_TIME_PER_TRIP_RATIO = 2.0
+
+
+def synthetic_trips(numberTrips, seed=0):
+    """
+    Return a DataFrame (datetime, latitude, longitude) with numberTrips trips.
+    Each trip dwells at the origin, moves in a straight line and dwells at the
+    destination. Trips are separated by more than 30 minutes.
+    """
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp(WINDOW_START).value
+    spacing = (pd.Timestamp(WINDOW_END).value - start) // numberTrips
+    pointsTrip = 2 * DWELL_POINTS + MOVE_POINTS
+    minute = 60 * 10**9
+    offsets = np.arange(pointsTrip, dtype=np.int64) * minute
+    steps = np.concatenate([np.zeros(DWELL_POINTS), np.arange(1, MOVE_POINTS + 1), np.full(DWELL_POINTS, MOVE_POINTS)]) * STEP_DEG
+    timestamps = (start + np.arange(numberTrips, dtype=np.int64)[:, None] * spacing + offsets[None, :]).ravel()
+    direction = np.where(np.arange(numberTrips) % 2 == 0, 1.0, -1.0)
+    latitude = HOME_LAT + np.where(direction[:, None] > 0, steps[None, :], steps[-1] - steps[None, :])
+    longitude = np.full_like(latitude, HOME_LON)
+    latitude = latitude.ravel() + rng.normal(0, 1e-5, numberTrips * pointsTrip)
+    longitude = longitude.ravel() + rng.normal(0, 1e-5, numberTrips * pointsTrip)
+    return pd.DataFrame({'datetime': pd.to_datetime(timestamps), 'latitude': latitude, 'longitude': longitude})
+
+
+def run_benchmark(trips):
+    results = []
+    with tempfile.TemporaryDirectory() as urlTmp:
+        for numberTrips in trips:
+            urlFile = os.path.join(urlTmp, 'trips{}.csv'.format(numberTrips))
+            synthetic_trips(numberTrips).to_csv(urlFile, header=True, index=False)
+            start = time.perf_counter()
+            processing.process_csv_file(urlFile, urlTmp)
+            seconds = time.perf_counter() - start
+            results.append((numberTrips, seconds, 1000 * seconds / numberTrips))
+    return results
+
+
+if __name__ == '__main__':
+    trips = [int(numberTrips) for numberTrips in sys.argv[1:]] or TRIPS
+    results = run_benchmark(trips)
+    print('{:>8} {:>10} {:>12}'.format('trips', 'seconds', 'ms/trip'))
+    for numberTrips, seconds, msTrip in results:
+        print('{:>8} {:>10.2f} {:>12.2f}'.format(numberTrips, seconds, msTrip))
+    ratio = results[-1][2] / results[0][2]
+    msg = 'Time per trip ratio {:.2f} (max {})'.format(ratio, MAX_TIME_PER_TRIP_RATIO)
+    print(msg)
+    if ratio > MAX_TIME_PER_TRIP_RATIO:
+        sys.exit('Trips accumulation does not scale linearly')
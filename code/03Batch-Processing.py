@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# BATCH PROCESSING SCRIPT
+# Script to transform every GLH JSON file in dataJSON and compute the APL of
+# every participant (JSON files in dataJSON and CSV files in dataTransform)
+# Clone the code from Github
+# git@github.com:GmoncayoCodes/ActivityPointLocationGenerator.git
+#
+# Pre-requisites to run the script:
+#   1. Check or create folders in your python directory: code, dataJSON
+#   2. Copy GLH JSON files in the dataJSON directory (or CSV files in dataTransform)
+#   3. Set the folder code as your working directory
+#   4. Run script
+# Outputs of each participant are stored in dataFinal/<idFile> and the result
+# of each participant in dataFinal/BatchReport.csv
+# =============================================================================
+
+# =============================================================================
+# UTILITY PACKAGE IMPORTS
+# =============================================================================
+import datetime as dt
+import logging, os, platform, sys
+
+# =============================================================================
+# PROJECT PACKAGE IMPORTS
+# =============================================================================
+from anlocov import batch
+
+# =============================================================================
+# # CONSTANTS DEFINITION
+# =============================================================================
+# Number of processes used to compute participants in parallel
+# None uses the number of processors, 1 computes participants one by one
+MAX_WORKERS = None
+
+# Format of the transformed files and outputs: csv, parquet or arrow (parquet
+# and arrow need pyarrow)
+FILE_FORMAT = 'csv'
+
+# Compute the participants with the same parameters together as one cohort
+# (one process, stages grouped by participant) instead of one process per file
+COHORT = False
+
+
+if __name__ == '__main__':
+    try:
+        # Get Working Directory
+        urlWorkingDirectory = os.getcwd()
+        if urlWorkingDirectory.endswith('code') :
+            # Create URL access to project directories
+            urlProjectDirectory = os.path.abspath(os.path.join(urlWorkingDirectory, os.pardir))
+            urlDataJSON = os.path.join(urlProjectDirectory, 'dataJSON')
+            urlDataTransform = os.path.join(urlProjectDirectory, 'dataTransform')
+            urlDataFinal = os.path.join(urlProjectDirectory, 'dataFinal')
+            urlLog = os.path.join(urlProjectDirectory, 'log')
+            for pathDir in [urlDataTransform, urlDataFinal, urlLog]:
+                os.makedirs(pathDir, exist_ok=True)
+            # Define log file
+            now = str(dt.datetime.now()).replace(':', '')[0:17]
+            logFile = 'log-Batch'+ now +'.log'
+            if platform.platform().startswith('Windows'):
+                fichero_log = os.path.join(urlLog,logFile)
+            else:
+                fichero_log = os.path.join(os.getenv('HOME'), logFile)
+            logging.basicConfig(level=logging.DEBUG, format='%(asctime)s : %(process)d : %(levelname)s : %(message)s',
+                                filename = fichero_log, filemode = 'w',)
+            msg = "*** START BATCH STAGE ***"
+            print(msg)
+            logging.debug(msg)
+
+            results = batch.run_batch(urlDataJSON, urlDataTransform, urlDataFinal, maxWorkers=MAX_WORKERS, logFile=fichero_log,
+                                      fileFormat=FILE_FORMAT, cohort=COHORT)
+            if(not results):
+                msg = 'No File to process. Check your dataJSON and dataTransform directories'
+                raise FileNotFoundError(msg)
+            failed = [result for result in results if result['status'] != 'ok']
+            msg = "Batch processed {} participants: {} succeeded, {} failed".format(len(results), len(results) - len(failed), len(failed))
+            print(msg)
+            logging.info(msg)
+            for result in failed:
+                msg = "File {} failed. {}".format(result['idFile'], result['error'])
+                print(msg)
+                logging.error(msg)
+            msg = "Batch report: {}".format(os.path.join(urlDataFinal, batch.REPORT_FILE))
+            print(msg)
+            logging.info(msg)
+
+            msg = "*** END BATCH STAGE ***"
+            print(msg)
+            logging.debug(msg)
+            logging.shutdown()
+        else:
+            msg = "Can't execute Script. Check your Working Directory is code directory!! Your current working directory is {}".format(urlWorkingDirectory)
+            raise RuntimeError(msg)
+    except:
+        msg = '{}: {}'.format(sys.exc_info()[0], sys.exc_info()[1])
+        print(msg)
+        logging.error(msg)
+        logging.shutdown()
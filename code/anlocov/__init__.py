@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# ANLOCOV PACKAGE
+# Compute Activity Point Locations (APL) from Google Location History (GLH)
+#
+#   df = anlocov.transform_glh('dataJSON/test.json')
+#   dfGPSTracking, dfAPL, dfSummary = anlocov.compute_apl(df, anlocov.get_parameters())
+#
+# The functions below are imported from their module the first time they are
+# used, so importing the package does not import pandas, numba or pyarrow.
+# The command line interface is in cli.py (python -m anlocov --help)
+# =============================================================================
+import importlib
+
+# Public function: module where it is defined
+_API = {'transform_glh': 'transformation',
+        'transform_json_file': 'transformation',
+        'merge_exports': 'merge',
+        'compute_apl': 'processing',
+        'anonymise': 'processing',
+        'process_csv_file': 'processing',
+        'transform_semantic_files': 'semantic',
+        'process_semantic_file': 'semantic',
+        'run_batch': 'batch',
+        'get_parameters': 'parameters',
+        'read_table': 'storage',
+        'write_table': 'storage'}
+
+__all__ = sorted(_API)
+
+
+def __getattr__(name):
+    if name in _API:
+        value = getattr(importlib.import_module('anlocov.' + _API[name]), name)
+        globals()[name] = value
+        return value
+    msg = "module 'anlocov' has no attribute '{}'".format(name)
+    raise AttributeError(msg)
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+import sys
+
+from anlocov.cli import main
+
+if __name__ == '__main__':
+    sys.exit(main())
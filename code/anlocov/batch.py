@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# BATCH PROCESSING
+# Run the transformation and the APL computation of every participant (idFile)
+# found in dataJSON and dataTransform across a pool of processes.
+# A failure in one participant does not stop the others; each participant has
+# a row in the batch report dataFinal/BatchReport.csv
+# The optional file dataJSON/participants.csv (column idFile and one column per
+# parameter, e.g. COUNTRY and REGION of the restriction calendar) overrides
+# the parameters of each participant, so cohorts of several countries run in
+# the same batch
+# In cohort mode, JSON files are transformed in the pool and the participants
+# with the same parameters are computed together as one cohort (cohort.py)
+# A directory dataJSON/<idFile> holds several exports (JSON files or Takeout
+# archives) of one participant, merged into one transformed file (merge.py)
+# =============================================================================
+import concurrent.futures as cf
+import csv, json, logging, os, time
+
+from anlocov import parameters, storage
+
+REPORT_FILE = 'BatchReport.csv'
+REPORT_COLUMNS = ['idFile', 'status', 'observations', 'APLs', 'seconds', 'error']
+
+PARTICIPANTS_FILE = 'participants.csv'
+
+
+def find_participants(urlDataJSON, urlDataTransform, fileFormat='csv'):
+    """
+    Return a sorted list of (idFile, urlJSON, urlCSV) with every .json file
+    and participant directory (several exports) in dataJSON and every .csv,
+    .parquet or .arrow file in dataTransform. urlJSON is None when the
+    participant only has a transformed file; otherwise urlCSV is the
+    fileFormat file where the JSON file (or the merge of the exports) is
+    transformed.
+    """
+    participants = {}
+    if os.path.isdir(urlDataTransform):
+        for fileName in sorted(os.listdir(urlDataTransform)):
+            idFile, transformFormat = storage.split_file_name(fileName)
+            if transformFormat is not None and (idFile not in participants or transformFormat == fileFormat):
+                participants[idFile] = (None, os.path.join(urlDataTransform, fileName))
+    if os.path.isdir(urlDataJSON):
+        for fileName in os.listdir(urlDataJSON):
+            if fileName.endswith('.json'):
+                idFile = fileName[0:len(fileName)-5]
+            elif os.path.isdir(os.path.join(urlDataJSON, fileName)):
+                idFile = fileName
+            else:
+                continue
+            participants[idFile] = (os.path.join(urlDataJSON, fileName),
+                                    os.path.join(urlDataTransform, storage.get_file_name(idFile, fileFormat)))
+    return [(idFile,) + participants[idFile] for idFile in sorted(participants)]
+
+
+def _parameter_value(name, value, default, urlFile):
+    # Value of the participants file converted as the constant: numbers are
+    # read as float and kept as int only when they are whole (an int constant
+    # such as MAX_SPEED_KMH can have a fractional value for one participant)
+    if default is None or isinstance(default, str):
+        return value
+    try:
+        number = float(value)
+    except ValueError:
+        msg = 'Wrong value {} of parameter {} in {}: a number is expected'.format(value, name, urlFile)
+        raise RuntimeError(msg)
+    return int(number) if isinstance(default, int) and number.is_integer() else number
+
+
+def read_participant_parameters(urlFile):
+    """
+    Return {idFile: parameters} with the parameters of the participants file
+    (column idFile and one column per parameter of parameters.py). Empty
+    cells keep the value of parameters.py; numbers are int when they are
+    whole and the constant is an int, float otherwise.
+    """
+    defaults = parameters.get_parameters()
+    participantParameters = {}
+    with open(urlFile, newline='') as participantsFile:
+        for row in csv.DictReader(participantsFile):
+            idFile = row.pop('idFile', None)
+            if not idFile:
+                msg = 'No column idFile in {}'.format(urlFile)
+                raise RuntimeError(msg)
+            overrides = {}
+            for name, value in row.items():
+                if value is None or value == '':
+                    continue
+                if name not in defaults:
+                    msg = 'Unknown parameter {} in {}'.format(name, urlFile)
+                    raise RuntimeError(msg)
+                overrides[name] = _parameter_value(name, value, defaults[name], urlFile)
+            participantParameters[idFile] = overrides
+    return participantParameters
+
+
+def _init_worker(logFile):
+    if logFile is not None:
+        logging.basicConfig(level=logging.DEBUG, format='%(asctime)s : %(process)d : %(levelname)s : %(message)s',
+                            filename=logFile, filemode='a')
+
+
+def process_participant(idFile, urlJSON, urlCSV, urlDataFinal, params=None, fileFormat='csv', weekExecutor='serial',
+                        transformOnly=False):
+    """
+    Transform (when urlJSON is given; the exports of a directory are merged)
+    and compute the APL of one participant (only transform with
+    transformOnly), from the place visits of its timeline table when it has
+    one (see semantic.py). Outputs are written in fileFormat and the weeks
+    are computed with weekExecutor ('serial' in the workers of the batch
+    pool). Exceptions are returned in the result instead of being raised.
+    """
+    from anlocov import merge, processing, semantic, transformation
+    result = {'idFile': idFile, 'status': 'ok', 'observations': None, 'APLs': None, 'seconds': None, 'error': ''}
+    start = time.perf_counter()
+    try:
+        if urlJSON is not None:
+            msg = "Processing File: {}".format(os.path.basename(urlJSON))
+            logging.info(msg)
+            if os.path.isdir(urlJSON):
+                result['observations'], _, _ = merge.merge_exports(merge.find_exports(urlJSON), urlCSV)
+            else:
+                result['observations'], _, _ = transformation.transform_json_file(urlJSON, urlCSV)
+        if not transformOnly:
+            msg = 'Processing File: {}'.format(os.path.basename(urlCSV))
+            logging.info(msg)
+            urlTimeline = semantic.get_timeline_file(urlCSV)
+            if os.path.exists(urlTimeline):
+                result['APLs'] = semantic.process_semantic_file(urlTimeline, urlDataFinal, params, fileFormat, urlPoints=urlCSV)
+            else:
+                result['APLs'] = processing.process_csv_file(urlCSV, urlDataFinal, params, fileFormat, weekExecutor=weekExecutor)
+    except Exception as error:
+        result['status'] = 'failed'
+        result['error'] = '{}: {}'.format(type(error).__name__, error)
+        msg = 'File {} failed. {}'.format(idFile, result['error'])
+        logging.error(msg)
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def write_report(results, urlReport):
+    """
+    Write one row per participant in the batch report
+    """
+    with open(urlReport, 'w', newline='') as reportFile:
+        writer = csv.DictWriter(reportFile, fieldnames=REPORT_COLUMNS)
+        writer.writeheader()
+        for result in results:
+            writer.writerow(result)
+
+
+def run_cohorts(participants, participantParams, urlDataFinal, fileFormat='csv'):
+    """
+    Compute the APL of the participants (idFile, urlCSV) with the results
+    of their transformation as cohorts of the participants with the same
+    parameters (participantParams); the run report of each cohort is
+    dataFinal/cohort<n>RunReport.json. Return the results of every
+    participant.
+    """
+    from anlocov import cohort
+    cohorts = {}
+    for idFile, urlCSV, result in participants:
+        key = json.dumps(participantParams[idFile], sort_keys=True, default=str)
+        cohorts.setdefault(key, []).append((idFile, urlCSV, result))
+    results = []
+    for numberCohort, cohortParticipants in enumerate(cohorts.values()):
+        idFile = cohortParticipants[0][0]
+        start = time.perf_counter()
+        try:
+            cohortResults = cohort.process_cohort([(idFile, urlCSV) for idFile, urlCSV, _ in cohortParticipants], urlDataFinal,
+                                                  participantParams[idFile], fileFormat,
+                                                  idCohort='cohort{}'.format(numberCohort))
+        except Exception as error:
+            cohortResults = {idFile: (None, '{}: {}'.format(type(error).__name__, error))
+                             for idFile, _, _ in cohortParticipants}
+        seconds = round(time.perf_counter() - start, 3)
+        for idFile, _, result in cohortParticipants:
+            result['APLs'], error = cohortResults[idFile]
+            result['seconds'] = round((result['seconds'] or 0) + seconds, 3)
+            if error is not None:
+                result['status'] = 'failed'
+                result['error'] = error
+                msg = 'File {} failed. {}'.format(idFile, error)
+                logging.error(msg)
+            results.append(result)
+    return results
+
+
+def run_batch(urlDataJSON, urlDataTransform, urlDataFinal, maxWorkers=None, logFile=None, params=None, fileFormat='csv',
+              cohort=False):
+    """
+    Process every participant with a pool of maxWorkers processes (None uses
+    the number of processors, 1 runs in the current process, where the weeks
+    of each participant are computed in a pool of processes). Transformed
+    files and outputs are written in fileFormat (csv, parquet or arrow).
+    The parameters of dataJSON/participants.csv replace params for each
+    participant. With cohort, the pool only transforms the JSON files and
+    the participants are computed as cohorts (see run_cohorts); the seconds
+    of a participant include the time of its whole cohort. Return the list
+    of results sorted by idFile.
+    """
+    participants = find_participants(urlDataJSON, urlDataTransform, fileFormat)
+    if params is None:
+        params = parameters.get_parameters()
+    urlParticipants = os.path.join(urlDataJSON, PARTICIPANTS_FILE)
+    participantParameters = read_participant_parameters(urlParticipants) if os.path.exists(urlParticipants) else {}
+    participantParams = {idFile: dict(params, **participantParameters.get(idFile, {})) for idFile, _, _ in participants}
+    results = []
+    if maxWorkers == 1:
+        for idFile, urlJSON, urlCSV in participants:
+            result = process_participant(idFile, urlJSON, urlCSV, urlDataFinal, participantParams[idFile], fileFormat, 'process',
+                                         cohort)
+            msg = 'File {} {}'.format(idFile, result['status'])
+            print(msg)
+            logging.info(msg)
+            results.append(result)
+    else:
+        with cf.ProcessPoolExecutor(max_workers=maxWorkers, initializer=_init_worker, initargs=(logFile,)) as executor:
+            futures = {executor.submit(process_participant, idFile, urlJSON, urlCSV, urlDataFinal, participantParams[idFile],
+                                       fileFormat, 'serial', cohort): idFile
+                       for idFile, urlJSON, urlCSV in participants}
+            for future in cf.as_completed(futures):
+                idFile = futures[future]
+                try:
+                    result = future.result()
+                except Exception as error:
+                    # The worker process died (e.g. out of memory)
+                    result = {'idFile': idFile, 'status': 'failed', 'observations': None, 'APLs': None,
+                              'seconds': None, 'error': '{}: {}'.format(type(error).__name__, error)}
+                msg = 'File {} {}'.format(idFile, result['status'])
+                print(msg)
+                logging.info(msg)
+                results.append(result)
+    if cohort:
+        urlCSVs = {idFile: urlCSV for idFile, _, urlCSV in participants}
+        transformed = [(result['idFile'], urlCSVs[result['idFile']], result) for result in results if result['status'] == 'ok']
+        results = [result for result in results if result['status'] != 'ok'] + run_cohorts(transformed, participantParams,
+                                                                                          urlDataFinal, fileFormat)
+    results.sort(key=lambda result: result['idFile'])
+    os.makedirs(urlDataFinal, exist_ok=True)
+    write_report(results, os.path.join(urlDataFinal, REPORT_FILE))
+    return results
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# WEEK CHECKPOINTS
+# Trips and stops of each week (idWeek) are stored in the participant
+# directory dataFinal/<idFile>/checkpoints. Each checkpoint is identified by a
+# content hash of the points of the week and of the constants used to compute
+# trips and stops, so a new export of the same participant only recomputes
+# the weeks whose points or constants changed. Clustering and anonymisation
+# are global and are computed again from the stops of every week.
+# =============================================================================
+import hashlib, json, os
+
+import numpy as np
+import pandas as pd
+
+from anlocov import trips
+
+# =============================================================================
+# # CONSTANTS DEFINITION
+# =============================================================================
+CHECKPOINT_DIRECTORY = 'checkpoints'
+
+# Change when the content of the checkpoints changes
+CHECKPOINT_VERSION = 4
+
+# Constants used to compute the trips and stops of a week. The constants of
+# the previous stages (zone, COVID calendar, filter and compression) change
+# the points of the week and therefore its hash
+WEEK_PARAMETERS = ('MIN_LENGTH_TRAJ_MTR', 'MIN_TIME_TRIP_GAP_THRESHOLD_MINUTES', 'MIN_LENGTH_TRIP_MTR',
+                   'MIN_MINUTES_FOR_A_STOP', 'MIN_STOP_RADIUS_FACTOR', 'MIN_SPATIAL_RADIUS_KM_STOP')
+
+# Columns of the points of a week included in the hash
+HASH_COLUMNS = ['lat', 'lng', 'covidStatus', 'restrictionLevel']
+
+
+def get_checkpoint_directory(urlParticipant):
+    """
+    Return (and create) the checkpoint directory of a participant
+    """
+    urlCheckpoints = os.path.join(urlParticipant, CHECKPOINT_DIRECTORY)
+    os.makedirs(urlCheckpoints, exist_ok=True)
+    return urlCheckpoints
+
+
+def week_hash(dfWeek, params):
+    """
+    Content hash of the points of a week (indexed by time with columns uid,
+    lat, lng, covidStatus, restrictionLevel and optionally region) and of
+    WEEK_PARAMETERS
+    """
+    digest = hashlib.sha256()
+    weekParams = {name: params[name] for name in WEEK_PARAMETERS}
+    digest.update(json.dumps([CHECKPOINT_VERSION, weekParams], sort_keys=True, default=str).encode())
+    digest.update(json.dumps(sorted(map(str, dfWeek['uid'].unique()))).encode())
+    if 'region' in dfWeek.columns:
+        digest.update(json.dumps(list(map(str, dfWeek['region']))).encode())
+    digest.update(np.ascontiguousarray(dfWeek.index.to_numpy().astype('datetime64[ns]').astype(np.int64)).tobytes())
+    for column in HASH_COLUMNS:
+        digest.update(np.ascontiguousarray(dfWeek[column].to_numpy(dtype=np.float64)).tobytes())
+    return digest.hexdigest()
+
+
+def get_week_file(idWeek, weekHash):
+    """
+    Return the checkpoint file name of a week: first day of the week and hash
+    """
+    return '{}_{}.pkl'.format(trips.week_start(idWeek), weekHash[:32])
+
+
+def load_week(urlCheckpoints, idWeek, weekHash):
+    """
+    Return the checkpoint of a week (dict with hasTrajectory, trips and stops)
+    or None when the week has no checkpoint with this hash
+    """
+    urlWeek = os.path.join(urlCheckpoints, get_week_file(idWeek, weekHash))
+    if not os.path.exists(urlWeek):
+        return None
+    weekCheckpoint = pd.read_pickle(urlWeek)
+    if weekCheckpoint.get('hash') != weekHash:
+        return None
+    return weekCheckpoint
+
+
+def save_week(urlCheckpoints, idWeek, weekHash, hasTrajectory, dfWeekTrips, dfWeekStops):
+    """
+    Store the trips and stops of a week. dfWeekTrips and dfWeekStops are None
+    when the week has no trips.
+    """
+    weekCheckpoint = {'hash': weekHash, 'hasTrajectory': hasTrajectory, 'trips': dfWeekTrips, 'stops': dfWeekStops}
+    urlWeek = os.path.join(urlCheckpoints, get_week_file(idWeek, weekHash))
+    pd.to_pickle(weekCheckpoint, urlWeek + '.tmp')
+    os.replace(urlWeek + '.tmp', urlWeek)
+
+
+def remove_stale_weeks(urlCheckpoints, weekFiles):
+    """
+    Delete the checkpoints that are not in weekFiles (weeks that changed or
+    are no longer in the data). Return the number of files deleted.
+    """
+    numberDeleted = 0
+    for fileName in os.listdir(urlCheckpoints):
+        if fileName.endswith('.pkl') and fileName not in weekFiles:
+            os.remove(os.path.join(urlCheckpoints, fileName))
+            numberDeleted += 1
+    return numberDeleted
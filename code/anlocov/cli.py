@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# COMMAND LINE INTERFACE
+#   python -m anlocov transform <file.json> [--output <file>]
+#   python -m anlocov merge <exports> --output <file>
+#   python -m anlocov process <file> [--output <dataFinal>]
+#   python -m anlocov semantic <Semantic Location History> [--points <file>]
+#   python -m anlocov batch <project directory>
+#   python -m anlocov serve <project directory> [--port <port>]
+# Each command imports the modules of its stage when it runs, so --help and
+# short commands do not pay the import of the processing stage.
+# =============================================================================
+import argparse, logging, os, sys
+
+FILE_FORMATS = ('csv', 'parquet', 'arrow')
+WEEK_EXECUTORS = ('process', 'serial')
+COMPRESSIONS = ('gzip', 'zstd')
+
+
+def _transform(args):
+    from anlocov import storage, transformation
+    idFile = os.path.splitext(os.path.basename(args.file))[0]
+    urlSaveFile = args.output or os.path.join(os.path.dirname(os.path.abspath(args.file)),
+                                              storage.get_file_name(idFile, args.format))
+    numberObservations, startDate, endDate = transformation.transform_json_file(args.file, urlSaveFile)
+    msg = "File output: {}. Number observations: {}. Data between {} and {}".format(urlSaveFile, numberObservations,
+                                                                                    startDate, endDate)
+    print(msg)
+    logging.info(msg)
+    return 0
+
+
+def _merge(args):
+    from anlocov import merge
+    numberObservations, startDate, endDate = merge.merge_exports(args.files, args.output)
+    msg = "File output: {}. Number observations: {}. Data between {} and {}".format(args.output, numberObservations,
+                                                                                    startDate, endDate)
+    print(msg)
+    logging.info(msg)
+    return 0
+
+
+def _process(args):
+    from anlocov import parameters, processing
+    urlDataFinal = args.output or os.path.dirname(os.path.abspath(args.file))
+    params = None
+    if args.study_area:
+        params = parameters.get_parameters(STUDY_AREA=args.study_area, REGION_PROPERTY=args.region_property)
+    processing.process_csv_file(args.file, urlDataFinal, params, outputFormat=args.format, checkpoints=args.checkpoints,
+                                weekExecutor=args.week_executor, weekWorkers=args.workers, traceMemory=args.trace_memory,
+                                partitionRows=args.partition_rows, compression=args.compression)
+    return 0
+
+
+def _semantic(args):
+    from anlocov import semantic, storage
+    urlFiles = []
+    for urlFile in args.files:
+        if os.path.isdir(urlFile):
+            urlFiles.extend(sorted(os.path.join(urlDirectory, fileName) for urlDirectory, _, fileNames in os.walk(urlFile)
+                                   for fileName in fileNames if fileName.endswith('.json')))
+        else:
+            urlFiles.append(urlFile)
+    if not urlFiles:
+        msg = 'No Semantic Location History JSON file'
+        raise FileNotFoundError(msg)
+    if args.points:
+        urlTimeline = semantic.get_timeline_file(args.points)
+    elif args.id:
+        urlTimeline = os.path.join(args.output or '.', semantic.SEMANTIC_DIRECTORY, storage.get_file_name(args.id, args.format))
+    else:
+        msg = 'Use --id or --points to give the participant'
+        raise RuntimeError(msg)
+    numberVisits, numberActivities = semantic.transform_semantic_files(urlFiles, urlTimeline)
+    msg = "File output: {}. Place visits: {}. Activity segments: {}".format(urlTimeline, numberVisits, numberActivities)
+    print(msg)
+    logging.info(msg)
+    urlDataFinal = args.output or (os.path.dirname(os.path.abspath(args.points)) if args.points else '.')
+    semantic.process_semantic_file(urlTimeline, urlDataFinal, outputFormat=args.format, urlPoints=args.points,
+                                   compression=args.compression)
+    return 0
+
+
+def _batch(args):
+    from anlocov import batch
+    urlDataJSON = os.path.join(args.project, 'dataJSON')
+    urlDataTransform = os.path.join(args.project, 'dataTransform')
+    urlDataFinal = os.path.join(args.project, 'dataFinal')
+    os.makedirs(urlDataTransform, exist_ok=True)
+    results = batch.run_batch(urlDataJSON, urlDataTransform, urlDataFinal, maxWorkers=args.workers, logFile=args.log,
+                              fileFormat=args.format, cohort=args.cohort)
+    if not results:
+        msg = 'No File to process. Check your dataJSON and dataTransform directories'
+        raise FileNotFoundError(msg)
+    failed = [result for result in results if result['status'] != 'ok']
+    msg = "Batch processed {} participants: {} succeeded, {} failed".format(len(results), len(results) - len(failed),
+                                                                             len(failed))
+    print(msg)
+    logging.info(msg)
+    return 1 if failed else 0
+
+
+def _serve(args):
+    import asyncio
+    from anlocov import service
+    try:
+        asyncio.run(service.serve(args.project, args.host, args.port, args.format, args.workers, args.max_pending))
+    except KeyboardInterrupt:
+        msg = 'Ingestion service stopped'
+        print(msg)
+        logging.info(msg)
+    return 0
+
+
+def get_parser():
+    """
+    Return the argument parser of the command line interface
+    """
+    parser = argparse.ArgumentParser(prog='anlocov', description='Compute Activity Point Locations (APL) from '
+                                                                 'Google Location History (GLH)')
+    parser.add_argument('--log', help='log file (default: no log file)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    transform = commands.add_parser('transform', help='transform a GLH JSON file')
+    transform.add_argument('file', help='GLH JSON file')
+    transform.add_argument('--output', help='transformed file (default: <file> with the extension of --format)')
+    transform.add_argument('--format', choices=FILE_FORMATS, default='csv', help='format of the transformed file')
+    transform.set_defaults(run=_transform)
+
+    mergeCommand = commands.add_parser('merge', help='merge several GLH exports of one participant into one transformed file')
+    mergeCommand.add_argument('files', nargs='+', help='GLH JSON files or Takeout archives (zip), in any order')
+    mergeCommand.add_argument('--output', required=True, help='transformed file (CSV, Parquet or Arrow by its extension)')
+    mergeCommand.set_defaults(run=_merge)
+
+    process = commands.add_parser('process', help='compute the APL of a transformed file')
+    process.add_argument('file', help='CSV, Parquet or Arrow file with columns datetime, latitude and longitude')
+    process.add_argument('--output', help='dataFinal directory (default: directory of file)')
+    process.add_argument('--format', choices=FILE_FORMATS, default='csv', help='format of the outputs')
+    process.add_argument('--compression', choices=COMPRESSIONS, help='compression of the outputs (default: none)')
+    process.add_argument('--no-checkpoints', dest='checkpoints', action='store_false', help='do not use week checkpoints')
+    process.add_argument('--week-executor', choices=WEEK_EXECUTORS, default='process', help='executor of the weeks')
+    process.add_argument('--workers', type=int, help='processes of the week pool (default: number of processors)')
+    process.add_argument('--trace-memory', action='store_true', help='measure the memory of each stage with tracemalloc (slower)')
+    process.add_argument('--partition-rows', type=int, help='process the file in time-ordered partitions of this number of '
+                                                            'rows, for files larger than the memory (default: whole file)')
+    process.add_argument('--study-area', help='GeoJSON file or shapefile with the polygons of the study area '
+                                              '(default: rectangle of parameters.py)')
+    process.add_argument('--region-property', help='feature property with the region of the study area polygons')
+    process.set_defaults(run=_process)
+
+    semanticCommand = commands.add_parser('semantic', help='compute the APL from the place visits of the Semantic '
+                                                           'Location History')
+    semanticCommand.add_argument('files', nargs='+', help='Semantic Location History JSON files (one per month) or '
+                                                          'directories with them')
+    semanticCommand.add_argument('--id', help='idFile of the participant without --points (name of the points file)')
+    semanticCommand.add_argument('--points', help='transformed file with the raw points used to check the place visits')
+    semanticCommand.add_argument('--output', help='dataFinal directory (default: directory of --points or current directory)')
+    semanticCommand.add_argument('--format', choices=FILE_FORMATS, default='csv', help='format of the timeline table and outputs')
+    semanticCommand.add_argument('--compression', choices=COMPRESSIONS, help='compression of the outputs (default: none)')
+    semanticCommand.set_defaults(run=_semantic)
+
+    batchCommand = commands.add_parser('batch', help='transform and compute the APL of every participant of a project')
+    batchCommand.add_argument('project', help='project directory with dataJSON and/or dataTransform')
+    batchCommand.add_argument('--format', choices=FILE_FORMATS, default='csv', help='format of the transformed files and outputs')
+    batchCommand.add_argument('--workers', type=int, help='processes of the participant pool (default: number of processors)')
+    batchCommand.add_argument('--cohort', action='store_true', help='compute the participants with the same parameters '
+                                                                    'together as one cohort')
+    batchCommand.set_defaults(run=_batch)
+
+    serveCommand = commands.add_parser('serve', help='receive Takeout uploads over HTTP and compute their APL')
+    serveCommand.add_argument('project', help='project directory (dataTransform and dataFinal are created)')
+    serveCommand.add_argument('--host', default='127.0.0.1', help='address to listen on (default: localhost only)')
+    serveCommand.add_argument('--port', type=int, default=8765, help='port to listen on')
+    serveCommand.add_argument('--format', choices=FILE_FORMATS, default='csv', help='format of the transformed files and outputs')
+    serveCommand.add_argument('--workers', type=int, help='processes of the APL job pool (default: number of processors)')
+    serveCommand.add_argument('--max-pending', type=int, default=16, help='APL jobs waiting before uploads are refused')
+    serveCommand.set_defaults(run=_serve)
+    return parser
+
+
+def main(argv=None):
+    """
+    Run the command line interface. Return the exit status.
+    """
+    args = get_parser().parse_args(argv)
+    if args.log is not None:
+        logging.basicConfig(level=logging.DEBUG, format='%(asctime)s : %(process)d : %(levelname)s : %(message)s',
+                            filename=args.log, filemode='w')
+    try:
+        return args.run(args)
+    except Exception as error:
+        msg = '{}: {}'.format(type(error).__name__, error)
+        print(msg, file=sys.stderr)
+        logging.error(msg)
+        return 1
+    finally:
+        logging.shutdown()
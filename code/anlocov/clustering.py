@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# CLUSTERING
+# DBSCAN clustering of the APL of each individual with the haversine distance,
+# as skmob.preprocessing.clustering.cluster (sklearn DBSCAN with a ball tree).
+# sklearn computes the neighborhood of every point at once, which needs memory
+# proportional to the square of the stops at the most visited places. Here the
+# neighbors are found with a grid hash over the points on the unit sphere: the
+# side of a cell is chosen so that all points of a cell are within the radius,
+# and only cells at most two steps away are compared. Core points are joined
+# with a union-find and two cells are compared only until they are connected.
+# Labels are the ones of sklearn DBSCAN (clusters numbered by their first core
+# point, border points assigned to the first cluster that reaches them) and
+# are then renumbered as in scikit-mobility: by number of points, descending,
+# ties by the higher DBSCAN label. Cluster 0 is the Most Visited Place.
+# =============================================================================
+import numpy as np
+import pandas as pd
+
+from anlocov.jit import njit
+
+# Kilometers per radian used by scikit-mobility
+KMS_PER_RADIAN = 6371.0088
+
+# All points of a cell must be within the radius: shrink the cell a little to
+# absorb rounding errors
+CELL_MARGIN = 1e-6
+
+
+@njit(cache=True)
+def _rdist(lat1, lng1, lat2, lng2):
+    # Reduced haversine distance of sklearn (radians)
+    sinLat = np.sin(0.5 * (lat1 - lat2))
+    sinLng = np.sin(0.5 * (lng1 - lng2))
+    return sinLat * sinLat + np.cos(lat1) * np.cos(lat2) * sinLng * sinLng
+
+
+@njit(cache=True)
+def _find(parent, i):
+    root = i
+    while parent[root] != root:
+        root = parent[root]
+    while parent[i] != root:
+        following = parent[i]
+        parent[i] = root
+        i = following
+    return root
+
+
+@njit(cache=True)
+def _find_cell(cellX, cellY, cellZ, x, y, z):
+    # Binary search of the cell (x, y, z) in the cells sorted by x, y and z
+    low = 0
+    high = len(cellX)
+    while low < high:
+        middle = (low + high) // 2
+        if (cellX[middle] < x or (cellX[middle] == x and (cellY[middle] < y or
+                                                          (cellY[middle] == y and cellZ[middle] < z)))):
+            low = middle + 1
+        else:
+            high = middle
+    if low < len(cellX) and cellX[low] == x and cellY[low] == y and cellZ[low] == z:
+        return low
+    return -1
+
+
+def grid_cells(lat, lng, epsRad):
+    """
+    Grid hash of the points lat, lng (radians) on the unit sphere. Two points
+    within epsRad are at most the chord 2 sin(epsRad / 2) apart, that is less
+    than two cells of side chord / sqrt(3). Return the points ordered by cell,
+    the range of each cell in that order and the cells (x, y, z) sorted.
+    """
+    side = 2. * np.sin(0.5 * epsRad) / np.sqrt(3.) * (1. - CELL_MARGIN)
+    x = np.floor(np.cos(lat) * np.cos(lng) / side).astype(np.int64)
+    y = np.floor(np.cos(lat) * np.sin(lng) / side).astype(np.int64)
+    z = np.floor(np.sin(lat) / side).astype(np.int64)
+    order = np.lexsort((z, y, x))
+    x, y, z = x[order], y[order], z[order]
+    newCell = np.ones(len(order), dtype=bool)
+    newCell[1:] = (x[1:] != x[:-1]) | (y[1:] != y[:-1]) | (z[1:] != z[:-1])
+    cellStart = np.flatnonzero(newCell)
+    cellEnd = np.append(cellStart[1:], len(order))
+    return order, cellStart, cellEnd, x[cellStart], y[cellStart], z[cellStart]
+
+
+@njit(cache=True)
+def dbscan_kernel(lat, lng, order, cellStart, cellEnd, cellX, cellY, cellZ, epsRad, minSamples):
+    """
+    DBSCAN of the points lat, lng (radians) with the haversine distance and
+    radius epsRad over the grid of grid_cells. Return the sklearn DBSCAN label
+    of each point (-1 noise).
+    """
+    n = len(lat)
+    labels = np.full(n, -1, dtype=np.int64)
+    reducedEps = np.sin(0.5 * epsRad) ** 2
+    numberCells = len(cellStart)
+    # Neighbor cells of each cell (itself included)
+    neighborStart = np.zeros(numberCells + 1, dtype=np.int64)
+    neighbors = np.empty(numberCells * 125, dtype=np.int64)
+    count = 0
+    for c in range(numberCells):
+        for dx in range(-2, 3):
+            for dy in range(-2, 3):
+                for dz in range(-2, 3):
+                    other = _find_cell(cellX, cellY, cellZ, cellX[c] + dx, cellY[c] + dy, cellZ[c] + dz)
+                    if other >= 0:
+                        neighbors[count] = other
+                        count += 1
+        neighborStart[c + 1] = count
+    # Core points: at least minSamples points within epsRad (itself included)
+    core = np.zeros(n, dtype=np.bool_)
+    for c in range(numberCells):
+        if cellEnd[c] - cellStart[c] >= minSamples:
+            for k in range(cellStart[c], cellEnd[c]):
+                core[order[k]] = True
+            continue
+        for k in range(cellStart[c], cellEnd[c]):
+            i = order[k]
+            numberNeighbors = cellEnd[c] - cellStart[c]
+            for m in range(neighborStart[c], neighborStart[c + 1]):
+                other = neighbors[m]
+                if other == c:
+                    continue
+                for l in range(cellStart[other], cellEnd[other]):
+                    j = order[l]
+                    if _rdist(lat[i], lng[i], lat[j], lng[j]) <= reducedEps:
+                        numberNeighbors += 1
+                        if numberNeighbors >= minSamples:
+                            break
+                if numberNeighbors >= minSamples:
+                    core[i] = True
+                    break
+    # Clusters: connected components of the core points
+    parent = np.arange(n)
+    cellCore = np.full(numberCells, -1, dtype=np.int64)
+    for c in range(numberCells):
+        for k in range(cellStart[c], cellEnd[c]):
+            i = order[k]
+            if core[i]:
+                if cellCore[c] < 0:
+                    cellCore[c] = i
+                else:
+                    parent[_find(parent, i)] = _find(parent, cellCore[c])
+    for c in range(numberCells):
+        if cellCore[c] < 0:
+            continue
+        for m in range(neighborStart[c], neighborStart[c + 1]):
+            other = neighbors[m]
+            if other <= c or cellCore[other] < 0:
+                continue
+            if _find(parent, cellCore[c]) == _find(parent, cellCore[other]):
+                continue
+            connected = False
+            for k in range(cellStart[c], cellEnd[c]):
+                i = order[k]
+                if not core[i]:
+                    continue
+                for l in range(cellStart[other], cellEnd[other]):
+                    j = order[l]
+                    if core[j] and _rdist(lat[i], lng[i], lat[j], lng[j]) <= reducedEps:
+                        connected = True
+                        break
+                if connected:
+                    break
+            if connected:
+                parent[_find(parent, cellCore[other])] = _find(parent, cellCore[c])
+    # sklearn numbers the clusters by their first core point
+    rootLabel = np.full(n, -1, dtype=np.int64)
+    numberClusters = 0
+    for i in range(n):
+        if core[i]:
+            root = _find(parent, i)
+            if rootLabel[root] < 0:
+                rootLabel[root] = numberClusters
+                numberClusters += 1
+            labels[i] = rootLabel[root]
+    # Border points join the first cluster that reaches them (lowest label)
+    pointCell = np.empty(n, dtype=np.int64)
+    for c in range(numberCells):
+        for k in range(cellStart[c], cellEnd[c]):
+            pointCell[order[k]] = c
+    for i in range(n):
+        if core[i]:
+            continue
+        c = pointCell[i]
+        for m in range(neighborStart[c], neighborStart[c + 1]):
+            other = neighbors[m]
+            for l in range(cellStart[other], cellEnd[other]):
+                j = order[l]
+                if core[j] and (labels[i] < 0 or labels[j] < labels[i]) and \
+                        _rdist(lat[i], lng[i], lat[j], lng[j]) <= reducedEps:
+                    labels[i] = labels[j]
+    return labels
+
+
+def rank_clusters(labels):
+    """
+    Renumber DBSCAN labels as scikit-mobility: by number of points,
+    descending, ties by the higher label. Noise (-1) is kept.
+    """
+    labels = np.asarray(labels, dtype=np.int64)
+    sizes = np.bincount(labels[labels >= 0])
+    if len(sizes) == 0:
+        return labels.copy()
+    ranking = np.lexsort((-np.arange(len(sizes)), -sizes))
+    newLabels = np.empty(len(sizes), dtype=np.int64)
+    newLabels[ranking] = np.arange(len(sizes))
+    return np.where(labels >= 0, newLabels[np.maximum(labels, 0)], -1)
+
+
+def cluster_apl(dfAPL, clusterRadiusKm, minSamples):
+    """
+    Return dfAPL (columns uid, datetime, lat and lng plus other columns)
+    sorted by uid and datetime with the column cluster: the cluster of each
+    APL of the individual, 0 for the Most Visited Place and -1 for noise
+    (only when minSamples > 1).
+    """
+    dfAPL = dfAPL.sort_values(['uid', 'datetime'], kind='mergesort', ignore_index=True)
+    clusters = np.full(len(dfAPL), -1, dtype=np.int64)
+    if dfAPL.empty:
+        dfAPL['cluster'] = clusters
+        return dfAPL
+    uid = pd.factorize(dfAPL['uid'])[0]
+    newSegment = np.ones(len(dfAPL), dtype=bool)
+    newSegment[1:] = uid[1:] != uid[:-1]
+    segmentStart = np.flatnonzero(newSegment)
+    segmentEnd = np.append(segmentStart[1:], len(dfAPL))
+    lat = np.radians(dfAPL['lat'].to_numpy(dtype=np.float64))
+    lng = np.radians(dfAPL['lng'].to_numpy(dtype=np.float64))
+    if not (np.isfinite(lat).all() and np.isfinite(lng).all()):
+        raise ValueError('APL with missing coordinates can not be clustered')
+    epsRad = clusterRadiusKm / KMS_PER_RADIAN
+    for start, end in zip(segmentStart, segmentEnd):
+        labels = dbscan_kernel(lat[start:end], lng[start:end], *grid_cells(lat[start:end], lng[start:end], epsRad),
+                               epsRad, minSamples)
+        clusters[start:end] = rank_clusters(labels)
+    dfAPL['cluster'] = clusters
+    return dfAPL
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# COHORT MODE
+# Compute the APL of many participants in one process: the transformed files
+# are concatenated in one frame with a categorical uid (idFile) and every
+# stage runs once over the cohort, grouped by uid inside the kernels (zone
+# filter and COVID labelling, filter and compression, weekly trips and stops
+# with trips.cohort_trips_stops, clustering and summaries), instead of one
+# process per file.
+# Participants share the parameters of the cohort (batch.run_batch makes one
+# cohort per set of participant parameters). A participant with few
+# observations or without trips fails alone; its points are dropped from the
+# cohort. Anonymisation offsets (gravity point and cluster 0) are computed per
+# participant and the outputs are written in dataFinal/<idFile> as in
+# processing.process_csv_file. Week checkpoints are not used.
+# =============================================================================
+import logging, os
+
+import numpy as np
+import pandas as pd
+
+from anlocov import export, filtering, parameters, processing, report, storage, summary, trips
+
+# =============================================================================
+# # CONSTANTS DEFINITION
+# =============================================================================
+# Run report of each cohort (dataFinal/<idCohort>RunReport.json)
+COHORT_REPORT_FILE = '{}RunReport.json'
+
+
+def _split_participants(df):
+    # {idFile: rows of the participant} as slices of df sorted by participant
+    idFiles = df['idFile'].to_numpy()
+    codes, uniques = pd.factorize(idFiles)
+    if (np.diff(codes) < 0).any():
+        order = np.argsort(codes, kind='stable')
+        df, codes = df.take(order), codes[order]
+    starts = np.flatnonzero(np.diff(codes, prepend=-1))
+    ends = np.append(starts[1:], len(codes))
+    return {uniques[code]: df.iloc[start:end] for code, start, end in zip(codes[starts], starts, ends)}
+
+
+def read_cohort(participants, errors):
+    """
+    Read the transformed file of each participant of the list of (idFile,
+    urlFile) into one frame with the columns idFile (categorical), datetime,
+    latitude and longitude. Participants that can not be read are added to
+    errors ({idFile: error}).
+    """
+    frames = []
+    for idFile, urlFile in participants:
+        try:
+            df = storage.read_table(urlFile)
+            if df.empty:
+                msg = 'Empty JSON file'
+                raise RuntimeError(msg)
+            processing.validate_columns(df)
+        except Exception as error:
+            errors[idFile] = '{}: {}'.format(type(error).__name__, error)
+            continue
+        df = df[['datetime', 'latitude', 'longitude']]
+        df.insert(0, 'idFile', idFile)
+        frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=['idFile', 'datetime', 'latitude', 'longitude'])
+    dfCohort = pd.concat(frames, ignore_index=True)
+    dfCohort['idFile'] = pd.Categorical(dfCohort['idFile'], categories=[idFile for idFile, _ in participants
+                                                                         if idFile not in errors])
+    return dfCohort
+
+
+def _drop_participants(df, idFiles, column='idFile'):
+    if not idFiles:
+        return df
+    return df[~df[column].isin(idFiles)]
+
+
+def compute_cohort_apl(dfCohort, params=None, runReport=None, errors=None):
+    """
+    Compute GPSTrackingData, APLData and SummaryData of every participant of
+    dfCohort (columns idFile, datetime, latitude and longitude) before
+    anonymisation, as processing.compute_apl. Participants with few
+    observations or without trips are added to errors ({idFile: error}).
+    Return (dfGPSTracking, dfAPL, dfSummary).
+    """
+    if params is None:
+        params = parameters.get_parameters()
+    if runReport is None:
+        runReport = report.RunReport('cohort')
+    if errors is None:
+        errors = {}
+    runReport.parameters = params
+    processing.validate_columns(dfCohort)
+    dfSkmob = processing.prepare_points(dfCohort, params, None, runReport)
+    observations = dfSkmob['uid'].value_counts()
+    fewObservations = observations[observations < params['MIN_NUMBER_OBSERVATIONS']]
+    for idFile, numberObservations in fewObservations.items():
+        errors[idFile] = 'RuntimeError: File {} has few observations: {}'.format(idFile, numberObservations)
+    dfSkmob = _drop_participants(dfSkmob, list(fewObservations.index), 'uid')
+    msg = "Cohort Dataset contains {} records of {} participants".format(len(dfSkmob),
+                                                                         len(observations) - len(fewObservations))
+    print(msg)
+    logging.info(msg)
+    if dfSkmob.empty:
+        msg = 'No participant with enough observations'
+        raise RuntimeError(msg)
+
+    # Filter and compression of every participant in one pass (segments by uid)
+    with runReport.stage('filterCompress', len(dfSkmob)) as record:
+        dfSkmob, droppedPoints = filtering.filter_compress(dfSkmob, maxSpeedKmh=params['MAX_SPEED_KMH'], includeLoops=True,
+                                                           spatialRadiusKm=params['MIN_SPATIAL_RADIUS_KM'])
+        record['rowsOut'] = len(dfSkmob)
+        record['dropped'] = droppedPoints
+    dfGPSTracking = processing.gps_tracking_data(dfSkmob)
+    dfSkmob = processing.week_points(dfSkmob, runReport)
+
+    # Trips and stops of every week of every participant in bulk passes
+    with runReport.stage('tripsStops', len(dfSkmob)) as record:
+        dfWeeks, dfTrajTrips, dfTrajTripsStops = trips.cohort_trips_stops(dfSkmob, params)
+        record['rowsOut'] = len(dfTrajTrips)
+        record['weeks'] = len(dfWeeks)
+        record['stops'] = len(dfTrajTripsStops)
+    withTrips = set(dfTrajTrips['uid'].unique())
+    noTrips = [idFile for idFile in dfWeeks['uid'].unique() if idFile not in withTrips]
+    for idFile in noTrips:
+        errors[idFile] = 'RuntimeError: File {} has no trips'.format(idFile)
+    dfGPSTracking = _drop_participants(dfGPSTracking, noTrips)
+    msg = "Cohort contains {} of {} weeks with trajectories".format(int(dfWeeks['hasTrajectory'].sum()), len(dfWeeks))
+    print(msg)
+    logging.info(msg)
+    if dfTrajTrips.empty:
+        msg = 'No participant with trips'
+        raise RuntimeError(msg)
+
+    # Clusters of every participant (DBSCAN segments by uid)
+    dfAPL = processing.cluster_stops(dfTrajTripsStops, params, runReport)
+    with runReport.stage('summaries', len(dfTrajTrips)) as record:
+        dfSummary = summary.summary_data(dfTrajTrips, dfAPL)
+        record['rowsOut'] = len(dfSummary)
+    dfAPL, dfSummary = processing.apl_summary_data(dfAPL, dfSummary)
+    return dfGPSTracking, dfAPL, dfSummary
+
+
+def process_cohort(participants, urlDataFinal, params=None, outputFormat='csv', compression=None, traceMemory=False,
+                   idCohort='cohort'):
+    """
+    Compute GPSTrackingData, APLData and SummaryData of the list of
+    participants (idFile, urlFile) as one cohort and write the outputs of
+    each participant in dataFinal/<idFile> (see
+    processing.process_csv_file). The run report of the cohort is written in
+    dataFinal/<idCohort>RunReport.json. Return {idFile: (number of APL, error)}
+    with error None for the participants that succeed.
+    """
+    runReport = report.RunReport(idCohort, traceMemory)
+    errors = {}
+    error = None
+    numberAPL = {}
+    try:
+        with runReport.stage('load') as record:
+            dfCohort = read_cohort(participants, errors)
+            record['rowsOut'] = len(dfCohort)
+            record['participants'] = len(participants)
+        dfGPSTracking, dfAPL, dfSummary = compute_cohort_apl(dfCohort, params, runReport, errors)
+        outputs = {name: _split_participants(dfOutput)
+                   for name, dfOutput in [('GPSTracking', dfGPSTracking), ('APL', dfAPL), ('Summary', dfSummary)]}
+        # Anonymisation offsets of each participant (see processing.anonymise)
+        with runReport.stage('anonymise', len(dfGPSTracking) + len(dfAPL)) as record:
+            gravityPoints = {idFile: processing.gravity_point(dfParticipant)
+                             for idFile, dfParticipant in outputs['GPSTracking'].items()}
+            clusterPoints = {idFile: processing.cluster_point(dfParticipant) for idFile, dfParticipant in outputs['APL'].items()}
+            record['rowsOut'] = record['rowsIn']
+        with export.Exporter(urlDataFinal, outputFormat, compression) as exporter:
+            for idFile, dfParticipantAPL in outputs['APL'].items():
+                processing.get_participant_directory(urlDataFinal, idFile)
+                exporter.export(outputs['GPSTracking'][idFile], [(os.path.join(idFile, 'GPSTrackingData_'), None),
+                                                                  (os.path.join(idFile, 'GPSTrackingData'), gravityPoints[idFile])])
+                exporter.export(dfParticipantAPL, [(os.path.join(idFile, 'APLData_'), None),
+                                                   (os.path.join(idFile, 'APLData'), clusterPoints[idFile])])
+                exporter.export(outputs['Summary'][idFile], [(os.path.join(idFile, 'SummaryData'), None)])
+                numberAPL[idFile] = len(dfParticipantAPL)
+            with runReport.stage('export', 2 * len(dfGPSTracking) + 2 * len(dfAPL) + len(dfSummary)) as record:
+                record['rowsOut'] = exporter.close()
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        runReport.close(error)
+        os.makedirs(urlDataFinal, exist_ok=True)
+        runReport.write(os.path.join(urlDataFinal, COHORT_REPORT_FILE.format(idCohort)))
+    msg = "Cohort computation succed!! {} of {} participants. Run report: {} seconds, slowest stage {}".format(
+        len(numberAPL), len(participants), runReport.seconds, runReport.hot_stage())
+    print(msg)
+    logging.info(msg)
+    return {idFile: (numberAPL.get(idFile), errors.get(idFile)) for idFile, _ in participants}
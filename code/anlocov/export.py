@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# EXPORT
+# Write the outputs of a participant (GPSTrackingData, APLData, SummaryData)
+# in one pass over each frame: the frame is serialised in chunks of
+# EXPORT_CHUNK_ROWS rows and every chunk is written as it is (GPSTrackingData_,
+# APLData_) and moved by the anonymisation offset (GPSTrackingData, APLData),
+# so the anonymised outputs are not copies of the whole frame.
+# Outputs are written in a background thread while the computation goes on
+# (compute_apl queues GPSTrackingData before computing trips and stops); the
+# writers are buffered and optionally compressed (see storage.py).
+# =============================================================================
+import os, queue, threading
+
+from anlocov import storage
+
+# =============================================================================
+# # CONSTANTS DEFINITION
+# =============================================================================
+# Rows serialised at a time
+EXPORT_CHUNK_ROWS = 100000
+
+# Exports waiting for the background thread. export() blocks when the queue is
+# full, so frames are not kept in memory faster than they are written
+MAX_PENDING = 8
+
+
+def _iter_chunks(frames, chunkRows):
+    # Slices of at most chunkRows rows of a DataFrame or of an iterable of DataFrames
+    if hasattr(frames, 'iloc'):
+        frames = [frames]
+    for dataFrame in frames:
+        # An empty frame is written once, for the header of the output
+        for start in range(0, max(len(dataFrame), 1), chunkRows):
+            yield dataFrame.iloc[start:start + chunkRows]
+
+
+def _shift_chunk(dfChunk, offset):
+    # Move the point offset (lat, lon) of the chunk to the center of the world (0,0)
+    if offset is None:
+        return dfChunk
+    lat, lon = offset
+    return dfChunk.assign(lat=dfChunk['lat'].to_numpy() - lat, lon=dfChunk['lon'].to_numpy() - lon)
+
+
+class Exporter:
+    """
+    Write outputs in the directory urlDirectory (the participant directory,
+    or dataFinal when the names include the participant directory) in
+    outputFormat (csv, parquet or arrow) with compression (None, gzip or
+    zstd). export() queues the outputs of a frame and returns; close() waits
+    until every output is written and raises the first error. Used as a
+    context manager, the outputs are removed when the computation fails.
+    With background False, outputs are written when they are queued.
+    """
+
+    def __init__(self, urlDirectory, outputFormat='csv', compression=None, background=True,
+                 chunkRows=EXPORT_CHUNK_ROWS):
+        self.urlDirectory = urlDirectory
+        self.outputFormat = outputFormat
+        self.compression = compression
+        self.chunkRows = chunkRows
+        self.numberRows = 0
+        self.files = []
+        self.error = None
+        self._queue = None
+        self._thread = None
+        if background:
+            self._queue = queue.Queue(MAX_PENDING)
+            self._thread = threading.Thread(target=self._run, name='anlocov-export', daemon=True)
+            self._thread.start()
+
+    def get_url(self, name):
+        """
+        Return the path of the output name
+        """
+        return os.path.join(self.urlDirectory, storage.get_file_name(name, self.outputFormat, self.compression))
+
+    def export(self, frames, outputs):
+        """
+        Write frames (a DataFrame, or an iterable of DataFrames with the same
+        columns) in the outputs, a list of (name, offset): offset is None for
+        the output as it is, or the point (lat, lon) moved to (0,0) in the
+        columns lat and lon
+        """
+        if self._queue is None:
+            self._write(frames, outputs)
+            return
+        if self.error is not None:
+            raise self.error
+        self._queue.put((frames, outputs))
+
+    def _write(self, frames, outputs):
+        writers = [(storage.TableWriter(self.get_url(name), self.compression), offset) for name, offset in outputs]
+        self.files += [writer.urlFile for writer, _ in writers]
+        try:
+            for dfChunk in _iter_chunks(frames, self.chunkRows):
+                for writer, offset in writers:
+                    writer.write(_shift_chunk(dfChunk, offset))
+                self.numberRows += len(dfChunk) * len(writers)
+        finally:
+            for writer, _ in writers:
+                writer.close()
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            try:
+                if task is None:
+                    return
+                if self.error is None:
+                    self._write(*task)
+            except Exception as e:
+                self.error = e
+            finally:
+                self._queue.task_done()
+
+    def close(self):
+        """
+        Wait until the queued outputs are written. Return the number of rows
+        written.
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        if self.error is not None:
+            raise self.error
+        return self.numberRows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, *args):
+        if excType is None:
+            self.close()
+            return
+        # The error of the computation is raised, not the one of the export,
+        # and the outputs of the failed computation are removed
+        try:
+            self.close()
+        except Exception:
+            pass
+        for urlFile in self.files:
+            if os.path.exists(urlFile):
+                os.remove(urlFile)
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# FILTERING AND COMPRESSION
+# Speed filter and spatial compression of the GPS stream fused in one pass over
+# contiguous arrays (int64 time in nanoseconds, float64 latitude and longitude).
+# The filter follows skmob.preprocessing.filtering.filter: a point is deleted
+# when the speed from the previous point is higher than max_speed_kmh or, with
+# include_loops, when it is the farthest point of a short and fast loop.
+# The compression follows skmob.preprocessing.compression.compress: all points
+# within spatial_radius_km km of the first point of a group are replaced by
+# one point with the median coordinates and the time and other columns of the
+# first point.
+# Points are final as soon as the filter moves past them, so they are
+# compressed in the same pass. The kernel can stop before the end of a user
+# and carry its state (points not yet filtered and the open group), so the
+# points of a user can be given in partitions (FilterCompressStream).
+# =============================================================================
+import numpy as np
+import pandas as pd
+
+from anlocov.geo import haversine_km_point
+from anlocov.jit import njit
+
+NANOSECONDS_SECOND = 10**9
+
+# Loop filter defaults of scikit-mobility
+SPEED_KMH = 5.
+MAX_LOOP = 6
+RATIO_MAX = 0.25
+
+
+@njit(cache=True)
+def _seconds(t, a, b):
+    return (t[b] - t[a]) / NANOSECONDS_SECOND
+
+
+@njit(cache=True)
+def _compress_point(point, lat, lng, kept, keptCount, groupStart, firstIdx, medianLat, medianLng, count, spatialRadiusKm):
+    # Add a point accepted by the filter to the current group, closing the group when the point is out of its radius
+    if keptCount > 0 and haversine_km_point(lat[kept[groupStart]], lng[kept[groupStart]], lat[point], lng[point]) > spatialRadiusKm:
+        firstIdx[count] = kept[groupStart]
+        medianLat[count] = np.median(lat[kept[groupStart:keptCount]])
+        medianLng[count] = np.median(lng[kept[groupStart:keptCount]])
+        count += 1
+        groupStart = keptCount
+    kept[keptCount] = point
+    return keptCount + 1, groupStart, count
+
+
+@njit(cache=True)
+def filter_compress_kernel(t, lat, lng, segmentStart, segmentEnd, maxSpeedKmh, includeLoops, speedKmh, maxLoop,
+                           ratioMax, spatialRadiusKm, segmentAccepted, segmentFinal):
+    """
+    Filter and compress each segment (user) segmentStart[s]:segmentEnd[s]
+    sorted by time. The first segmentAccepted[s] points of a segment already
+    passed the filter (carried group). When segmentFinal[s] is False more
+    points of the segment will follow: the filter stops while fewer than
+    maxLoop points follow the current point and the last group and the points
+    not yet filtered are carried. Return the index of the first point of each
+    compressed point, its median latitude and longitude, the number of points
+    deleted by the speed rule and by the loop rule, the index of the carried
+    points and the number of carried points already accepted and in total of
+    each segment.
+    """
+    n = len(t)
+    nxt = np.arange(1, n + 1)
+    kept = np.empty(n, dtype=np.int64)
+    firstIdx = np.empty(n, dtype=np.int64)
+    medianLat = np.empty(n, dtype=np.float64)
+    medianLng = np.empty(n, dtype=np.float64)
+    carryIdx = np.empty(n, dtype=np.int64)
+    carryAccepted = np.zeros(len(segmentStart), dtype=np.int64)
+    carrySize = np.zeros(len(segmentStart), dtype=np.int64)
+    window = np.empty(maxLoop, dtype=np.int64)
+    drDt = np.empty((maxLoop, 2), dtype=np.float64)
+    minAhead = max(maxLoop, 2)
+    droppedSpeed = 0
+    droppedLoop = 0
+    count = 0
+    carryCount = 0
+    for s in range(len(segmentStart)):
+        start = segmentStart[s]
+        end = segmentEnd[s]
+        if end <= start:
+            continue
+        nxt[end - 1] = -1
+        # Compression state: kept[groupStart:keptCount] are the points of the current group
+        keptCount = 0
+        groupStart = 0
+        for point in range(start, start + segmentAccepted[s]):
+            keptCount, groupStart, count = _compress_point(point, lat, lng, kept, keptCount, groupStart, firstIdx,
+                                                           medianLat, medianLng, count, spatialRadiusKm)
+        cur = start + segmentAccepted[s]
+        if cur >= end:
+            cur = -1
+        lX = end - start - segmentAccepted[s]
+        i = 0
+        final = segmentFinal[s]
+        while True:
+            if not final and lX - i - 1 < minAhead:
+                # The decision on cur depends on points of the next partition
+                break
+            # ============================== FILTER ==============================
+            if i < lX - 2:
+                following = nxt[cur]
+                dt = _seconds(t, cur, following)
+                if dt == 0 or haversine_km_point(lat[cur], lng[cur], lat[following], lng[following]) / dt * 3600. > maxSpeedKmh:
+                    nxt[cur] = nxt[following]
+                    lX -= 1
+                    droppedSpeed += 1
+                    continue
+                if includeLoops:
+                    ahead = min(maxLoop, lX - i - 1)
+                    point = cur
+                    for j in range(1, ahead):
+                        point = nxt[point]
+                        window[j] = point
+                        drDt[j - 1, 0] = haversine_km_point(lat[cur], lng[cur], lat[point], lng[point])
+                        drDt[j - 1, 1] = _seconds(t, cur, point)
+                    rows = ahead - 1
+                    imax = 0
+                    for j in range(1, rows):
+                        if drDt[j, 0] > drDt[imax, 0]:
+                            imax = j
+                    imin = -1
+                    for j in range(imax, rows):
+                        if drDt[j, 0] < drDt[imax, 0] * ratioMax:
+                            imin = j
+                            break
+                    if imin >= 0:
+                        dr = 0.
+                        dtLoop = 0.
+                        for j in range(imin):
+                            dr += drDt[j, 0]
+                            dtLoop += drDt[j, 1]
+                        if dr / dtLoop * 3600. > speedKmh if dtLoop != 0 else dr > 0:
+                            # Delete the farthest point of the loop (position i + 1 + imax)
+                            previous = cur if imax == 0 else window[imax]
+                            nxt[previous] = nxt[nxt[previous]]
+                            lX -= 1
+                            droppedLoop += 1
+                            continue
+                point = cur
+                nextCur = nxt[cur]
+                i += 1
+            elif cur != -1:
+                # Points after the last position checked by the filter are kept
+                point = cur
+                nextCur = nxt[cur]
+            else:
+                break
+            # ============================ COMPRESSION ===========================
+            keptCount, groupStart, count = _compress_point(point, lat, lng, kept, keptCount, groupStart, firstIdx,
+                                                           medianLat, medianLng, count, spatialRadiusKm)
+            cur = nextCur
+        if final:
+            if keptCount > 0:
+                firstIdx[count] = kept[groupStart]
+                medianLat[count] = np.median(lat[kept[groupStart:keptCount]])
+                medianLng[count] = np.median(lng[kept[groupStart:keptCount]])
+                count += 1
+        else:
+            # Carry the open group and the points not yet filtered
+            carryStart = carryCount
+            for k in range(groupStart, keptCount):
+                carryIdx[carryCount] = kept[k]
+                carryCount += 1
+            carryAccepted[s] = keptCount - groupStart
+            while cur != -1:
+                carryIdx[carryCount] = cur
+                carryCount += 1
+                cur = nxt[cur]
+            carrySize[s] = carryCount - carryStart
+    return (firstIdx[:count], medianLat[:count], medianLng[:count], droppedSpeed, droppedLoop, carryIdx[:carryCount],
+            carryAccepted, carrySize)
+
+
+def filter_compress(dfPoints, maxSpeedKmh, spatialRadiusKm, includeLoops=True, speedKmh=SPEED_KMH, maxLoop=MAX_LOOP,
+                    ratioMax=RATIO_MAX):
+    """
+    Filter and compress dfPoints (columns uid, datetime (datetime64), lat and
+    lng plus other columns) sorted by uid and datetime. Return the compressed
+    frame, with the same columns and a new index, and the number of points
+    deleted by each rule (speed, loops and compression).
+    """
+    dfPoints = dfPoints.sort_values(['uid', 'datetime'], kind='mergesort', ignore_index=True)
+    stats = {'speed': 0, 'loops': 0, 'compression': 0}
+    if dfPoints.empty:
+        return dfPoints, stats
+    uid = pd.factorize(dfPoints['uid'])[0]
+    newSegment = np.ones(len(dfPoints), dtype=bool)
+    newSegment[1:] = uid[1:] != uid[:-1]
+    segmentStart = np.flatnonzero(newSegment)
+    segmentEnd = np.append(segmentStart[1:], len(dfPoints))
+    t = dfPoints['datetime'].to_numpy().astype('datetime64[ns]').astype(np.int64)
+    firstIdx, medianLat, medianLng, droppedSpeed, droppedLoop, _, _, _ = filter_compress_kernel(
+        t, dfPoints['lat'].to_numpy(dtype=np.float64), dfPoints['lng'].to_numpy(dtype=np.float64),
+        segmentStart, segmentEnd, maxSpeedKmh, includeLoops, speedKmh, maxLoop, ratioMax, spatialRadiusKm,
+        np.zeros(len(segmentStart), dtype=np.int64), np.ones(len(segmentStart), dtype=np.bool_))
+    dfCompressed = dfPoints.take(firstIdx).reset_index(drop=True)
+    dfCompressed['lat'] = medianLat
+    dfCompressed['lng'] = medianLng
+    stats['speed'] = int(droppedSpeed)
+    stats['loops'] = int(droppedLoop)
+    stats['compression'] = len(dfPoints) - stats['speed'] - stats['loops'] - len(dfCompressed)
+    return dfCompressed, stats
+
+
+class FilterCompressStream:
+    """
+    Filter and compress the points of one user given in partitions sorted by
+    time (push), with the same result as filter_compress over all points.
+    The points whose filter decision depends on the next partition and the
+    last group of the compression are carried to the next partition.
+    """
+
+    def __init__(self, maxSpeedKmh, spatialRadiusKm, includeLoops=True, speedKmh=SPEED_KMH, maxLoop=MAX_LOOP,
+                 ratioMax=RATIO_MAX):
+        self.arguments = (maxSpeedKmh, includeLoops, speedKmh, maxLoop, ratioMax, spatialRadiusKm)
+        self.dfCarry = None
+        self.carryAccepted = 0
+        self.numberPoints = 0
+        self.numberCompressed = 0
+        self.stats = {'speed': 0, 'loops': 0, 'compression': 0}
+
+    def push(self, dfPoints, final=False):
+        """
+        Filter and compress the next partition dfPoints (columns uid,
+        datetime (datetime64), lat and lng plus other columns, sorted by
+        datetime). With final, the carried points are compressed too.
+        Return the compressed points that are final.
+        """
+        self.numberPoints += len(dfPoints)
+        if self.dfCarry is not None:
+            dfPoints = pd.concat([self.dfCarry, dfPoints], ignore_index=True)
+        else:
+            dfPoints = dfPoints.reset_index(drop=True)
+        if dfPoints.empty:
+            return dfPoints
+        t = dfPoints['datetime'].to_numpy().astype('datetime64[ns]').astype(np.int64)
+        firstIdx, medianLat, medianLng, droppedSpeed, droppedLoop, carryIdx, carryAccepted, _ = filter_compress_kernel(
+            t, dfPoints['lat'].to_numpy(dtype=np.float64), dfPoints['lng'].to_numpy(dtype=np.float64),
+            np.zeros(1, dtype=np.int64), np.full(1, len(dfPoints), dtype=np.int64), *self.arguments,
+            np.full(1, self.carryAccepted, dtype=np.int64), np.full(1, final, dtype=np.bool_))
+        self.dfCarry = None if final else dfPoints.take(carryIdx).reset_index(drop=True)
+        self.carryAccepted = int(carryAccepted[0])
+        dfCompressed = dfPoints.take(firstIdx).reset_index(drop=True)
+        dfCompressed['lat'] = medianLat
+        dfCompressed['lng'] = medianLng
+        self.numberCompressed += len(dfCompressed)
+        self.stats['speed'] += int(droppedSpeed)
+        self.stats['loops'] += int(droppedLoop)
+        self.stats['compression'] = self.numberPoints - self.stats['speed'] - self.stats['loops'] - self.numberCompressed
+        return dfCompressed
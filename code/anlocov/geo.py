@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# GEOGRAPHIC UTILITIES
+# Vectorized distances over NumPy arrays of latitude and longitude (degrees)
+# The earth radius is the one used by scikit-mobility (gislib.getDistance)
+# =============================================================================
+import math
+
+import numpy as np
+
+from anlocov.jit import njit
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """
+    Great circle distance in km between (lat1, lng1) and (lat2, lng2)
+    (same formula as gislib.getDistanceByHaversine)
+    """
+    lat1, lng1, lat2, lng2 = [np.asarray(value, dtype=np.float64) * math.pi / 180.0 for value in (lat1, lng1, lat2, lng2)]
+    a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2.0)**2
+    return EARTH_RADIUS_KM * (2.0 * np.arctan2(np.sqrt(a), np.sqrt(1.0 - a)))
+
+
+def consecutive_haversine_km(lat, lng, groupStart=None):
+    """
+    Distance in km from each point to the previous one. The first point and
+    the points where groupStart is True (first point of a group) get 0.
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lng = np.asarray(lng, dtype=np.float64)
+    delta = np.zeros(len(lat), dtype=np.float64)
+    if len(lat) > 1:
+        delta[1:] = haversine_km(lat[:-1], lng[:-1], lat[1:], lng[1:])
+    if groupStart is not None:
+        delta[np.asarray(groupStart, dtype=bool)] = 0.0
+    return delta
+
+
+@njit(cache=True)
+def haversine_km_point(lat1, lng1, lat2, lng2):
+    """
+    Great circle distance in km between two points (scalar version used by
+    the sequential kernels)
+    """
+    lat1 = lat1 * math.pi / 180.0
+    lng1 = lng1 * math.pi / 180.0
+    lat2 = lat2 * math.pi / 180.0
+    lng2 = lng2 * math.pi / 180.0
+    a = math.sin((lat2 - lat1) / 2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2.0)**2
+    return EARTH_RADIUS_KM * (2.0 * math.atan2(math.sqrt(a), math.sqrt(1.0 - a)))
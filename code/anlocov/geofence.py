@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# STUDY AREA GEOFENCE
+# Zone filter with the polygons of the study area (country, provinces, ...)
+# instead of the rectangle TOP_LAT, LOW_LAT, LEFT_LON, RIGHT_LON, and region
+# of every point (the feature of the polygon that contains it).
+# The polygons (rings of every feature, holes included) are indexed once in a
+# grid of GRID_CELLS x GRID_CELLS cells over their bounding box:
+# - the cells crossed by no edge are inside a region or outside every region,
+#   known from the center of the cell (scanline over the rows of centers),
+# - the cells crossed by edges (boundary cells) keep their edges.
+# A point out of the bounding box is out of the study area; a point of a
+# cell without edges takes the region of the cell; a point of a boundary
+# cell counts the edges of the cell crossed by the segment from the center of
+# the cell to the point (even-odd rule). Every point is labelled with a few
+# array operations and only the points of the boundary cells run the kernel.
+# The study area is a GeoJSON file (Polygon and MultiPolygon features) or a
+# shapefile (requires pyshp) set in parameters.STUDY_AREA; the region of a
+# feature is its property REGION_PROPERTY (its id or its position without
+# property). Features with the same region are one region. Regions should
+# not overlap; a point inside several regions takes the first one.
+# =============================================================================
+import functools, json, os
+
+import numpy as np
+
+from anlocov.jit import njit
+
+# =============================================================================
+# # CONSTANTS DEFINITION
+# =============================================================================
+# Cells of each side of the grid index
+GRID_CELLS = 256
+
+# Region of the points outside the study area and cells crossed by edges
+OUTSIDE = -1
+BOUNDARY = -2
+
+GEOJSON_EXTENSIONS = ('.json', '.geojson')
+SHAPEFILE_EXTENSION = '.shp'
+
+
+@njit(cache=True)
+def _crosses(aLat, aLng, bLat, bLng, cLat, cLng, pLat, pLng):
+    # Segment center-point crosses edge a-b (an endpoint on a line counts on one side only)
+    d1 = (pLng - cLng) * (aLat - cLat) - (pLat - cLat) * (aLng - cLng)
+    d2 = (pLng - cLng) * (bLat - cLat) - (pLat - cLat) * (bLng - cLng)
+    if (d1 > 0) == (d2 > 0):
+        return False
+    d3 = (bLng - aLng) * (cLat - aLat) - (bLat - aLat) * (cLng - aLng)
+    d4 = (bLng - aLng) * (pLat - aLat) - (bLat - aLat) * (pLng - aLng)
+    return (d3 > 0) != (d4 > 0)
+
+
+@njit(cache=True)
+def boundary_kernel(lat, lng, boundaryCell, centerLat, centerLng, candidateStart, candidateRegion, candidateInside,
+                    candidateEdgeStart, candidateEdges, edgeLat0, edgeLng0, edgeLat1, edgeLng1):
+    """
+    Region of the points of boundary cells (boundaryCell): first candidate
+    region of the cell whose parity (center inside, flipped by every edge
+    crossed from the center to the point) is inside, OUTSIDE otherwise
+    """
+    region = np.full(len(lat), OUTSIDE, dtype=np.int32)
+    for i in range(len(lat)):
+        b = boundaryCell[i]
+        for k in range(candidateStart[b], candidateStart[b + 1]):
+            inside = candidateInside[k]
+            for j in range(candidateEdgeStart[k], candidateEdgeStart[k + 1]):
+                e = candidateEdges[j]
+                if _crosses(edgeLat0[e], edgeLng0[e], edgeLat1[e], edgeLng1[e], centerLat[b], centerLng[b], lat[i], lng[i]):
+                    inside = not inside
+            if inside:
+                region[i] = candidateRegion[k]
+                break
+    return region
+
+
+def _expand_ranges(starts, counts):
+    # Concatenation of the ranges start, start + 1, ..., start + count - 1
+    total = int(counts.sum())
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + offsets
+
+
+class Geofence:
+    """
+    Grid index of the regions of a study area. rings is a list of (region
+    index, lat array, lng array) closed or open rings and regionIds the id
+    of every region.
+    """
+
+    def __init__(self, rings, regionIds, name='', gridCells=GRID_CELLS):
+        self.name = name
+        self.regionIds = list(regionIds)
+        if not rings:
+            msg = 'No polygons in study area {}'.format(name)
+            raise RuntimeError(msg)
+        # Edges of every ring (a ring is closed with its first point)
+        edges = []
+        for region, ringLat, ringLng in rings:
+            ringLat = np.asarray(ringLat, dtype=np.float64)
+            ringLng = np.asarray(ringLng, dtype=np.float64)
+            if len(ringLat) < 3:
+                continue
+            nextIdx = np.roll(np.arange(len(ringLat)), -1)
+            edges.append((np.full(len(ringLat), region, dtype=np.int32), ringLat, ringLng, ringLat[nextIdx], ringLng[nextIdx]))
+        edgeRegion, lat0, lng0, lat1, lng1 = (np.concatenate(values) for values in zip(*edges))
+        nonZero = (lat0 != lat1) | (lng0 != lng1)
+        self.edgeRegion, self.edgeLat0, self.edgeLng0, self.edgeLat1, self.edgeLng1 = (
+            values[nonZero] for values in (edgeRegion, lat0, lng0, lat1, lng1))
+        self.minLat, self.maxLat = float(self.edgeLat0.min()), float(self.edgeLat0.max())
+        self.minLng, self.maxLng = float(self.edgeLng0.min()), float(self.edgeLng0.max())
+        self.gridCells = gridCells
+        self.cellLat = max(self.maxLat - self.minLat, 1e-9) / gridCells
+        self.cellLng = max(self.maxLng - self.minLng, 1e-9) / gridCells
+        self._build_index()
+
+    def _row_col(self, lat, lng):
+        row = np.clip(((lat - self.minLat) / self.cellLat).astype(np.int64), 0, self.gridCells - 1)
+        col = np.clip(((lng - self.minLng) / self.cellLng).astype(np.int64), 0, self.gridCells - 1)
+        return row, col
+
+    def _build_index(self):
+        n = self.gridCells
+        numberRegions = len(self.regionIds)
+        # Cells of the bounding box of every edge
+        row0, col0 = self._row_col(np.minimum(self.edgeLat0, self.edgeLat1), np.minimum(self.edgeLng0, self.edgeLng1))
+        row1, col1 = self._row_col(np.maximum(self.edgeLat0, self.edgeLat1), np.maximum(self.edgeLng0, self.edgeLng1))
+        rows = row1 - row0 + 1
+        cols = col1 - col0 + 1
+        edgeIdx = np.repeat(np.arange(len(row0)), rows * cols)
+        offset = _expand_ranges(np.zeros(len(row0), dtype=np.int64), rows * cols)
+        edgeCell = (row0[edgeIdx] + offset // cols[edgeIdx]) * n + col0[edgeIdx] + offset % cols[edgeIdx]
+        # Region of the center of every cell: even-odd count of the edges
+        # crossed by the row of centers on the left of each center
+        centerLng = self.minLng + (np.arange(n) + 0.5) * self.cellLng
+        inside = np.zeros((numberRegions, n * n), dtype=bool)
+        for row in range(n):
+            centerLat = self.minLat + (row + 0.5) * self.cellLat
+            crossing = np.flatnonzero((self.edgeLat0 > centerLat) != (self.edgeLat1 > centerLat))
+            if not len(crossing):
+                continue
+            lat0, lng0 = self.edgeLat0[crossing], self.edgeLng0[crossing]
+            crossingLng = lng0 + (centerLat - lat0) * (self.edgeLng1[crossing] - lng0) / (self.edgeLat1[crossing] - lat0)
+            crossingRegion = self.edgeRegion[crossing]
+            for region in np.unique(crossingRegion):
+                regionLng = np.sort(crossingLng[crossingRegion == region])
+                inside[region, row * n:(row + 1) * n] = np.searchsorted(regionLng, centerLng) % 2 == 1
+        self.cellRegion = np.where(inside.any(axis=0), inside.argmax(axis=0), OUTSIDE).astype(np.int32)
+        # Boundary cells: candidates (regions with edges in the cell or containing its center) and their edges
+        boundaryCells = np.unique(edgeCell)
+        self.cellRegion[boundaryCells] = BOUNDARY
+        self.boundaryIndex = np.full(n * n, -1, dtype=np.int64)
+        self.boundaryIndex[boundaryCells] = np.arange(len(boundaryCells))
+        self.centerLat = self.minLat + (boundaryCells // n + 0.5) * self.cellLat
+        self.centerLng = self.minLng + (boundaryCells % n + 0.5) * self.cellLng
+        edgeOrder = np.lexsort((edgeIdx, self.edgeRegion[edgeIdx], self.boundaryIndex[edgeCell]))
+        self.candidateEdges = edgeIdx[edgeOrder]
+        edgeCandidate = self.boundaryIndex[edgeCell[edgeOrder]] * numberRegions + self.edgeRegion[self.candidateEdges]
+        insideRegion, insideCell = np.nonzero(inside[:, boundaryCells])
+        candidates = np.union1d(edgeCandidate, insideCell * numberRegions + insideRegion)
+        self.candidateRegion = (candidates % numberRegions).astype(np.int32)
+        self.candidateInside = inside[self.candidateRegion, boundaryCells[candidates // numberRegions]]
+        self.candidateStart = np.searchsorted(candidates // numberRegions, np.arange(len(boundaryCells) + 1))
+        self.candidateEdgeStart = np.searchsorted(edgeCandidate, np.append(candidates, candidates[-1] + 1))
+
+    def label(self, lat, lng):
+        """
+        Return the region index (int32 array, OUTSIDE for the points out of
+        the study area) of the points lat, lng
+        """
+        lat = np.asarray(lat, dtype=np.float64)
+        lng = np.asarray(lng, dtype=np.float64)
+        region = np.full(len(lat), OUTSIDE, dtype=np.int32)
+        inBox = np.flatnonzero((lat >= self.minLat) & (lat <= self.maxLat) & (lng >= self.minLng) & (lng <= self.maxLng))
+        row, col = self._row_col(lat[inBox], lng[inBox])
+        cell = row * self.gridCells + col
+        region[inBox] = self.cellRegion[cell]
+        boundary = np.flatnonzero(region[inBox] == BOUNDARY)
+        if len(boundary):
+            points = inBox[boundary]
+            region[points] = boundary_kernel(
+                lat[points], lng[points], self.boundaryIndex[cell[boundary]], self.centerLat, self.centerLng,
+                self.candidateStart, self.candidateRegion, self.candidateInside, self.candidateEdgeStart,
+                self.candidateEdges, self.edgeLat0, self.edgeLng0, self.edgeLat1, self.edgeLng1)
+        return region
+
+
+def _polygon_rings(geometry):
+    # Rings (lists of [lng, lat]) of a GeoJSON Polygon or MultiPolygon
+    if geometry is None:
+        return []
+    if geometry['type'] == 'Polygon':
+        return geometry['coordinates']
+    if geometry['type'] == 'MultiPolygon':
+        return [ring for polygon in geometry['coordinates'] for ring in polygon]
+    if geometry['type'] == 'GeometryCollection':
+        return [ring for part in geometry['geometries'] for ring in _polygon_rings(part)]
+    return []
+
+
+def _geojson_features(urlFile, regionProperty):
+    with open(urlFile, encoding='utf-8') as file:
+        data = json.load(file)
+    features = data['features'] if data.get('type') == 'FeatureCollection' else [data]
+    for i, feature in enumerate(features):
+        if feature.get('type') != 'Feature':
+            feature = {'type': 'Feature', 'geometry': feature, 'properties': {}}
+        properties = feature.get('properties') or {}
+        regionId = properties.get(regionProperty) if regionProperty else feature.get('id', i)
+        yield regionId, [(np.asarray(ring, dtype=np.float64)[:, 1], np.asarray(ring, dtype=np.float64)[:, 0])
+                         for ring in _polygon_rings(feature.get('geometry')) if len(ring)]
+
+
+def _shapefile_features(urlFile, regionProperty):
+    try:
+        import shapefile
+    except ImportError:
+        msg = 'pyshp is required to read shapefile study areas'
+        raise RuntimeError(msg)
+    with shapefile.Reader(urlFile) as reader:
+        for i, shapeRecord in enumerate(reader.iterShapeRecords()):
+            points = np.asarray(shapeRecord.shape.points, dtype=np.float64).reshape(-1, 2)
+            parts = list(shapeRecord.shape.parts) + [len(points)]
+            regionId = shapeRecord.record.as_dict().get(regionProperty) if regionProperty else i
+            yield regionId, [(points[start:end, 1], points[start:end, 0]) for start, end in zip(parts[:-1], parts[1:])
+                             if end > start]
+
+
+@functools.lru_cache(maxsize=None)
+def load_geofence(urlFile, regionProperty=None):
+    """
+    Read the polygons of a study area file (GeoJSON or shapefile) and return
+    its Geofence. The region of each feature is its property regionProperty
+    (its id or position without property).
+    """
+    extension = os.path.splitext(urlFile)[1].lower()
+    if extension in GEOJSON_EXTENSIONS:
+        features = _geojson_features(urlFile, regionProperty)
+    elif extension == SHAPEFILE_EXTENSION:
+        features = _shapefile_features(urlFile, regionProperty)
+    else:
+        msg = 'Wrong study area file {}. Use GeoJSON ({}) or shapefile ({})'.format(
+            os.path.basename(urlFile), ', '.join(GEOJSON_EXTENSIONS), SHAPEFILE_EXTENSION)
+        raise RuntimeError(msg)
+    regionIds = {}
+    rings = []
+    for regionId, featureRings in features:
+        if regionId is None:
+            msg = 'Feature without property {} in study area {}'.format(regionProperty, urlFile)
+            raise RuntimeError(msg)
+        region = regionIds.setdefault(str(regionId), len(regionIds))
+        rings += [(region, ringLat, ringLng) for ringLat, ringLng in featureRings]
+    return Geofence(rings, regionIds, os.path.basename(urlFile))
+
+
+def get_geofence(params):
+    """
+    Return the Geofence of STUDY_AREA (and REGION_PROPERTY), or None when the
+    zone filter is the rectangle TOP_LAT, LOW_LAT, LEFT_LON, RIGHT_LON
+    """
+    if not params.get('STUDY_AREA'):
+        return None
+    return load_geofence(params['STUDY_AREA'], params.get('REGION_PROPERTY'))
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# JIT COMPILATION
+# Sequential kernels are compiled with numba when it is installed.
+# Without numba the kernels run as plain Python functions with the same results
+# =============================================================================
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda function: function
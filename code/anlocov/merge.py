@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# MERGE OF TAKEOUT EXPORTS
+# Several GLH exports of one participant (JSON files or Takeout archives that
+# cover overlapping periods) are merged into one transformed file sorted by
+# time, so stage 2 runs once per participant.
+# Each export is parsed in chunks (transformation.iter_location_chunks); each
+# chunk is sorted and appended to a sorted run in a temporary file (a new run
+# starts when a chunk starts before the end of the previous one, so exports do
+# not have to be sorted). The runs are merged by blocks: the rows up to the
+# smallest last time of the blocks in memory can be sorted and written, as no
+# run has an earlier row left. Fixes repeated across exports (time within
+# DUPLICATE_TIME_MS ms and position within DUPLICATE_DISTANCE_M m of a kept
+# fix) are removed in the same pass, comparing each fix with the kept fixes of
+# the last DUPLICATE_TIME_MS ms only.
+# Memory is bounded by one chunk of CHUNK_SIZE rows while the runs are written
+# and one block of MERGE_BLOCK_ROWS rows per run while they are merged.
+# =============================================================================
+import logging, os, tempfile
+
+import numpy as np
+
+from anlocov import storage, takeout, transformation
+from anlocov.geo import haversine_km_point
+from anlocov.jit import njit
+
+# =============================================================================
+# # CONSTANTS DEFINITION
+# =============================================================================
+# Fixes of several exports closer than DUPLICATE_TIME_MS milliseconds and
+# DUPLICATE_DISTANCE_M meters are the same fix (exact duplicates have 0 and 0)
+DUPLICATE_TIME_MS = 1000 #1 second
+DUPLICATE_DISTANCE_M = 5 #5 meters
+
+# Rows of each run read at once while the runs are merged
+MERGE_BLOCK_ROWS = 1 << 16
+
+# Extensions of the exports of a participant directory
+EXPORT_EXTENSIONS = ('.json', '.zip')
+
+RUN_DTYPE = np.dtype([('timestampMs', np.int64), ('latitudeE7', np.int32), ('longitudeE7', np.int32)])
+
+
+def find_exports(urlDirectory):
+    """
+    Return the sorted list of the GLH JSON files and Takeout archives (zip)
+    of the directory of a participant
+    """
+    return sorted(os.path.join(urlDirectory, fileName) for fileName in os.listdir(urlDirectory)
+                  if fileName.lower().endswith(EXPORT_EXTENSIONS))
+
+
+def _iter_export_chunks(urlFile, chunkSize, stats):
+    # Location chunks of a GLH JSON file or of the Location History of a Takeout archive
+    if urlFile.lower().endswith('.zip'):
+        with open(urlFile, 'rb') as readFile:
+            yield from transformation.iter_location_chunks(takeout.open_location_history(readFile), chunkSize, stats)
+    else:
+        yield from transformation.iter_location_chunks(urlFile, chunkSize, stats)
+
+
+def _sorted_rows(rows):
+    # Rows sorted by time, latitude and longitude (exact duplicates are consecutive)
+    return rows[np.lexsort((rows['longitudeE7'], rows['latitudeE7'], rows['timestampMs']))]
+
+
+def write_runs(urlFiles, urlDirectory, chunkSize=transformation.CHUNK_SIZE, stats=None):
+    """
+    Write the locations of the exports urlFiles in sorted runs (binary files
+    of RUN_DTYPE rows) in urlDirectory. Return the list of run files; the
+    number of locations read and skipped is added to stats.
+    """
+    if stats is None:
+        stats = {}
+    stats.setdefault('locations', 0)
+    stats.setdefault('skipped', 0)
+    runs = []
+    for urlFile in urlFiles:
+        exportStats = {}
+        runFile = None
+        lastTimestampMs = None
+        try:
+            for chunk in _iter_export_chunks(urlFile, chunkSize, exportStats):
+                if len(chunk['timestampMs']) == 0:
+                    continue
+                rows = np.empty(len(chunk['timestampMs']), dtype=RUN_DTYPE)
+                for column in RUN_DTYPE.names:
+                    rows[column] = chunk[column]
+                rows = _sorted_rows(rows)
+                if runFile is None or rows['timestampMs'][0] < lastTimestampMs:
+                    if runFile is not None:
+                        runFile.close()
+                    runs.append(os.path.join(urlDirectory, 'run{}.bin'.format(len(runs))))
+                    runFile = open(runs[-1], 'wb')
+                rows.tofile(runFile)
+                lastTimestampMs = rows['timestampMs'][-1]
+        finally:
+            if runFile is not None:
+                runFile.close()
+        stats['locations'] += exportStats.get('locations', 0)
+        stats['skipped'] += exportStats.get('skipped', 0)
+    return runs
+
+
+@njit(cache=True)
+def duplicates_kernel(t, lat, lng, numberCarried, timeMs, distanceKm):
+    """
+    Mask of the fixes to keep of sorted fixes: a fix is dropped when a kept
+    fix at most timeMs ms before is within distanceKm km. The first
+    numberCarried fixes are kept fixes of the previous block.
+    """
+    keep = np.ones(len(t), dtype=np.bool_)
+    for i in range(numberCarried, len(t)):
+        j = i - 1
+        while j >= 0 and t[i] - t[j] <= timeMs:
+            if keep[j] and haversine_km_point(lat[j], lng[j], lat[i], lng[i]) <= distanceKm:
+                keep[i] = False
+                break
+            j -= 1
+    return keep
+
+
+def iter_merged_blocks(runs, stats=None, blockRows=MERGE_BLOCK_ROWS):
+    """
+    Merge the sorted runs (see write_runs) and yield blocks of RUN_DTYPE rows
+    sorted by time without duplicated fixes. The number of duplicates is
+    added to stats.
+    """
+    if stats is None:
+        stats = {}
+    stats.setdefault('duplicates', 0)
+    readers = [open(urlRun, 'rb') for urlRun in runs]
+    try:
+        buffers = [np.fromfile(reader, dtype=RUN_DTYPE, count=blockRows) for reader in readers]
+        carried = np.empty(0, dtype=RUN_DTYPE)
+        while any(len(buffer) for buffer in buffers):
+            # Rows up to the smallest last time of the buffers: later rows of every run come after them
+            bound = min(buffer['timestampMs'][-1] for buffer in buffers if len(buffer))
+            parts = [carried]
+            for i, buffer in enumerate(buffers):
+                size = np.searchsorted(buffer['timestampMs'], bound, side='right')
+                parts.append(buffer[:size])
+                buffers[i] = buffer[size:]
+                if len(buffers[i]) == 0:
+                    buffers[i] = np.fromfile(readers[i], dtype=RUN_DTYPE, count=blockRows)
+            rows = np.concatenate([parts[0], _sorted_rows(np.concatenate(parts[1:]))])
+            keep = duplicates_kernel(rows['timestampMs'], rows['latitudeE7'] / 1e7, rows['longitudeE7'] / 1e7, len(carried),
+                                     DUPLICATE_TIME_MS, DUPLICATE_DISTANCE_M / 1000)
+            stats['duplicates'] += int((~keep).sum())
+            # Carried fixes were yielded with the previous block; kept fixes of the last
+            # DUPLICATE_TIME_MS ms are compared with the next block
+            kept = rows[keep]
+            newRows = kept[len(carried):]
+            carried = kept[kept['timestampMs'] >= bound - DUPLICATE_TIME_MS]
+            yield newRows
+    finally:
+        for reader in readers:
+            reader.close()
+
+
+def _iter_chunks(blocks, chunkSize):
+    # Merged blocks joined in chunks of at least chunkSize rows (the last one can be smaller)
+    pending = []
+    numberPending = 0
+    for rows in blocks:
+        pending.append(rows)
+        numberPending += len(rows)
+        if numberPending >= chunkSize:
+            yield np.concatenate(pending)
+            pending = []
+            numberPending = 0
+    if numberPending > 0:
+        yield np.concatenate(pending)
+
+
+def merge_exports(urlFiles, urlSaveFile, chunkSize=transformation.CHUNK_SIZE):
+    """
+    Merge the GLH exports urlFiles (JSON files or Takeout archives) of one
+    participant into one transformed file urlSaveFile (CSV, Parquet or Arrow
+    given by the extension) sorted by time, without duplicated fixes.
+    Return the number of observations and the first and last datetime.
+    """
+    stats = {}
+    startDate = None
+    endDate = None
+    with tempfile.TemporaryDirectory(prefix='.merge', dir=os.path.dirname(os.path.abspath(urlSaveFile))) as urlDirectory:
+        runs = write_runs(urlFiles, urlDirectory, chunkSize, stats)
+        if stats['locations'] == 0:
+            msg = 'Empty JSON files'
+            raise RuntimeError(msg)
+        with storage.TableWriter(urlSaveFile) as writer:
+            for rows in _iter_chunks(iter_merged_blocks(runs, stats), chunkSize):
+                dataFrameChunk = transformation.chunk_to_dataframe({column: rows[column] for column in RUN_DTYPE.names})
+                if writer.numberRows == 0:
+                    startDate = dataFrameChunk.iloc[0, 0]
+                writer.write(dataFrameChunk)
+                endDate = dataFrameChunk.iloc[-1, 0]
+            numberObservations = writer.numberRows
+    if numberObservations == 0:
+        msg = 'No columns timestampMs (or timestamp), latitudeE7 or longitudeE7 in JSON Files'
+        raise RuntimeError(msg)
+    msg = "Merged {} exports: {} locations, {} skipped and {} duplicates".format(len(urlFiles), stats['locations'],
+                                                                                 stats['skipped'], stats['duplicates'])
+    print(msg)
+    logging.info(msg)
+    return numberObservations, startDate, endDate
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# PARAMETERS
+# Constants used to compute Activity Point Locations (APL)
+# get_parameters() returns a copy of the constants that can be overridden per run
+# =============================================================================
+
+# =============================================================================
+# # CONSTANTS DEFINITION
+# =============================================================================
+# Minimum number observations to process APL computation
+MIN_NUMBER_OBSERVATIONS = 100
+
+# Data zone limits (Ecuador)
+TOP_LAT =  1.426548
+LOW_LAT = -5.012636
+LEFT_LON = -81.011268
+RIGHT_LON = -75.199536
+
+# Study area (see geofence.py)
+# GeoJSON file or shapefile with the polygons of the study area (country, provinces, ...).
+# When set, it replaces the rectangle above as zone filter and every point gets the region
+# (property REGION_PROPERTY of its feature) in GPSTrackingData, APLData and SummaryData
+STUDY_AREA = None
+REGION_PROPERTY = None
+
+# COVID start date
+COVID_DATE = '2020-03-01'
+
+# COVID Restriction Calendar (see restrictions.py)
+# CSV file with the restriction periods (columns country, region, start, end, level) of
+# every country and region. None uses COVID_DATE and the periods CRL_P1..CRL_P4 below
+# (Ecuador). COUNTRY and REGION select the periods of the participant; periods of REGION
+# replace the periods of the whole country when the file has them
+RESTRICTION_CALENDAR = None
+COUNTRY = 'EC'
+REGION = None
+
+# COVID Restriction Levels 
+# First Period - Full Restrictions(Level 3)
+CRL_P1_START = '2020-03-01'
+CRL_P1_END = '2020-06-01'
+# Second Period - Middle restrictions(Level 2)
+CRL_P2_START = '2020-06-01'
+CRL_P2_END = '2020-07-01'
+# Third Period - Low restrictions(Level 1)
+CRL_P3_START = '2020-07-01'
+CRL_P3_END = '2020-12-01'
+# Fourth Period - Middle restrictions(Level 2)
+CRL_P4_START = '2020-12-01'
+CRL_P4_END = '2021-06-01'
+
+# Filter (scikit-mobility)
+# Filter out the trajectory points that are considered noise or outliers
+# Delete a trajectory point if the speed (in km/h) from the previous point is higher than MAX_SPEED_KMH
+MAX_SPEED_KMH = 200 #200 km/h
+
+# Compression (scikit-mobility)
+# Reduce the number of points in a trajectory for each individual
+# The minimum distance (in km) between consecutive compressed points is MIN_SPATIAL_RADIUS_KM
+MIN_SPATIAL_RADIUS_KM = 0.05 #50 meters
+
+# Trajectories (MovingPandas)
+# Create Trajectory from GeoDataFrame
+# The minimum length of Trajectory is MIN_LENGTH_TRAJ_MTR 
+MIN_LENGTH_TRAJ_MTR = 200 #200 meters 
+
+# Trips (MovingPandas)
+# Split trajectories into subtrajectories whenever there is a gap in the observations
+# The minimum gap is MIN_TIME_TRIP_GAP_THRESHOLD_MINUTES and minimum length of trip is MIN_LENGTH_TRIP_MTR
+MIN_TIME_TRIP_GAP_THRESHOLD_MINUTES = 30 #30 minutes
+MIN_LENGTH_TRIP_MTR = 100 #100 meters
+
+# Activity Point Location (scikit-mobility)
+# Detect stops for each individual in a Trip. 
+# A stop is detected when the individual spends at least MIN_MINUTES_FOR_A_STOP minutes within a distance MIN_STOP_RADIUS_FACTOR * MIN_SPATIAL_RADIUS_KM_STOP km 
+# The stop’s coordinates are the median latitude and longitude values of the points found within the specified distance
+MIN_MINUTES_FOR_A_STOP = 5 #5 Minutes
+MIN_STOP_RADIUS_FACTOR = 1
+MIN_SPATIAL_RADIUS_KM_STOP = 1 #1*1 = 1 km 
+
+# Clusters (scikit-mobility)
+# Cluster the stops of each individual
+# Cluster correspond to visits to the same location at different times, based on spatial proximity. Minimum points are MIN_SAMPLES_CLUSTER and proximity MIN_CLUSTER_RADIUS_KM
+# The clustering algorithm used is DBSCAN
+MIN_SAMPLES_CLUSTER=1
+MIN_CLUSTER_RADIUS_KM = 0.05 #50 meters
+
+PARAMETER_NAMES = ('MIN_NUMBER_OBSERVATIONS', 'TOP_LAT', 'LOW_LAT', 'LEFT_LON', 'RIGHT_LON', 'STUDY_AREA',
+                   'REGION_PROPERTY', 'COVID_DATE',
+                   'RESTRICTION_CALENDAR', 'COUNTRY', 'REGION', 'CRL_P1_START', 'CRL_P1_END', 'CRL_P2_START', 'CRL_P2_END', 'CRL_P3_START', 'CRL_P3_END',
+                   'CRL_P4_START', 'CRL_P4_END', 'MAX_SPEED_KMH', 'MIN_SPATIAL_RADIUS_KM', 'MIN_LENGTH_TRAJ_MTR',
+                   'MIN_TIME_TRIP_GAP_THRESHOLD_MINUTES', 'MIN_LENGTH_TRIP_MTR', 'MIN_MINUTES_FOR_A_STOP',
+                   'MIN_STOP_RADIUS_FACTOR', 'MIN_SPATIAL_RADIUS_KM_STOP', 'MIN_SAMPLES_CLUSTER', 'MIN_CLUSTER_RADIUS_KM')
+
+
+def get_parameters(**overrides):
+    """
+    Return a dictionary with the constants of this module. Keyword arguments
+    replace the value of a constant for one run.
+    """
+    params = {name: globals()[name] for name in PARAMETER_NAMES}
+    for name, value in overrides.items():
+        if name not in params:
+            msg = 'Unknown parameter {}'.format(name)
+            raise KeyError(msg)
+        params[name] = value
+    return params
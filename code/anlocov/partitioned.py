@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# OUT-OF-CORE PROCESSING BY TIME PARTITION
+# Compute the APL of a transformed file too large to be held in memory
+# (multi-year histories). The file is read in partitions of PARTITION_ROWS
+# rows in time order (the transformation stage writes it sorted by time) and
+# every stage runs on each partition carrying its state to the next one:
+# - the filter and compression carry the points whose decision depends on the
+#   next partition and the open group (filtering.FilterCompressStream),
+# - the compressed points are written in GPSTrackingData_ as they are final,
+#   adding their coordinates for the gravity point of the anonymisation,
+# - trips and stops are computed (or read from the week checkpoints) for the
+#   weeks that are complete, i.e. once a point of a later week is final; the
+#   points of the current week are carried,
+# - only the stops and the trips summary of each week are kept.
+# At the end the stops of every week are clustered, the summaries are joined
+# and GPSTrackingData is written from GPSTrackingData_ in a second pass.
+# Peak memory is bounded by a partition, one week of points and the stops,
+# and the outputs are the ones of processing.compute_apl (up to the rounding
+# of the gravity point).
+# =============================================================================
+import logging, os
+
+import pandas as pd
+
+from anlocov import checkpoint, export, filtering, processing, storage, summary
+
+# =============================================================================
+# # CONSTANTS DEFINITION
+# =============================================================================
+# Rows of each partition of the transformed file
+PARTITION_ROWS = 1000000
+
+
+def iter_partitions(urlFile, partitionRows=PARTITION_ROWS):
+    """
+    Yield the partitions of urlFile (columns datetime, latitude and
+    longitude) sorted by datetime. Raise an error when a partition starts
+    before the end of the previous one (file not sorted by time).
+    """
+    lastDatetime = None
+    for dfPartition in storage.iter_table(urlFile, partitionRows):
+        processing.validate_columns(dfPartition)
+        dfPartition['datetime'] = pd.to_datetime(dfPartition['datetime'], format='ISO8601')
+        dfPartition = dfPartition.sort_values('datetime', kind='mergesort', ignore_index=True)
+        if dfPartition.empty:
+            continue
+        if lastDatetime is not None and dfPartition['datetime'].iloc[0] < lastDatetime:
+            msg = 'File {} is not sorted by datetime ({} after {}). Process it without partitions'.format(
+                os.path.basename(urlFile), dfPartition['datetime'].iloc[0], lastDatetime)
+            raise RuntimeError(msg)
+        lastDatetime = dfPartition['datetime'].iloc[-1]
+        yield dfPartition
+
+
+class WeekState:
+    """
+    Weeks of the participant computed so far: week files of the checkpoints,
+    stops and trips summaries of the weeks with trajectories (numWeek is
+    their order)
+    """
+
+    def __init__(self):
+        self.numberWeeks = 0
+        self.numberNewWeeks = 0
+        self.weekFiles = set()
+        self.stops = []
+        self.tripsSummaries = []
+        self.hasTrips = False
+
+    @property
+    def numberTrajectoryWeeks(self):
+        return len(self.tripsSummaries)
+
+
+def compute_complete_weeks(dfWeekPoints, weekState, params, urlCheckpoints, weekExecutor, weekWorkers, runReport):
+    """
+    Compute the trips and stops of the weeks of dfWeekPoints (output of
+    processing.week_points) and add them to weekState
+    """
+    weeks = processing.compute_week_trips_stops(dfWeekPoints, params, urlCheckpoints, weekExecutor, weekWorkers, runReport)
+    newWeeks = [week for week in weeks if week.get('new')]
+    weekState.numberWeeks += len(weeks)
+    weekState.numberNewWeeks += len(newWeeks)
+    if urlCheckpoints is not None:
+        with runReport.stage('checkpointSave', len(newWeeks)) as record:
+            for week in newWeeks:
+                checkpoint.save_week(urlCheckpoints, week['idWeek'], week['hash'], week['hasTrajectory'], week['trips'], week['stops'])
+            weekState.weekFiles.update(checkpoint.get_week_file(week['idWeek'], week['hash']) for week in weeks)
+            record['rowsOut'] = len(newWeeks)
+    with runReport.stage('summaries', len(weeks)) as record:
+        for week in weeks:
+            if not week['hasTrajectory']:
+                continue
+            # numWeek is the order of the week among the weeks with trajectories
+            numWeek = weekState.numberTrajectoryWeeks
+            dfTrips = week['trips']
+            if dfTrips is not None:
+                dfTrips['numWeek'] = numWeek
+                weekState.hasTrips = True
+            if week['stops'] is not None:
+                week['stops']['numWeek'] = numWeek
+                weekState.stops.append(week['stops'])
+            weekState.tripsSummaries.append(summary.trips_summary(dfTrips) if dfTrips is not None else None)
+        record['rowsOut'] = weekState.numberTrajectoryWeeks
+
+
+def process_partitions(urlFile, urlParticipant, idFile, params, outputFormat='csv', urlCheckpoints=None,
+                       weekExecutor='process', weekWorkers=None, runReport=None, partitionRows=PARTITION_ROWS,
+                       compression=None):
+    """
+    Compute and write GPSTrackingData, APLData and SummaryData of the
+    transformed file urlFile in urlParticipant reading it in partitions of
+    partitionRows rows (see processing.process_csv_file). Return the number
+    of APL.
+    """
+    stream = filtering.FilterCompressStream(maxSpeedKmh=params['MAX_SPEED_KMH'], includeLoops=True,
+                                            spatialRadiusKm=params['MIN_SPATIAL_RADIUS_KM'])
+    weekState = WeekState()
+    urlGPSTracking = os.path.join(urlParticipant, storage.get_file_name('GPSTrackingData_', outputFormat, compression))
+    urlGPSTrackingPartial = os.path.join(urlParticipant, storage.get_file_name('GPSTrackingData_.partial', outputFormat,
+                                                                               compression))
+    gravitySums = {'lat': 0., 'lon': 0., 'points': 0}
+    dfWeekPoints = None
+    dfTemplate = None
+    numberRows = 0
+
+    def add_compressed(dfSkmob, final):
+        # Write the final compressed points and compute the weeks they complete
+        nonlocal dfWeekPoints
+        if not dfSkmob.empty:
+            dfGPSTracking = processing.gps_tracking_data(dfSkmob)
+            with runReport.stage('export', len(dfGPSTracking)) as record:
+                writer.write(dfGPSTracking)
+                record['rowsOut'] = len(dfGPSTracking)
+            gravitySums['lat'] += dfGPSTracking['lat'].sum()
+            gravitySums['lon'] += dfGPSTracking['lon'].sum()
+            gravitySums['points'] += len(dfGPSTracking)
+            dfPoints = processing.week_points(dfSkmob, runReport)
+            dfWeekPoints = dfPoints if dfWeekPoints is None else pd.concat([dfWeekPoints, dfPoints])
+        if dfWeekPoints is None or stream.numberPoints < params['MIN_NUMBER_OBSERVATIONS']:
+            return
+        if final:
+            dfComplete, dfWeekPoints = dfWeekPoints, None
+        else:
+            # A week is complete when points of a later week are final
+            complete = (dfWeekPoints['idWeek'] < dfWeekPoints['idWeek'].iloc[-1]).to_numpy()
+            dfComplete, dfWeekPoints = dfWeekPoints[complete], dfWeekPoints[~complete]
+        if not dfComplete.empty:
+            compute_complete_weeks(dfComplete, weekState, params, urlCheckpoints, weekExecutor, weekWorkers, runReport)
+
+    try:
+        with storage.TableWriter(urlGPSTrackingPartial, compression) as writer:
+            for dfPartition in iter_partitions(urlFile, partitionRows):
+                numberRows += len(dfPartition)
+                dfSkmob = processing.prepare_points(dfPartition, params, idFile, runReport)
+                dfTemplate = dfSkmob.iloc[:0]
+                with runReport.stage('filterCompress', len(dfSkmob)) as record:
+                    dfSkmob = stream.push(dfSkmob)
+                    record['rowsOut'] = len(dfSkmob)
+                add_compressed(dfSkmob, final=False)
+            if numberRows == 0:
+                msg = 'Empty JSON file'
+                raise RuntimeError(msg)
+            with runReport.stage('filterCompress', 0) as record:
+                dfSkmob = stream.push(dfTemplate, final=True)
+                record['rowsOut'] = len(dfSkmob)
+                record['dropped'] = stream.stats
+            msg = "Source Dataset contains {} records ".format(stream.numberPoints)
+            print(msg)
+            logging.info(msg)
+            if stream.numberPoints < params['MIN_NUMBER_OBSERVATIONS']:
+                msg = "File {} has few observations: {}".format(idFile, stream.numberPoints)
+                raise RuntimeError(msg)
+            msg = "Filter dropped {} records by speed and {} records by loops. Compression merged {} records".format(
+                stream.stats['speed'], stream.stats['loops'], stream.stats['compression'])
+            print(msg)
+            logging.info(msg)
+            add_compressed(dfSkmob, final=True)
+    except Exception:
+        if os.path.exists(urlGPSTrackingPartial):
+            os.remove(urlGPSTrackingPartial)
+        raise
+    msg = "Filter dataset contains {} records ".format(gravitySums['points'])
+    print(msg)
+    logging.info(msg)
+    msg = "Dataset contain {} of {} weeks with trajectories".format(weekState.numberTrajectoryWeeks, weekState.numberWeeks)
+    print(msg)
+    logging.info(msg)
+    if urlCheckpoints is not None:
+        with runReport.stage('checkpointSave', 0) as record:
+            record['removed'] = checkpoint.remove_stale_weeks(urlCheckpoints, weekState.weekFiles)
+        msg = "Checkpoints: {} weeks computed and {} weeks reused".format(weekState.numberNewWeeks,
+                                                                         weekState.numberWeeks - weekState.numberNewWeeks)
+        print(msg)
+        logging.info(msg)
+    if not weekState.hasTrips:
+        os.remove(urlGPSTrackingPartial)
+        msg = "File {} has no trips".format(idFile)
+        raise RuntimeError(msg)
+    os.replace(urlGPSTrackingPartial, urlGPSTracking)
+
+    # =============================================================================
+    # CLUSTER, APLData and SummaryData of the stops and trips summaries of every week
+    # =============================================================================
+    dfAPL = processing.cluster_stops(pd.concat(weekState.stops, ignore_index=True), params, runReport)
+    with runReport.stage('summaries', len(dfAPL)) as record:
+        dfTripsSummary = pd.concat([dfSummary for dfSummary in weekState.tripsSummaries if dfSummary is not None],
+                                   ignore_index=True)
+        dfSummary = summary.merge_summaries(dfTripsSummary, summary.stops_clusters_summary(dfAPL))
+        record['rowsOut'] = len(dfSummary)
+    dfAPL, dfSummary = processing.apl_summary_data(dfAPL, dfSummary)
+
+    # =============================================================================
+    # Anonymisation (see processing.anonymise) and export (see export.py).
+    # GPSTrackingData is read again from GPSTrackingData_ in partitions
+    # =============================================================================
+    with runReport.stage('anonymise', len(dfAPL)) as record:
+        clusterPoint = processing.cluster_point(dfAPL)
+        record['rowsOut'] = len(dfAPL)
+    gravityPoint = (gravitySums['lat'] / gravitySums['points'], gravitySums['lon'] / gravitySums['points'])
+    with export.Exporter(urlParticipant, outputFormat, compression, chunkRows=partitionRows) as exporter:
+        exporter.export(dfAPL, [('APLData_', None), ('APLData', clusterPoint)])
+        exporter.export(dfSummary, [('SummaryData', None)])
+        exporter.export(storage.iter_table(urlGPSTracking, partitionRows), [('GPSTrackingData', gravityPoint)])
+        with runReport.stage('export', 2 * len(dfAPL) + len(dfSummary) + gravitySums['points']) as record:
+            record['rowsOut'] = exporter.close()
+    return len(dfAPL)
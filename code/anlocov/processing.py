@@ -0,0 +1,468 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# APL PROCESSING
+# Compute Activity Point Locations (APL) of one participant (idFile)
+# Outputs are stored in the participant directory dataFinal/<idFile>
+# Internal representation: every stage between prepare_points and the outputs
+# works on one frame of points with the schema
+#   uid                           categorical (idFile)
+#   datetime                      datetime64, parsed once by prepare_points
+#   lat, lng                      float64
+#   covidStatus, restrictionLevel int8
+#   region                        categorical, with a study area
+# From week_points on, datetime is the index t (the column is dropped) and
+# idWeek is the int32 code of the week (trips.week_codes); the idWeek labels
+# of the outputs are only built for the trips. The columns are renamed once
+# when the points are prepared and once for the outputs (gps_tracking_data,
+# apl_summary_data); with copy-on-write, renames and column selections do not
+# copy the data. Data derived from the points is kept with them: trips carry
+# the haversine distance from the previous point of the trip (stepKm), used
+# again by the trips summary.
+# =============================================================================
+import logging, os
+
+import pandas as pd
+import numpy as np
+
+from anlocov import (checkpoint, clustering, export, filtering, geofence, parameters, report, restrictions, storage, summary,
+                     trips)
+
+# =============================================================================
+# # CONSTANTS DEFINITION
+# =============================================================================
+# idFile of the data computed with compute_apl when none is given
+DEFAULT_ID_FILE = 'participant'
+
+
+def get_participant_directory(urlDataFinal, idFile):
+    """
+    Return (and create) the directory where the outputs of idFile are stored
+    """
+    urlParticipant = os.path.join(urlDataFinal, idFile)
+    os.makedirs(urlParticipant, exist_ok=True)
+    return urlParticipant
+
+
+def get_id_file(urlFile):
+    """
+    Return idFile (file name without extension) of the CSV, Parquet or Arrow
+    file urlFile (output of the transformation stage)
+    """
+    csvFileName = os.path.basename(urlFile)
+    # Validate file extension
+    idFile, inputFormat = storage.split_file_name(csvFileName)
+    if inputFormat is None:
+        msg = 'Wrong file extension ({})'.format(csvFileName)
+        raise RuntimeError(msg)
+    return idFile
+
+
+def validate_columns(dfSource):
+    """
+    Raise an error when the columns datetime, latitude or longitude are missing
+    """
+    # Validate columns datetime, latitude and longitude exists in CSV structure
+    if(not(('datetime' in dfSource.columns) and ('latitude' in dfSource.columns) and ('longitude' in dfSource.columns))):
+        msg = 'No columns datetime, latitude or longitude in CSV File'
+        raise RuntimeError(msg)
+
+
+def read_source_file(urlFile):
+    """
+    Read the CSV, Parquet or Arrow file urlFile (output of the transformation
+    stage). Return idFile and the DataFrame.
+    """
+    idFile = get_id_file(urlFile)
+    # Read file (memory mapped for Parquet and Arrow) and store in a Dataframe
+    return idFile, storage.read_table(urlFile)
+
+
+def prepare_points(df, params, idFile, runReport):
+    """
+    Zone filter and COVID labelling of the points df (columns datetime,
+    latitude and longitude, and idFile when idFile is None). Return the
+    points in the internal columns uid, datetime, lat, lng, covidStatus and
+    restrictionLevel, and region when the parameters have a study area.
+    """
+    # Zone filter: polygons of the study area (see anlocov/geofence.py) or rectangle
+    with runReport.stage('zoneFilter', len(df)) as record:
+        studyArea = geofence.get_geofence(params)
+        if studyArea is None:
+            df = df[df.latitude.between(params['LOW_LAT'], params['TOP_LAT']).to_numpy()
+                    & df.longitude.between(params['LEFT_LON'], params['RIGHT_LON']).to_numpy()]
+        else:
+            region = studyArea.label(df['latitude'].to_numpy(), df['longitude'].to_numpy())
+            inside = region != geofence.OUTSIDE
+            df = df[inside]
+            df['region'] = pd.Categorical.from_codes(region[inside], categories=studyArea.regionIds)
+            record['studyArea'] = studyArea.name
+        record['rowsOut'] = len(df)
+    # COVID status and restriction level of the calendar of the participant (see anlocov/restrictions.py)
+    with runReport.stage('covidLabelling', len(df)) as record:
+        calendar = restrictions.get_calendar(params)
+        if not pd.api.types.is_datetime64_dtype(df['datetime']):
+            df['datetime'] = pd.to_datetime(df['datetime'], format='ISO8601')
+        if idFile is not None:
+            df['idFile'] = pd.Categorical.from_codes(np.zeros(len(df), dtype=np.int8), categories=[idFile])
+        t = df['datetime'].to_numpy().astype('datetime64[ns]').astype(np.int64)
+        df['covidStatus'], df['restrictionLevel'] = calendar.label(t)
+        record['calendar'] = calendar.name
+        df = df[['idFile','datetime', 'latitude', 'longitude','covidStatus','restrictionLevel'] + _region_columns(df)]
+        df = df.rename(columns = {'idFile': 'uid', 'latitude': 'lat', 'longitude': 'lng'})
+        record['rowsOut'] = len(df)
+    return df
+
+
+def _region_columns(df):
+    # region is an output column when the points have a study area
+    return ['region'] if 'region' in df.columns else []
+
+
+def gps_tracking_data(dfSkmob):
+    """
+    GPSTrackingData of the filtered and compressed points
+    """
+    dfGPSTracking = dfSkmob.rename(columns = {'uid': 'idFile', 'lng': 'lon'})
+    return dfGPSTracking[['idFile','datetime', 'lat', 'lon','covidStatus','restrictionLevel'] + _region_columns(dfGPSTracking)]
+
+
+def week_points(dfSkmob, runReport):
+    """
+    Index the filtered and compressed points by time (the datetime column
+    becomes the index t) and add the week code (idWeek) of each point
+    """
+    with runReport.stage('trajectories', len(dfSkmob)) as record:
+        dfSkmob = dfSkmob.set_index('datetime').rename_axis('t').tz_localize(None)
+        dfSkmob['idWeek'] = trips.week_codes(dfSkmob.index.to_numpy().astype('datetime64[ns]').astype(np.int64))
+        record['rowsOut'] = len(dfSkmob)
+    return dfSkmob
+
+
+def compute_week_trips_stops(dfSkmob, params, urlCheckpoints, weekExecutor, weekWorkers, runReport):
+    """
+    Trips and stops of every week of dfSkmob (output of week_points). Return
+    one dict per week (idWeek, hash, hasTrajectory, trips, stops and new when
+    the week was computed); with urlCheckpoints, unchanged weeks are read
+    from the checkpoints.
+    """
+    checkpoints = urlCheckpoints is not None
+    with runReport.stage('checkpointLoad', len(dfSkmob)) as record:
+        weeks = []
+        dfNewWeeks = []
+        for idWeek, dfWeek in dfSkmob.groupby('idWeek', sort=True):
+            weekHash = checkpoint.week_hash(dfWeek, params)
+            weekCheckpoint = checkpoint.load_week(urlCheckpoints, idWeek, weekHash) if checkpoints else None
+            if weekCheckpoint is None:
+                weekCheckpoint = {'hash': weekHash, 'new': True}
+                dfNewWeeks.append(dfWeek)
+            weekCheckpoint['idWeek'] = idWeek
+            weeks.append(weekCheckpoint)
+        record['rowsOut'] = sum(len(dfWeek) for dfWeek in dfNewWeeks)
+        record['weeks'] = len(weeks)
+        record['newWeeks'] = len(dfNewWeeks)
+    # Trips and stops of a week are computed together in the week workers
+    with runReport.stage('tripsStops', sum(len(dfWeek) for dfWeek in dfNewWeeks)) as record:
+        newResults = iter(trips.compute_weeks(dfNewWeeks, params, executor=weekExecutor, maxWorkers=weekWorkers))
+        for week in weeks:
+            if week.get('new'):
+                week['hasTrajectory'], week['trips'], week['stops'] = next(newResults)
+        record['rowsOut'] = sum(len(week['trips']) for week in weeks if week.get('new') and week['trips'] is not None)
+        record['stops'] = sum(len(week['stops']) for week in weeks if week.get('new') and week['stops'] is not None)
+    return weeks
+
+
+def cluster_stops(dfTrajTripsStops, params, runReport):
+    """
+    Cluster the APL of the participant (see anlocov/clustering.py)
+    """
+    try:
+        with runReport.stage('cluster', len(dfTrajTripsStops)) as record:
+            dfTrajTripsStopsClusters = clustering.cluster_apl(dfTrajTripsStops, clusterRadiusKm=params['MIN_CLUSTER_RADIUS_KM'],
+                                                              minSamples=params['MIN_SAMPLES_CLUSTER'])
+            record['rowsOut'] = len(dfTrajTripsStopsClusters)
+            record['clusters'] = int(dfTrajTripsStopsClusters['cluster'].max()) + 1
+    except Exception as e:
+        msg = 'Not possible to compute clusters: {}'.format(e)
+        print(msg)
+        logging.error(msg)
+        raise RuntimeError(msg) from e
+    numberNoise = int((dfTrajTripsStopsClusters['cluster'] < 0).sum())
+    if numberNoise > 0:
+        msg = '{} APL do not belong to any cluster (cluster -1)'.format(numberNoise)
+        print(msg)
+        logging.warning(msg)
+    return dfTrajTripsStopsClusters
+
+
+def apl_summary_data(dfAPL, dfSummary):
+    """
+    Columns of APLData and SummaryData
+    """
+    dfAPL = dfAPL.rename(columns = {'uid': 'idFile', 'lng':'lon'})
+    dfAPL = dfAPL[['idFile', 'idWeek', 'idTrip', 'datetime','lat', 'lon', 'cluster', 'covidStatus', 'restrictionLevel']
+                  + _region_columns(dfAPL)]
+    dfSummary = dfSummary[['idFile', 'idWeek', 'idTrip', 'GPSPoints', 'APLs', 'clusters', 'covidStatus', 'restrictionLevel']
+                          + _region_columns(dfSummary)]
+    return dfAPL, dfSummary
+
+
+def compute_apl(dfSource, params=None, idFile=DEFAULT_ID_FILE, urlCheckpoints=None, weekExecutor=trips.WEEK_EXECUTOR,
+                weekWorkers=None, runReport=None, exporter=None):
+    """
+    Compute GPSTrackingData, APLData and SummaryData of dfSource (columns
+    datetime, latitude and longitude, as returned by
+    transformation.transform_glh) before anonymisation (see anonymise).
+    With urlCheckpoints, trips and stops of each week are stored in that
+    directory and only the weeks that changed are computed, with
+    weekExecutor ('process' pool of weekWorkers processes or 'serial').
+    Time, memory and rows of each stage are recorded in runReport
+    (report.RunReport). With exporter (export.Exporter), GPSTrackingData_
+    and GPSTrackingData are written while trips and stops are computed.
+    Return (dfGPSTracking, dfAPL, dfSummary).
+    """
+    if params is None:
+        params = parameters.get_parameters()
+    if runReport is None:
+        runReport = report.RunReport(idFile)
+    runReport.parameters = params
+    # Validate source has data
+    if(dfSource.empty):
+        msg = 'Empty JSON file'
+        raise RuntimeError(msg)
+    validate_columns(dfSource)
+    dfSkmob = prepare_points(dfSource, params, idFile, runReport)
+    msg = "Source Dataset contains {} records ".format(len(dfSkmob))
+    print(msg)
+    logging.info(msg)
+    if len(dfSkmob) < params['MIN_NUMBER_OBSERVATIONS']:
+        msg = "File {} has few observations: {}".format(idFile, len(dfSkmob))
+        raise RuntimeError(msg)
+
+    # =============================================================================
+    # FILTERING
+    # Filter out all points with a speed (in km/h) from the previous point higher than 200 km/h
+    # COMPRESSION
+    # Compress the number of points in a trajectory for each individual in a TrajDataFrame.
+    # All points within a radius of `spatial_radius_km` kilometers from a given initial point are
+    # compressed into a single point that has the median coordinates of all points and
+    # the time of the initial point. - 50m
+    # Both stages run in one pass over the arrays of the dataset
+    # =============================================================================
+    with runReport.stage('filterCompress', len(dfSkmob)) as record:
+        dfSkmob, droppedPoints = filtering.filter_compress(dfSkmob, maxSpeedKmh=params['MAX_SPEED_KMH'], includeLoops=True,
+                                                           spatialRadiusKm=params['MIN_SPATIAL_RADIUS_KM'])
+        record['rowsOut'] = len(dfSkmob)
+        record['dropped'] = droppedPoints
+    msg = "Filter dropped {} records by speed and {} records by loops. Compression merged {} records".format(
+        droppedPoints['speed'], droppedPoints['loops'], droppedPoints['compression'])
+    print(msg)
+    logging.info(msg)
+
+    # =============================================================================
+    # FIRST DATASET GPSTrackingData
+    # =============================================================================
+    dfGPSTracking = gps_tracking_data(dfSkmob)
+    if exporter is not None:
+        exporter.export(dfGPSTracking, [('GPSTrackingData_', None), ('GPSTrackingData', gravity_point(dfGPSTracking))])
+
+    # =============================================================================
+    # TRAJECTORIES
+    # Compute weekly Trajectories
+    # Desired minimum length of trajectories 200m
+    # =============================================================================
+    dfSkmob = week_points(dfSkmob, runReport)
+    msg = "Filter dataset contains {} records ".format(len(dfSkmob))
+    print(msg)
+    logging.info(msg)
+    msg = "Dataset covers the time between {} and {}.".format(dfSkmob.index.min(), dfSkmob.index.max())
+    print(msg)
+    logging.info(msg)
+    msg = "That's {}".format(dfSkmob.index.max() - dfSkmob.index.min())
+    print(msg)
+    logging.info(msg)
+
+    # =============================================================================
+    # TRIPS
+    # Compute Trips in each trajectory
+    # Time gap threshold - 30 minutes
+    # Minimun distance for trips 100 mtr
+    # ACTIVITY POINT LOCATIONS
+    # Detect the stops (APL) for each individual in a TrajDataFrame (each Trip in a Trajectory).
+    # APL is detected when the individual spends at least MINUTES_FOR_A_STOP minutes (5 minutes)
+    # within a distance `stop_radius_factor * spatial_radius` km from a given trajectory point.
+    # The stop's coordinates are the median latitude and longitude values of the points found
+    # within the specified distance
+    # Weeks are independent: trips and stops of the weeks whose points and
+    # constants did not change are read from the week checkpoints, the other
+    # weeks are computed with weekExecutor (see anlocov/trips.py)
+    # =============================================================================
+    allWeeks = compute_week_trips_stops(dfSkmob, params, urlCheckpoints, weekExecutor, weekWorkers, runReport)
+    weeks = [week for week in allWeeks if week['hasTrajectory']]
+    msg = "Dataset contain {} of {} weeks with trajectories".format(len(weeks), len(allWeeks))
+    print(msg)
+    logging.info(msg)
+    if urlCheckpoints is not None:
+        numberNewWeeks = sum(1 for week in allWeeks if week.get('new'))
+        with runReport.stage('checkpointSave', numberNewWeeks) as record:
+            weekFiles = set()
+            for week in allWeeks:
+                if week.get('new'):
+                    checkpoint.save_week(urlCheckpoints, week['idWeek'], week['hash'], week['hasTrajectory'], week['trips'], week['stops'])
+                weekFiles.add(checkpoint.get_week_file(week['idWeek'], week['hash']))
+            record['rowsOut'] = len(weekFiles)
+            record['removed'] = checkpoint.remove_stale_weeks(urlCheckpoints, weekFiles)
+        msg = "Checkpoints: {} weeks computed and {} weeks reused".format(numberNewWeeks, len(allWeeks) - numberNewWeeks)
+        print(msg)
+        logging.info(msg)
+    # numWeek is the order of the week among the weeks with trajectories
+    for i, week in enumerate(weeks):
+        for frame in ['trips', 'stops']:
+            if week[frame] is not None:
+                week[frame]['numWeek'] = i
+    if not any(week['trips'] is not None for week in weeks):
+        msg = "File {} has no trips".format(idFile)
+        raise RuntimeError(msg)
+    dfTrajTrips = pd.concat([week['trips'] for week in weeks if week['trips'] is not None])
+    dfTrajTrips = dfTrajTrips.sort_index()
+    dfTrajTripsStops = pd.concat([week['stops'] for week in weeks if week['stops'] is not None], ignore_index=True)
+
+    # =============================================================================
+    # CLUSTER
+    # Cluster APL of each individual.
+    # The Cluster correspond to visit same location at different times, based on spatial proximity (50 meters)
+    # The Clustering algorithm used is DBSCAN (see anlocov/clustering.py).
+    # =============================================================================
+    dfTrajTripsStopsClusters = cluster_stops(dfTrajTripsStops, params, runReport)
+
+    # =============================================================================
+    # SECOND DATASET APLData
+    # =============================================================================
+    dfAPL = dfTrajTripsStopsClusters
+
+    # =============================================================================
+    # THIRD DATASET SummaryData
+    # =============================================================================
+    # Trips, Stops and Cluster Summary grouped by idFile, idWeek and idTrip
+    with runReport.stage('summaries', len(dfTrajTrips)) as record:
+        dfSummary = summary.summary_data(dfTrajTrips, dfAPL)
+        record['rowsOut'] = len(dfSummary)
+    dfAPL, dfSummary = apl_summary_data(dfAPL, dfSummary)
+    return dfGPSTracking, dfAPL, dfSummary
+
+
+def gravity_point(dfGPSTracking):
+    """
+    Return the point (lat, lon) of GPSTrackingData moved to (0,0) by the
+    anonymisation
+    """
+    # =============================================================================
+    # GRAVITY ANONYMISATION
+    # Data Anonymisation is based on Gravity Point
+    # Gravity point (GP) is the mean latitute and longitude of all dataset
+    # Anonimyzation consist to move GP to the center of the world (0,0)
+    # =============================================================================
+    return dfGPSTracking['lat'].mean(), dfGPSTracking['lon'].mean()
+
+
+def cluster_point(dfAPL):
+    """
+    Return the point (lat, lon) of APLData moved to (0,0) by the
+    anonymisation
+    """
+    # =============================================================================
+    # CLUSTER ANONYMISATION
+    # Data Anonymisation is based on Clusters identification
+    # Most Visited Place (MVP) is Cluster 0
+    # Anonimyzation consist to translate MVP to the center of the world (0,0)
+    # =============================================================================
+    dfReferencePoint = dfAPL[dfAPL['cluster']==0]
+    return dfReferencePoint['lat'].mean(), dfReferencePoint['lon'].mean()
+
+
+def anonymise(dfGPSTracking, dfAPL):
+    """
+    Return anonymised copies of GPSTrackingData and APLData (output of
+    compute_apl)
+    """
+    dfGPSTracking = shift_coordinates(dfGPSTracking, *gravity_point(dfGPSTracking))
+    dfAPL = shift_coordinates(dfAPL, *cluster_point(dfAPL))
+    return dfGPSTracking, dfAPL
+
+
+def shift_coordinates(df, lat, lon):
+    """
+    Return a copy of df (columns lat and lon) with the point lat, lon moved
+    to the center of the world (0,0)
+    """
+    df = df.copy()
+    df['lon'] = df['lon'] - lon
+    df['lat'] = df['lat'] - lat
+    return df
+
+
+def process_csv_file(urlFile, urlDataFinal, params=None, outputFormat='csv', checkpoints=True,
+                     weekExecutor=trips.WEEK_EXECUTOR, weekWorkers=None, traceMemory=False, partitionRows=None,
+                     compression=None):
+    """
+    Compute GPSTrackingData, APLData and SummaryData of the CSV, Parquet or
+    Arrow file urlFile (output of the transformation stage). Outputs are
+    written in outputFormat (csv, parquet or arrow) in dataFinal/<idFile>,
+    before (GPSTrackingData_, APLData_) and after anonymisation, compressed
+    with compression (None, gzip or zstd, see storage.py). With
+    checkpoints, trips and stops of each week are stored in
+    dataFinal/<idFile>/checkpoints (see compute_apl). The run report of every
+    stage (see report.py, tracemalloc with traceMemory) is written in
+    dataFinal/<idFile>/RunReport.json, also when the computation fails.
+    With partitionRows, the file is read and processed in time-ordered
+    partitions of partitionRows rows, so its size is not limited by the
+    memory (see partitioned.py). Return the number of APL.
+    """
+    idFile = get_id_file(urlFile)
+    urlParticipant = get_participant_directory(urlDataFinal, idFile)
+    runReport = report.RunReport(idFile, traceMemory)
+    error = None
+    try:
+        urlCheckpoints = checkpoint.get_checkpoint_directory(urlParticipant) if checkpoints else None
+        if partitionRows:
+            from anlocov import partitioned
+            if params is None:
+                params = parameters.get_parameters()
+            runReport.parameters = params
+            numberAPL = partitioned.process_partitions(urlFile, urlParticipant, idFile, params, outputFormat, urlCheckpoints,
+                                                       weekExecutor, weekWorkers, runReport, partitionRows, compression)
+        else:
+            with runReport.stage('load') as record:
+                idFile, dfSource = read_source_file(urlFile)
+                record['rowsOut'] = len(dfSource)
+            # =============================================================================
+            # Export Data before and after Anonymisation: each output is written with the
+            # anonymised one in a background thread while the computation goes on
+            # =============================================================================
+            with export.Exporter(urlParticipant, outputFormat, compression) as exporter:
+                dfGPSTracking, dfAPL, dfSummary = compute_apl(dfSource, params, idFile, urlCheckpoints, weekExecutor,
+                                                              weekWorkers, runReport, exporter)
+                with runReport.stage('anonymise', len(dfAPL)) as record:
+                    clusterPoint = cluster_point(dfAPL)
+                    record['rowsOut'] = len(dfAPL)
+                exporter.export(dfAPL, [('APLData_', None), ('APLData', clusterPoint)])
+                exporter.export(dfSummary, [('SummaryData', None)])
+                with runReport.stage('export', 2 * len(dfGPSTracking) + 2 * len(dfAPL) + len(dfSummary)) as record:
+                    record['rowsOut'] = exporter.close()
+                    record['compression'] = compression
+            numberAPL = len(dfAPL)
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        runReport.close(error)
+        runReport.write(os.path.join(urlParticipant, report.REPORT_FILE))
+    msg = "Computation succed!! {} contains {} APL".format(os.path.basename(urlFile), numberAPL)
+    print(msg)
+    logging.info(msg)
+    msg = "Run report: {} seconds, slowest stage {}".format(runReport.seconds, runReport.hot_stage())
+    print(msg)
+    logging.info(msg)
+    return numberAPL
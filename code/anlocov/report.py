@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# RUN REPORT
+# Time, memory and row counts of each stage of the APL computation of one
+# participant, written as a JSON file (dataFinal/<idFile>/RunReport.json).
+# Each stage records the rows it receives and the rows it returns, the
+# seconds it takes, the resident memory (RSS) of the process at its end and
+# how much the stage changed it (rssDeltaMb). The peak RSS of the process
+# (which also covers previous stages, and previous participants in a worker)
+# is only reported for the whole run. With traceMemory, the peak of the
+# memory allocated by Python and NumPy during the stage (tracedPeakMb) and
+# above the memory allocated when it started (tracedGrowthMb) is measured
+# with tracemalloc, which slows the run down.
+# A stage that runs once per partition (see partitioned.py) has one record
+# with the total seconds and rows and the number of runs.
+# =============================================================================
+import contextlib, datetime as dt, json, os, platform, sys, time, tracemalloc
+
+# =============================================================================
+# # CONSTANTS DEFINITION
+# =============================================================================
+REPORT_FILE = 'RunReport.json'
+
+# Change when the content of the report changes
+REPORT_VERSION = 2
+
+MEGABYTE = 1 << 20
+
+
+def peak_rss_mb():
+    """
+    Peak resident memory of the process in MB, None when the platform does
+    not provide it (Windows)
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    if sys.platform == 'darwin':
+        return round(maxRss / MEGABYTE, 1)
+    return round(maxRss / 1024, 1)
+
+
+def current_rss_mb():
+    """
+    Current resident memory of the process in MB (/proc/self/statm on Linux,
+    psutil elsewhere when installed), None when it is not available
+    """
+    try:
+        with open('/proc/self/statm') as statmFile:
+            return round(int(statmFile.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / MEGABYTE, 1)
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return round(psutil.Process().memory_info().rss / MEGABYTE, 1)
+
+
+def _add_record(record, other):
+    # Add the counts of other (a new run of the stage of record) to record
+    record['runs'] = record.get('runs', 1) + 1
+    for key, value in other.items():
+        if value is None or key == 'stage':
+            continue
+        if key in ('tracedPeakMb', 'tracedGrowthMb'):
+            record[key] = max(record[key] or 0, value)
+        elif key == 'rssMb':
+            record[key] = value
+        elif key == 'rssDeltaMb':
+            record[key] = round((record[key] or 0) + value, 1)
+        elif key == 'seconds':
+            record[key] = round(record[key] + value, 4)
+        elif isinstance(value, (int, float)) and isinstance(record.get(key), (int, float)):
+            record[key] += value
+        else:
+            record[key] = value
+
+
+class RunReport:
+    """
+    Stages of the run of one participant. Use stage() around each stage and
+    set rowsOut (and any other value) in the record it yields.
+    """
+
+    def __init__(self, idFile, traceMemory=False):
+        self.idFile = idFile
+        self.traceMemory = traceMemory
+        self.started = dt.datetime.now().isoformat(timespec='seconds')
+        self.start = time.perf_counter()
+        self.seconds = None
+        self.status = 'running'
+        self.error = ''
+        self.parameters = None
+        self.stages = []
+        self._stopTracing = False
+        if traceMemory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._stopTracing = True
+
+    @contextlib.contextmanager
+    def stage(self, name, rowsIn=None):
+        # A stage run several times (once per partition) is recorded once:
+        # seconds, rows, other counts and RSS changes are added, peaks are the
+        # largest and rssMb is the one of the last run
+        record = {'stage': name, 'rowsIn': rowsIn, 'rowsOut': None, 'seconds': None, 'rssMb': None,
+                  'rssDeltaMb': None, 'tracedPeakMb': None, 'tracedGrowthMb': None}
+        previous = next((stageRecord for stageRecord in self.stages if stageRecord['stage'] == name), None)
+        if previous is None:
+            self.stages.append(record)
+        if self.traceMemory:
+            tracemalloc.reset_peak()
+            tracedStart = tracemalloc.get_traced_memory()[0]
+        rssStart = current_rss_mb()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = round(time.perf_counter() - start, 4)
+            record['rssMb'] = current_rss_mb()
+            if rssStart is not None and record['rssMb'] is not None:
+                record['rssDeltaMb'] = round(record['rssMb'] - rssStart, 1)
+            if self.traceMemory:
+                tracedPeak = tracemalloc.get_traced_memory()[1]
+                record['tracedPeakMb'] = round(tracedPeak / MEGABYTE, 1)
+                record['tracedGrowthMb'] = round((tracedPeak - tracedStart) / MEGABYTE, 1)
+            if previous is not None:
+                _add_record(previous, record)
+
+    def close(self, error=None):
+        """
+        End the run: status is 'ok' or 'failed' when an error is given
+        """
+        self.seconds = round(time.perf_counter() - self.start, 4)
+        self.status = 'ok' if error is None else 'failed'
+        self.error = '' if error is None else '{}: {}'.format(type(error).__name__, error)
+        if self._stopTracing:
+            tracemalloc.stop()
+            self._stopTracing = False
+
+    def hot_stage(self):
+        """
+        Return the name of the slowest stage, None when there are no stages
+        """
+        if not self.stages:
+            return None
+        return max(self.stages, key=lambda record: record['seconds'] or 0)['stage']
+
+    def to_dict(self):
+        return {'version': REPORT_VERSION, 'idFile': self.idFile, 'status': self.status, 'error': self.error,
+                'started': self.started, 'seconds': self.seconds, 'hotStage': self.hot_stage(),
+                'peakRssMb': peak_rss_mb(), 'python': platform.python_version(), 'platform': platform.platform(),
+                'pid': os.getpid(), 'parameters': self.parameters, 'stages': self.stages}
+
+    def write(self, urlFile):
+        """
+        Write the report as JSON in urlFile
+        """
+        with open(urlFile + '.tmp', 'w') as reportFile:
+            json.dump(self.to_dict(), reportFile, indent=2, default=str)
+        os.replace(urlFile + '.tmp', urlFile)
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# COVID RESTRICTION CALENDAR
+# covidStatus and restrictionLevel of every point from a table of restriction
+# periods [start, end) with a level. Periods of a country (or region) must
+# not overlap; the time between periods after the COVID start has
+# DEFAULT_LEVEL and the time before the COVID start has level 0 and
+# covidStatus 0.
+# The periods are turned into sorted boundaries, so each point is labelled
+# with one searchsorted over the boundaries (O(n log k) for n points and k
+# periods) on timestamps parsed once.
+# The table is a CSV file (parameters.RESTRICTION_CALENDAR) with the columns
+# country, region, start, end and level, so participants of several countries
+# and regions are labelled in the same batch; the COVID start of a calendar is
+# the start of its first period. Without file, the calendar is COVID_DATE and
+# the periods CRL_P1..CRL_P4 of parameters.py.
+# =============================================================================
+import functools
+
+import numpy as np
+import pandas as pd
+
+# =============================================================================
+# # CONSTANTS DEFINITION
+# =============================================================================
+CALENDAR_COLUMNS = ['country', 'region', 'start', 'end', 'level']
+
+# Level of the time after the COVID start that is not in any period
+DEFAULT_LEVEL = 1
+
+# Levels of the periods CRL_P1..CRL_P4 of parameters.py
+PARAMETER_PERIODS = [('CRL_P1_START', 'CRL_P1_END', 3), ('CRL_P2_START', 'CRL_P2_END', 2),
+                     ('CRL_P3_START', 'CRL_P3_END', 1), ('CRL_P4_START', 'CRL_P4_END', 2)]
+
+
+def _to_nanoseconds(datetimes):
+    return pd.to_datetime(pd.Series(datetimes)).to_numpy().astype('datetime64[ns]').astype(np.int64)
+
+
+class RestrictionCalendar:
+    """
+    Restriction periods of one country or region: starts, ends (exclusive)
+    and levels, with the COVID start covidStart
+    """
+
+    def __init__(self, covidStart, starts, ends, levels, name=''):
+        self.name = name
+        self.covidStart = int(_to_nanoseconds([covidStart])[0])
+        starts = _to_nanoseconds(starts)
+        ends = _to_nanoseconds(ends)
+        levels = np.asarray(levels, dtype=np.int8)
+        order = np.argsort(starts, kind='mergesort')
+        starts, ends, levels = starts[order], ends[order], levels[order]
+        if (ends <= starts).any():
+            msg = 'Restriction period of {} ends before it starts'.format(name)
+            raise RuntimeError(msg)
+        if (starts[1:] < ends[:-1]).any():
+            msg = 'Overlapping restriction periods in {}'.format(name)
+            raise RuntimeError(msg)
+        # Segment i is [boundaries[i], boundaries[i + 1]) and has segmentLevels[i]
+        self.boundaries = np.unique(np.concatenate([[self.covidStart], starts, ends]))
+        self.segmentLevels = np.where(self.boundaries >= self.covidStart, DEFAULT_LEVEL, 0).astype(np.int8)
+        if len(starts):
+            periodIdx = np.searchsorted(starts, self.boundaries, side='right') - 1
+            inPeriod = (periodIdx >= 0) & (self.boundaries >= self.covidStart)
+            inPeriod[inPeriod] = self.boundaries[inPeriod] < ends[periodIdx[inPeriod]]
+            self.segmentLevels[inPeriod] = levels[periodIdx[inPeriod]]
+
+    def label(self, datetimes):
+        """
+        Return covidStatus and restrictionLevel (int8 arrays) of datetimes
+        """
+        t = datetimes if isinstance(datetimes, np.ndarray) and datetimes.dtype == np.int64 else _to_nanoseconds(datetimes)
+        covidStatus = (t >= self.covidStart).astype(np.int8)
+        segment = np.searchsorted(self.boundaries, t, side='right') - 1
+        restrictionLevel = np.where(segment >= 0, self.segmentLevels[np.maximum(segment, 0)], 0).astype(np.int8)
+        return covidStatus, restrictionLevel
+
+
+@functools.lru_cache(maxsize=None)
+def load_periods(urlFile):
+    """
+    Read the restriction periods of a calendar file (CSV with columns
+    country, region, start, end and level; region is empty for the periods
+    of the whole country)
+    """
+    dfPeriods = pd.read_csv(urlFile, dtype={'country': str, 'region': str}, keep_default_na=False)
+    missingColumns = [column for column in CALENDAR_COLUMNS if column not in dfPeriods.columns]
+    if missingColumns:
+        msg = 'No columns {} in restriction calendar {}'.format(', '.join(missingColumns), urlFile)
+        raise RuntimeError(msg)
+    dfPeriods['start'] = pd.to_datetime(dfPeriods['start'])
+    dfPeriods['end'] = pd.to_datetime(dfPeriods['end'])
+    return dfPeriods[CALENDAR_COLUMNS]
+
+
+@functools.lru_cache(maxsize=None)
+def _file_calendar(urlFile, country, region):
+    dfPeriods = load_periods(urlFile)
+    dfPeriods = dfPeriods[dfPeriods['country'] == country]
+    name = country
+    if region and (dfPeriods['region'] == region).any():
+        dfPeriods = dfPeriods[dfPeriods['region'] == region]
+        name = '{}/{}'.format(country, region)
+    else:
+        dfPeriods = dfPeriods[dfPeriods['region'] == '']
+    if dfPeriods.empty:
+        msg = 'No restriction periods of {} in {}'.format(name, urlFile)
+        raise RuntimeError(msg)
+    return RestrictionCalendar(dfPeriods['start'].min(), dfPeriods['start'], dfPeriods['end'], dfPeriods['level'], name)
+
+
+@functools.lru_cache(maxsize=None)
+def _parameter_calendar(covidDate, periods):
+    return RestrictionCalendar(covidDate, [period[0] for period in periods], [period[1] for period in periods],
+                               [period[2] for period in periods], 'parameters')
+
+
+def get_calendar(params):
+    """
+    Return the RestrictionCalendar of the parameters: periods of COUNTRY and
+    REGION in RESTRICTION_CALENDAR or, without file, COVID_DATE and CRL_P1..CRL_P4
+    """
+    if params.get('RESTRICTION_CALENDAR'):
+        return _file_calendar(params['RESTRICTION_CALENDAR'], params['COUNTRY'], params.get('REGION') or '')
+    periods = tuple((params[start], params[end], level) for start, end, level in PARAMETER_PERIODS)
+    return _parameter_calendar(params['COVID_DATE'], periods)
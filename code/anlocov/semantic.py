@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# SEMANTIC LOCATION HISTORY
+# Fast path for the Takeout exports with Semantic Location History (one JSON
+# file per month with the 'timelineObjects' array), where Google has already
+# detected the visits (placeVisit) and the movements between them
+# (activitySegment).
+# The timeline objects are parsed with the streaming parser of
+# transformation.py into a timeline table (dataTransform/semantic/<idFile>,
+# columns TIMELINE_COLUMNS). Times are timestampMs or ISO 8601 timestamps;
+# names, addresses and place ids of the visits are not stored.
+# Each place visit is an APL candidate and the destination of one trip, made
+# of the activity segments since the start of the previous visit. The raw
+# points of the transformed file (optional) are only filtered and compressed
+# for GPSTrackingData and to check each visit: a visit with points within
+# MIN_SPATIAL_RADIUS_KM_STOP km of its center during the visit is moved to
+# their median point, the other visits are kept as detected by Google
+# (unsupported in the run report). Trips, stops and their detection over the
+# raw points (trips.py, stops.py) are not computed; clusters, summaries,
+# anonymisation and outputs are the ones of processing.py.
+# =============================================================================
+import logging, os
+
+import numpy as np
+import pandas as pd
+
+from anlocov import (export, filtering, geo, parameters, processing, report, restrictions, storage, summary,
+                     transformation, trips)
+from anlocov.geo import haversine_km_point
+from anlocov.jit import njit
+
+# =============================================================================
+# # CONSTANTS DEFINITION
+# =============================================================================
+# Directory of dataTransform with the timeline tables
+SEMANTIC_DIRECTORY = 'semantic'
+
+TIMELINE_COLUMNS = ['kind', 'startDatetime', 'endDatetime', 'latitude', 'longitude', 'endLatitude', 'endLongitude',
+                    'distanceM', 'activityType']
+
+PLACE_VISIT = 'placeVisit'
+ACTIVITY_SEGMENT = 'activitySegment'
+
+NANOSECONDS_MINUTE = 60 * 10**9
+
+
+def get_timeline_file(urlTransformFile):
+    """
+    Return the timeline table of the participant of the transformed file
+    urlTransformFile (dataTransform/semantic/<file name>)
+    """
+    return os.path.join(os.path.dirname(urlTransformFile), SEMANTIC_DIRECTORY, os.path.basename(urlTransformFile))
+
+
+def _duration_time(duration, edge):
+    # startTimestamp / endTimestamp (ISO 8601) of the newer exports or startTimestampMs / endTimestampMs
+    if edge + 'Timestamp' in duration:
+        return str(duration[edge + 'Timestamp'])
+    return int(duration[edge + 'TimestampMs'])
+
+
+def _timeline_row(timelineObject):
+    # Row of TIMELINE_COLUMNS of a timeline object (None for other objects)
+    if PLACE_VISIT in timelineObject:
+        visit = timelineObject[PLACE_VISIT]
+        location = visit.get('location') or {}
+        latitude = visit.get('centerLatE7', location.get('latitudeE7')) / 1e7
+        longitude = visit.get('centerLngE7', location.get('longitudeE7')) / 1e7
+        duration = visit['duration']
+        return (PLACE_VISIT, _duration_time(duration, 'start'), _duration_time(duration, 'end'), latitude, longitude,
+                latitude, longitude, np.nan, '')
+    if ACTIVITY_SEGMENT in timelineObject:
+        segment = timelineObject[ACTIVITY_SEGMENT]
+        duration = segment['duration']
+        distance = segment.get('distance')
+        return (ACTIVITY_SEGMENT, _duration_time(duration, 'start'), _duration_time(duration, 'end'),
+                segment['startLocation']['latitudeE7'] / 1e7, segment['startLocation']['longitudeE7'] / 1e7,
+                segment['endLocation']['latitudeE7'] / 1e7, segment['endLocation']['longitudeE7'] / 1e7,
+                np.nan if distance is None else float(distance), str(segment.get('activityType') or ''))
+    return None
+
+
+def _to_datetimes(times):
+    # datetime64 of timestampMs (int) or ISO 8601 (str) times and the mask of the valid ones
+    milliseconds = np.zeros(len(times), dtype=np.int64)
+    valid = np.ones(len(times), dtype=bool)
+    isoPositions = [i for i, value in enumerate(times) if isinstance(value, str)]
+    if isoPositions:
+        milliseconds[isoPositions], valid[isoPositions] = transformation.iso_to_milliseconds([times[i] for i in isoPositions])
+    msPositions = [i for i, value in enumerate(times) if not isinstance(value, str)]
+    if msPositions:
+        milliseconds[msPositions] = [times[i] for i in msPositions]
+    return milliseconds.astype('datetime64[ms]').astype('datetime64[ns]'), valid
+
+
+def read_timeline(urlFile, stats=None):
+    """
+    Read the timeline objects of a Semantic Location History JSON file (path
+    or text file) into a DataFrame with the columns TIMELINE_COLUMNS. Objects
+    without time or coordinates are skipped; the number of objects read and
+    skipped is stored in stats.
+    """
+    if stats is None:
+        stats = {}
+    stats.setdefault('timelineObjects', 0)
+    stats.setdefault('skipped', 0)
+    rows = []
+    for timelineObject in transformation.iter_json_array(urlFile, 'timelineObjects'):
+        stats['timelineObjects'] += 1
+        try:
+            row = _timeline_row(timelineObject)
+        except (KeyError, TypeError, ValueError):
+            row = None
+        if row is None:
+            stats['skipped'] += 1
+            continue
+        rows.append(row)
+    dfTimeline = pd.DataFrame(rows, columns=TIMELINE_COLUMNS)
+    starts, validStarts = _to_datetimes(dfTimeline['startDatetime'].tolist())
+    ends, validEnds = _to_datetimes(dfTimeline['endDatetime'].tolist())
+    dfTimeline['startDatetime'] = starts
+    dfTimeline['endDatetime'] = ends
+    valid = validStarts & validEnds & (ends >= starts)
+    stats['skipped'] += int((~valid).sum())
+    return dfTimeline[valid].reset_index(drop=True)
+
+
+def sort_timeline(dfTimeline):
+    """
+    Sort a timeline (or the concatenation of the timelines of several months)
+    by start time and drop repeated objects
+    """
+    dfTimeline = dfTimeline.drop_duplicates(['kind', 'startDatetime', 'endDatetime'])
+    return dfTimeline.sort_values(['startDatetime', 'endDatetime'], kind='mergesort', ignore_index=True)
+
+
+def transform_semantic_files(urlFiles, urlSaveFile):
+    """
+    Transform the Semantic Location History JSON files (paths or text files,
+    one per month) into the timeline table urlSaveFile (CSV, Parquet or Arrow
+    given by the extension). Return the number of place visits and activity
+    segments.
+    """
+    stats = {}
+    return write_timeline([read_timeline(urlFile, stats) for urlFile in urlFiles], urlSaveFile, stats)
+
+
+def write_timeline(dfTimelines, urlSaveFile, stats=None):
+    """
+    Write the timelines dfTimelines (output of read_timeline, one per month)
+    in the timeline table urlSaveFile. Return the number of place visits and
+    activity segments.
+    """
+    dfTimeline = sort_timeline(pd.concat(dfTimelines, ignore_index=True)) if dfTimelines else pd.DataFrame()
+    if dfTimeline.empty:
+        msg = 'No placeVisit or activitySegment in Semantic Location History ({} objects read)'.format(
+            (stats or {}).get('timelineObjects', 0))
+        raise RuntimeError(msg)
+    os.makedirs(os.path.dirname(os.path.abspath(urlSaveFile)), exist_ok=True)
+    storage.write_table(dfTimeline, urlSaveFile)
+    isVisit = dfTimeline['kind'] == PLACE_VISIT
+    return int(isVisit.sum()), int((~isVisit).sum())
+
+
+def read_timeline_file(urlFile):
+    """
+    Read the timeline table urlFile (output of transform_semantic_files)
+    """
+    dfTimeline = storage.read_table(urlFile)
+    missing = [column for column in TIMELINE_COLUMNS if column not in dfTimeline.columns]
+    if missing:
+        msg = 'No columns {} in timeline file'.format(', '.join(missing))
+        raise RuntimeError(msg)
+    dfTimeline['startDatetime'] = pd.to_datetime(dfTimeline['startDatetime'], format='ISO8601')
+    dfTimeline['endDatetime'] = pd.to_datetime(dfTimeline['endDatetime'], format='ISO8601')
+    dfTimeline['activityType'] = dfTimeline['activityType'].fillna('')
+    return dfTimeline
+
+
+@njit(cache=True)
+def refine_kernel(lat, lng, first, last, visitLat, visitLng, radiusKm):
+    """
+    Median point of the points [first, last) of each visit within radiusKm
+    of the visit center; visits without such points keep their center and
+    are not supported
+    """
+    refinedLat = visitLat.copy()
+    refinedLng = visitLng.copy()
+    supported = np.zeros(len(first), dtype=np.bool_)
+    for i in range(len(first)):
+        count = 0
+        nearLat = np.empty(last[i] - first[i], dtype=np.float64)
+        nearLng = np.empty(last[i] - first[i], dtype=np.float64)
+        for j in range(first[i], last[i]):
+            if haversine_km_point(visitLat[i], visitLng[i], lat[j], lng[j]) <= radiusKm:
+                nearLat[count] = lat[j]
+                nearLng[count] = lng[j]
+                count += 1
+        if count > 0:
+            refinedLat[i] = np.median(nearLat[:count])
+            refinedLng[i] = np.median(nearLng[:count])
+            supported[i] = True
+    return refinedLat, refinedLng, supported
+
+
+def _timeline_points(dfTimeline):
+    # Visit centers (at the start) and activity start and end points, in place of the raw points
+    isActivity = (dfTimeline['kind'] == ACTIVITY_SEGMENT).to_numpy()
+    dfPoints = pd.DataFrame({'datetime': np.concatenate([dfTimeline['startDatetime'].to_numpy(),
+                                                         dfTimeline['endDatetime'].to_numpy()[isActivity]]),
+                             'latitude': np.concatenate([dfTimeline['latitude'].to_numpy(),
+                                                         dfTimeline['endLatitude'].to_numpy()[isActivity]]),
+                             'longitude': np.concatenate([dfTimeline['longitude'].to_numpy(),
+                                                          dfTimeline['endLongitude'].to_numpy()[isActivity]])})
+    return dfPoints.sort_values('datetime', kind='mergesort', ignore_index=True)
+
+
+def compute_semantic_apl(dfTimeline, params=None, idFile=processing.DEFAULT_ID_FILE, dfPoints=None, runReport=None):
+    """
+    Compute GPSTrackingData, APLData and SummaryData of the timeline
+    dfTimeline (columns TIMELINE_COLUMNS) before anonymisation, as
+    processing.compute_apl. The APL are the place visits, refined with the
+    raw points dfPoints (columns datetime, latitude and longitude) when
+    given. Return (dfGPSTracking, dfAPL, dfSummary).
+    """
+    if params is None:
+        params = parameters.get_parameters()
+    if runReport is None:
+        runReport = report.RunReport(idFile)
+    runReport.parameters = params
+    dfTimeline = sort_timeline(dfTimeline)
+    isVisit = (dfTimeline['kind'] == PLACE_VISIT).to_numpy()
+    # APL candidates: zone filter and COVID labelling of the visits (time of the start of the visit)
+    dfStops = processing.prepare_points(pd.DataFrame({'datetime': dfTimeline['startDatetime'][isVisit],
+                                                      'latitude': dfTimeline['latitude'][isVisit],
+                                                      'longitude': dfTimeline['longitude'][isVisit]}),
+                                        params, idFile, runReport)
+    if dfStops.empty:
+        msg = "File {} has no place visits".format(idFile)
+        raise RuntimeError(msg)
+    visitEnd = dfTimeline['endDatetime'].to_numpy()[dfStops.index.to_numpy()].astype('datetime64[ns]').astype(np.int64)
+    dfStops = dfStops.reset_index(drop=True)
+    visitStart = dfStops['datetime'].to_numpy().astype('datetime64[ns]').astype(np.int64)
+    dfActivities = dfTimeline[~isVisit]
+    msg = "Timeline contains {} place visits and {} activity segments".format(len(dfStops), len(dfActivities))
+    print(msg)
+    logging.info(msg)
+
+    # GPSTrackingData: raw points filtered and compressed or, without them, the points of the timeline
+    rawPoints = dfPoints is not None
+    if rawPoints:
+        if dfPoints.empty:
+            msg = 'Empty JSON file'
+            raise RuntimeError(msg)
+        processing.validate_columns(dfPoints)
+    dfSkmob = processing.prepare_points(dfPoints if rawPoints else _timeline_points(dfTimeline), params, idFile, runReport)
+    with runReport.stage('filterCompress', len(dfSkmob)) as record:
+        if rawPoints:
+            dfSkmob, droppedPoints = filtering.filter_compress(dfSkmob, maxSpeedKmh=params['MAX_SPEED_KMH'], includeLoops=True,
+                                                               spatialRadiusKm=params['MIN_SPATIAL_RADIUS_KM'])
+            record['dropped'] = droppedPoints
+        dfSkmob = dfSkmob.sort_values('datetime', kind='mergesort')
+        record['rowsOut'] = len(dfSkmob)
+    dfGPSTracking = processing.gps_tracking_data(dfSkmob)
+    t = dfSkmob['datetime'].to_numpy().astype('datetime64[ns]').astype(np.int64)
+
+    # Check and refine the visits with the raw points during each visit
+    if rawPoints:
+        with runReport.stage('refineVisits', len(dfStops)) as record:
+            lat, lng, supported = refine_kernel(dfSkmob['lat'].to_numpy(dtype=np.float64), dfSkmob['lng'].to_numpy(dtype=np.float64),
+                                                np.searchsorted(t, visitStart, side='left'),
+                                                np.searchsorted(t, visitEnd, side='right'),
+                                                dfStops['lat'].to_numpy(dtype=np.float64),
+                                                dfStops['lng'].to_numpy(dtype=np.float64),
+                                                params['MIN_SPATIAL_RADIUS_KM_STOP'])
+            dfStops['lat'] = lat
+            dfStops['lng'] = lng
+            record['rowsOut'] = len(dfStops)
+            record['refined'] = int(supported.sum())
+            record['unsupported'] = int((~supported).sum())
+        msg = "Raw points support {} of {} place visits".format(int(supported.sum()), len(dfStops))
+        print(msg)
+        logging.info(msg)
+
+    # =============================================================================
+    # TRIPS
+    # The trip of each visit is made of the activity segments that start
+    # between the start of the previous visit and the start of the visit. It
+    # starts with its first segment (or at the end of the previous visit) and
+    # ends at the start of the visit, its length is the distance of the segments
+    # =============================================================================
+    with runReport.stage('semanticTrips', len(dfActivities)) as record:
+        activityStart = dfActivities['startDatetime'].to_numpy().astype('datetime64[ns]').astype(np.int64)
+        activityKm = dfActivities['distanceM'].to_numpy(dtype=np.float64) / 1000
+        missingKm = np.isnan(activityKm)
+        activityKm[missingKm] = geo.haversine_km(dfActivities['latitude'].to_numpy()[missingKm],
+                                                 dfActivities['longitude'].to_numpy()[missingKm],
+                                                 dfActivities['endLatitude'].to_numpy()[missingKm],
+                                                 dfActivities['endLongitude'].to_numpy()[missingKm])
+        lastActivity = np.searchsorted(activityStart, visitStart, side='left')
+        firstActivity = np.concatenate([[0], np.searchsorted(activityStart, visitStart[:-1], side='left')])
+        cumulativeKm = np.concatenate([[0.0], np.cumsum(activityKm)])
+        tripLenKm = cumulativeKm[lastActivity] - cumulativeKm[firstActivity]
+        previousEnd = np.concatenate([visitStart[:1], visitEnd[:-1]])
+        hasActivities = lastActivity > firstActivity
+        firstStart = activityStart[np.minimum(firstActivity, len(activityStart) - 1)] if len(activityStart) else previousEnd
+        tripStart = np.minimum(np.where(hasActivities, firstStart, previousEnd), visitStart)
+        gpsPoints = np.searchsorted(t, visitStart, side='right') - np.searchsorted(t, tripStart, side='left')
+        # Week of the visit, order of the week (numWeek) and of the trip in the week (idTrip)
+        numWeek, weekIds = pd.factorize(trips.week_codes(visitStart), sort=True)
+        weekFirst = np.flatnonzero(np.diff(numWeek, prepend=-1))
+        idTrip = np.arange(len(numWeek)) - np.repeat(weekFirst, np.diff(np.append(weekFirst, len(numWeek))))
+        weekLabels = [trips.week_label(weekCode) for weekCode in weekIds]
+        tripIds = np.array(['{}_{}'.format(weekLabels[week], trip) for week, trip in zip(numWeek, idTrip)], dtype=object)
+        dfStops['idWeek'] = tripIds
+        dfStops['numWeek'] = numWeek
+        dfStops['idTrip'] = idTrip
+        covidStatus, restrictionLevel = restrictions.get_calendar(params).label(tripStart)
+        dfTripsSummary = pd.DataFrame({'idFile': dfStops['uid'].to_numpy(), 'idWeek': tripIds, 'numWeek': numWeek,
+                                       'idTrip': idTrip, 'tripTimeMin': (visitStart - tripStart) / NANOSECONDS_MINUTE,
+                                       'tripLenKm': tripLenKm, 'GPSPoints': gpsPoints, 'covidStatus': covidStatus,
+                                       'restrictionLevel': restrictionLevel})
+        if 'region' in dfStops.columns:
+            dfTripsSummary['region'] = dfStops['region'].to_numpy()
+        record['rowsOut'] = len(dfTripsSummary)
+        record['weeks'] = len(weekIds)
+
+    # Clusters and summaries as in processing.compute_apl
+    dfAPL = processing.cluster_stops(dfStops, params, runReport)
+    with runReport.stage('summaries', len(dfTripsSummary)) as record:
+        dfSummary = summary.merge_summaries(dfTripsSummary, summary.stops_clusters_summary(dfAPL))
+        record['rowsOut'] = len(dfSummary)
+    dfAPL, dfSummary = processing.apl_summary_data(dfAPL, dfSummary)
+    return dfGPSTracking, dfAPL, dfSummary
+
+
+def process_semantic_file(urlTimeline, urlDataFinal, params=None, outputFormat='csv', urlPoints=None, compression=None,
+                          traceMemory=False):
+    """
+    Compute GPSTrackingData, APLData and SummaryData of the timeline table
+    urlTimeline (output of transform_semantic_files), with the raw points
+    of the transformed file urlPoints when given, and write the outputs and
+    the run report in dataFinal/<idFile> as processing.process_csv_file.
+    Return the number of APL.
+    """
+    idFile = processing.get_id_file(urlTimeline)
+    urlParticipant = processing.get_participant_directory(urlDataFinal, idFile)
+    runReport = report.RunReport(idFile, traceMemory)
+    error = None
+    try:
+        with runReport.stage('load') as record:
+            dfTimeline = read_timeline_file(urlTimeline)
+            dfPoints = None if urlPoints is None else processing.read_source_file(urlPoints)[1]
+            record['rowsOut'] = len(dfTimeline) + (0 if dfPoints is None else len(dfPoints))
+        with export.Exporter(urlParticipant, outputFormat, compression) as exporter:
+            dfGPSTracking, dfAPL, dfSummary = compute_semantic_apl(dfTimeline, params, idFile, dfPoints, runReport)
+            with runReport.stage('anonymise', len(dfGPSTracking) + len(dfAPL)) as record:
+                gravityPoint = processing.gravity_point(dfGPSTracking)
+                clusterPoint = processing.cluster_point(dfAPL)
+                record['rowsOut'] = record['rowsIn']
+            exporter.export(dfGPSTracking, [('GPSTrackingData_', None), ('GPSTrackingData', gravityPoint)])
+            exporter.export(dfAPL, [('APLData_', None), ('APLData', clusterPoint)])
+            exporter.export(dfSummary, [('SummaryData', None)])
+            with runReport.stage('export', 2 * len(dfGPSTracking) + 2 * len(dfAPL) + len(dfSummary)) as record:
+                record['rowsOut'] = exporter.close()
+                record['compression'] = compression
+        numberAPL = len(dfAPL)
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        runReport.close(error)
+        runReport.write(os.path.join(urlParticipant, report.REPORT_FILE))
+    msg = "Computation succed!! {} contains {} APL".format(os.path.basename(urlTimeline), numberAPL)
+    print(msg)
+    logging.info(msg)
+    return numberAPL
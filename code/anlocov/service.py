@@ -0,0 +1,366 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# INGESTION SERVICE
+# Long running local HTTP service (asyncio, standard library only) that
+# receives the Takeout uploads of the participants and computes their APL:
+#   POST /uploads/<idFile>   GLH JSON file or Takeout archive (zip) as body
+#   GET  /jobs               status of every job
+#   GET  /jobs/<idJob>       status of one job
+# The body of an upload is streamed into the transformation (stage 1) while
+# it is received: the JSON parser reads the socket from a thread (zip archives
+# through takeout.py), so uploads are not stored before they are parsed and a
+# slow parser slows the client down (TCP flow control). The transformed file
+# is written in dataTransform (and the timeline table in
+# dataTransform/semantic when the archive has the Semantic Location History,
+# see semantic.py) and an APL job (stage 2, batch.process_participant) is
+# queued to a pool of worker processes.
+# Uploads are refused (503) when MAX_PENDING_JOBS jobs wait or
+# MAX_UPLOADS uploads are being received, and a participant can not be
+# uploaded again while its job is not finished (409).
+# Jobs are kept in memory (the MAX_FINISHED_JOBS last finished jobs); the
+# outputs and run report of each participant are written in dataFinal as in
+# the batch. The service listens on localhost by
+# default (python -m anlocov serve <project directory>).
+# =============================================================================
+import asyncio, concurrent.futures as cf, json, logging, os, re, time, uuid
+
+from anlocov import batch, parameters, semantic, storage, takeout, transformation
+
+# =============================================================================
+# # CONSTANTS DEFINITION
+# =============================================================================
+HOST = '127.0.0.1'
+PORT = 8765
+
+# Jobs waiting for a worker and uploads received at the same time
+MAX_PENDING_JOBS = 16
+MAX_UPLOADS = 4
+
+# Finished jobs (ok or failed) kept for GET /jobs; older ones are forgotten
+MAX_FINISHED_JOBS = 1000
+
+# Bytes read from the socket on each access
+UPLOAD_BLOCK_SIZE = 1 << 16
+
+ID_FILE_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]*$')
+
+JOB_COLUMNS = ['idJob', 'created'] + batch.REPORT_COLUMNS
+
+STATUS_TEXT = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               409: 'Conflict', 411: 'Length Required', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class RequestBody:
+    """
+    Body of a request (Content-Length or chunked transfer encoding) read from
+    the stream of the connection. A client that expects 100-continue only
+    sends the body once the request is accepted.
+    """
+
+    def __init__(self, reader, writer, headers):
+        self.reader = reader
+        self.writer = writer
+        self.chunked = headers.get('transfer-encoding', '').lower() == 'chunked'
+        if not self.chunked and 'content-length' not in headers:
+            raise HTTPError(411, 'Content-Length or chunked Transfer-Encoding required')
+        self.remaining = 0 if self.chunked else int(headers['content-length'])
+        self.eof = not self.chunked and self.remaining == 0
+        self.expectContinue = headers.get('expect', '').lower() == '100-continue'
+        self.accepted = False
+
+    @property
+    def pending(self):
+        """
+        True when the client sends (part of) the body that was not read
+        """
+        return not self.eof and (self.accepted or not self.expectContinue)
+
+    async def accept(self):
+        """
+        Let the client send the body (100 Continue)
+        """
+        if self.expectContinue and not self.accepted:
+            self.writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+            await self.writer.drain()
+        self.accepted = True
+
+    async def read(self, size):
+        """
+        Read at most size bytes of the body (b'' at the end)
+        """
+        if self.eof:
+            return b''
+        if self.chunked and self.remaining == 0:
+            try:
+                chunkSize = int((await self.reader.readline()).split(b';')[0].strip(), 16)
+            except ValueError:
+                raise HTTPError(400, 'Malformed chunked body')
+            if chunkSize == 0:
+                # Trailer headers end with a blank line
+                while (await self.reader.readline()).strip():
+                    pass
+                self.eof = True
+                return b''
+            self.remaining = chunkSize
+        data = await self.reader.read(min(size, self.remaining))
+        if not data:
+            raise HTTPError(400, 'Upload interrupted')
+        self.remaining -= len(data)
+        if self.remaining == 0:
+            if self.chunked:
+                await self.reader.readline()
+            else:
+                self.eof = True
+        return data
+
+    async def drain(self):
+        """
+        Read the rest of the body
+        """
+        while await self.read(UPLOAD_BLOCK_SIZE):
+            pass
+
+
+class _BodyFile:
+    """
+    Blocking binary file over a RequestBody, read from a thread while the
+    event loop receives the body
+    """
+
+    def __init__(self, body, loop):
+        self.body = body
+        self.loop = loop
+
+    def read(self, size=UPLOAD_BLOCK_SIZE):
+        if size is None or size < 0:
+            size = UPLOAD_BLOCK_SIZE
+        return asyncio.run_coroutine_threadsafe(self.body.read(size), self.loop).result()
+
+
+def _transform_upload(bodyFile, urlSaveFile, urlTimelineFile):
+    # Stage 1 of an upload (runs in a thread): GLH JSON file or Takeout archive into the transformed file and
+    # the Semantic Location History of the archive into the timeline table. Return (observations, has timeline)
+    numberObservations = None
+    dfTimelines = []
+    for kind, textFile in takeout.iter_location_files(bodyFile):
+        if kind == takeout.RECORDS:
+            numberObservations, _, _ = transformation.transform_json_file(textFile, urlSaveFile)
+        else:
+            dfTimelines.append(semantic.read_timeline(textFile))
+    if numberObservations is None:
+        msg = 'No {} in Takeout archive'.format(' or '.join(takeout.LOCATION_HISTORY_FILES))
+        raise RuntimeError(msg)
+    if dfTimelines:
+        semantic.write_timeline(dfTimelines, urlTimelineFile)
+    return numberObservations, bool(dfTimelines)
+
+
+class IngestionService:
+    """
+    Ingestion service of the project directory urlProject (dataTransform and
+    dataFinal are created; dataJSON/participants.csv sets the parameters of
+    each participant as in the batch). APL jobs run in a pool of maxWorkers
+    processes (None uses the number of processors) with outputs in
+    fileFormat.
+    """
+
+    def __init__(self, urlProject, fileFormat='csv', maxWorkers=None, params=None, maxPendingJobs=MAX_PENDING_JOBS,
+                 maxUploads=MAX_UPLOADS, maxFinishedJobs=MAX_FINISHED_JOBS):
+        self.urlDataTransform = os.path.join(urlProject, 'dataTransform')
+        self.urlDataFinal = os.path.join(urlProject, 'dataFinal')
+        os.makedirs(self.urlDataTransform, exist_ok=True)
+        os.makedirs(self.urlDataFinal, exist_ok=True)
+        self.fileFormat = fileFormat
+        self.maxWorkers = maxWorkers or os.cpu_count() or 1
+        self.params = params if params is not None else parameters.get_parameters()
+        urlParticipants = os.path.join(urlProject, 'dataJSON', batch.PARTICIPANTS_FILE)
+        self.participantParameters = (batch.read_participant_parameters(urlParticipants)
+                                      if os.path.exists(urlParticipants) else {})
+        self.maxPendingJobs = maxPendingJobs
+        self.maxUploads = maxUploads
+        self.maxFinishedJobs = maxFinishedJobs
+        self.jobs = {}
+        self.uploads = 0
+        self.queue = None
+        self.pool = None
+        self.workers = []
+
+    def _job(self, idFile):
+        # Jobs are in creation order: forget the oldest finished ones
+        finished = [idJob for idJob, job in self.jobs.items() if job['status'] in ('ok', 'failed')]
+        for idJob in finished[:max(len(finished) - self.maxFinishedJobs, 0)]:
+            del self.jobs[idJob]
+        job = dict.fromkeys(JOB_COLUMNS)
+        job.update({'idJob': uuid.uuid4().hex[:12], 'idFile': idFile, 'status': 'uploading',
+                    'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'error': ''})
+        self.jobs[job['idJob']] = job
+        return job
+
+    async def start(self, host=HOST, port=PORT):
+        """
+        Start the worker pool and listen on host:port. Return the asyncio server.
+        """
+        self.queue = asyncio.Queue()
+        self.pool = cf.ProcessPoolExecutor(max_workers=self.maxWorkers)
+        self.workers = [asyncio.create_task(self._run_jobs()) for _ in range(self.maxWorkers)]
+        server = await asyncio.start_server(self._handle, host, port)
+        msg = 'Ingestion service listening on {}'.format(', '.join('{}:{}'.format(*socket.getsockname()[:2])
+                                                                      for socket in server.sockets))
+        print(msg)
+        logging.info(msg)
+        return server
+
+    async def close(self):
+        """
+        Stop the workers (running jobs are finished) and the pool
+        """
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+
+    async def _run_jobs(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job, urlCSV = await self.queue.get()
+            job['status'] = 'running'
+            params = dict(self.params, **self.participantParameters.get(job['idFile'], {}))
+            try:
+                result = await loop.run_in_executor(self.pool, batch.process_participant, job['idFile'], None, urlCSV,
+                                                    self.urlDataFinal, params, self.fileFormat, 'serial')
+                result['observations'] = job['observations']
+                result['seconds'] = round(result['seconds'] + job['seconds'], 3)
+                job.update(result)
+            except Exception as error:
+                # The worker process died (e.g. out of memory)
+                job.update({'status': 'failed', 'error': '{}: {}'.format(type(error).__name__, error)})
+            finally:
+                self.queue.task_done()
+            msg = 'Job {} of file {} {}'.format(job['idJob'], job['idFile'], job['status'])
+            print(msg)
+            logging.info(msg)
+
+    async def _upload(self, idFile, body):
+        if not ID_FILE_PATTERN.match(idFile):
+            raise HTTPError(400, 'Wrong idFile {}'.format(idFile))
+        if any(job['idFile'] == idFile and job['status'] in ('uploading', 'queued', 'running') for job in self.jobs.values()):
+            raise HTTPError(409, 'File {} has a job in progress'.format(idFile))
+        if self.uploads >= self.maxUploads or self.uploads + self.queue.qsize() >= self.maxPendingJobs:
+            raise HTTPError(503, 'Too many pending jobs, retry later')
+        # The job and the upload slot are taken before the first await, so concurrent
+        # uploads of the same participant get 409 and uploads can not go over the limits
+        job = self._job(idFile)
+        self.uploads += 1
+        try:
+            await body.accept()
+        except BaseException:
+            del self.jobs[job['idJob']]
+            self.uploads -= 1
+            raise
+        urlCSV = os.path.join(self.urlDataTransform, storage.get_file_name(idFile, self.fileFormat))
+        urlPartial = os.path.join(self.urlDataTransform, storage.get_file_name(idFile + '.partial', self.fileFormat))
+        urlTimeline = semantic.get_timeline_file(urlCSV)
+        urlPartialTimeline = semantic.get_timeline_file(urlPartial)
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            job['observations'], timeline = await loop.run_in_executor(None, _transform_upload, _BodyFile(body, loop),
+                                                                       urlPartial, urlPartialTimeline)
+            os.replace(urlPartial, urlCSV)
+            # The timeline of a previous upload does not belong to the new points
+            if timeline:
+                os.replace(urlPartialTimeline, urlTimeline)
+            elif os.path.exists(urlTimeline):
+                os.remove(urlTimeline)
+        except Exception as error:
+            job.update({'status': 'failed', 'error': '{}: {}'.format(type(error).__name__, error)})
+            for urlFile in (urlPartial, urlPartialTimeline):
+                if os.path.exists(urlFile):
+                    os.remove(urlFile)
+        finally:
+            self.uploads -= 1
+            job['seconds'] = round(time.perf_counter() - start, 3)
+        await body.drain()
+        if job['status'] == 'failed':
+            msg = 'Upload of file {} failed. {}'.format(idFile, job['error'])
+            logging.error(msg)
+            return 400, job
+        job['status'] = 'queued'
+        self.queue.put_nowait((job, urlCSV))
+        msg = 'Upload of file {}: {} observations, job {} queued'.format(idFile, job['observations'], job['idJob'])
+        print(msg)
+        logging.info(msg)
+        return 202, job
+
+    async def _route(self, method, path, body):
+        parts = [part for part in path.split('?')[0].split('/') if part]
+        if len(parts) == 2 and parts[0] == 'uploads':
+            if body is None:
+                raise HTTPError(405, 'Use POST')
+            return await self._upload(parts[1], body)
+        if parts and parts[0] == 'jobs' and len(parts) <= 2:
+            if method != 'GET':
+                raise HTTPError(405, 'Use GET')
+            if len(parts) == 1:
+                return 200, list(self.jobs.values())
+            if parts[1] not in self.jobs:
+                raise HTTPError(404, 'No job {}'.format(parts[1]))
+            return 200, self.jobs[parts[1]]
+        raise HTTPError(404, 'No resource {}'.format(path))
+
+    async def _handle(self, reader, writer):
+        body = None
+        try:
+            try:
+                requestLine = (await reader.readline()).decode('latin-1').split()
+                if len(requestLine) != 3:
+                    raise HTTPError(400, 'Malformed request')
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode('latin-1')
+                    if not line.strip():
+                        break
+                    name, _, value = line.partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                if requestLine[0] == 'POST':
+                    body = RequestBody(reader, writer, headers)
+                status, content = await self._route(requestLine[0], requestLine[1], body)
+            except HTTPError as error:
+                status, content = error.status, {'error': str(error)}
+            except Exception as error:
+                logging.exception('Request failed')
+                status, content = 500, {'error': '{}: {}'.format(type(error).__name__, error)}
+            data = json.dumps(content, default=str).encode()
+            writer.write('HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\nConnection: close\r\n\r\n'
+                         .format(status, STATUS_TEXT.get(status, ''), len(data)).encode('latin-1') + data)
+            await writer.drain()
+            # The body of a refused request is read, so the client gets the response
+            if body is not None and body.pending:
+                await body.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, HTTPError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(urlProject, host=HOST, port=PORT, fileFormat='csv', maxWorkers=None, maxPendingJobs=MAX_PENDING_JOBS):
+    """
+    Run the ingestion service of urlProject on host:port until it is stopped
+    """
+    service = IngestionService(urlProject, fileFormat, maxWorkers, maxPendingJobs=maxPendingJobs)
+    server = await service.start(host, port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
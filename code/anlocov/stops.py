@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# STOP DETECTION
+# Detect the stops (APL) of every trip of a participant in one call.
+# The kernel follows skmob.preprocessing.detection.stops: a stop is detected
+# when the individual leaves a radius of spatial_radius_km km around the first
+# point of the stop after more than minutes_for_a_stop minutes. The stop has
+# the median latitude and longitude of the points inside the radius, the time
+# of the first point and the other columns of the last point. The destination
+# point of each trip is appended after its stops.
+# The stop radius is MIN_STOP_RADIUS_FACTOR * MIN_SPATIAL_RADIUS_KM_STOP km
+# (stop_radius_km), as documented in parameters.py. scikit-mobility ignores
+# stop_radius_factor when spatial_radius_km is given, so both pipelines only
+# agree with the default factor 1.
+# =============================================================================
+import numpy as np
+import pandas as pd
+
+from anlocov.geo import haversine_km_point
+from anlocov.jit import njit
+
+NANOSECONDS_MINUTE = 60 * 10**9
+
+
+def stop_radius_km(params):
+    """
+    Stop radius of the parameters: MIN_STOP_RADIUS_FACTOR *
+    MIN_SPATIAL_RADIUS_KM_STOP km
+    """
+    return params['MIN_STOP_RADIUS_FACTOR'] * params['MIN_SPATIAL_RADIUS_KM_STOP']
+
+
+@njit(cache=True)
+def stops_kernel(t, lat, lng, segmentStart, segmentEnd, stopRadiusKm, minutesForAStop, noDataForMinutes):
+    """
+    Sequential stop detection over contiguous arrays. t is int64 nanoseconds
+    and each segment (trip) is the range segmentStart[s]:segmentEnd[s] sorted
+    by time. Return for each stop the index of its first point (time), the
+    index of its last point (other columns), the median latitude and
+    longitude and the segment.
+    """
+    n = len(t)
+    firstIdx = np.empty(n, dtype=np.int64)
+    lastIdx = np.empty(n, dtype=np.int64)
+    medianLat = np.empty(n, dtype=np.float64)
+    medianLng = np.empty(n, dtype=np.float64)
+    segmentIdx = np.empty(n, dtype=np.int64)
+    count = 0
+    for s in range(len(segmentStart)):
+        start = segmentStart[s]
+        end = segmentEnd[s]
+        anchor = start
+        for k in range(start + 1, end):
+            if (t[k] - t[k - 1]) / NANOSECONDS_MINUTE > noDataForMinutes:
+                # No data for more than noDataForMinutes minutes: Not a stop
+                anchor = k
+                continue
+            if haversine_km_point(lat[anchor], lng[anchor], lat[k], lng[k]) > stopRadiusKm:
+                if (t[k] - t[anchor]) / NANOSECONDS_MINUTE > minutesForAStop:
+                    firstIdx[count] = anchor
+                    lastIdx[count] = k - 1
+                    medianLat[count] = np.median(lat[anchor:k])
+                    medianLng[count] = np.median(lng[anchor:k])
+                    segmentIdx[count] = s
+                    count += 1
+                anchor = k
+    return firstIdx[:count], lastIdx[:count], medianLat[:count], medianLng[:count], segmentIdx[:count]
+
+
+def detect_trip_stops(dfTrajTrips, minutesForAStop, stopRadiusKm, noDataForMinutes=1e12):
+    """
+    Return the APL of every trip of dfTrajTrips (indexed by time with columns
+    uid, lat, lng, numWeek and idTrip, of one or several participants): the
+    stops of each trip followed by its destination point, ordered by
+    participant, week and trip, with the time in the column datetime.
+    """
+    dfPoints = dfTrajTrips.drop(columns='stepKm', errors='ignore').reset_index(names='datetime')
+    if dfPoints.empty:
+        return dfPoints
+    t = dfTrajTrips.index.to_numpy().astype('datetime64[ns]').astype(np.int64)
+    uid = pd.factorize(dfPoints['uid'], sort=True)[0] if 'uid' in dfPoints.columns else np.zeros(len(dfPoints), dtype=np.int64)
+    order = np.lexsort((t, dfPoints['idTrip'].to_numpy(), dfPoints['numWeek'].to_numpy(), uid))
+    dfPoints = dfPoints.take(order).reset_index(drop=True)
+    t = t[order]
+    uid = uid[order]
+    numWeek = dfPoints['numWeek'].to_numpy()
+    idTrip = dfPoints['idTrip'].to_numpy()
+    newSegment = np.ones(len(dfPoints), dtype=bool)
+    newSegment[1:] = (uid[1:] != uid[:-1]) | (numWeek[1:] != numWeek[:-1]) | (idTrip[1:] != idTrip[:-1])
+    segmentStart = np.flatnonzero(newSegment)
+    segmentEnd = np.append(segmentStart[1:], len(dfPoints))
+    firstIdx, lastIdx, medianLat, medianLng, segmentIdx = stops_kernel(
+        t, dfPoints['lat'].to_numpy(dtype=np.float64), dfPoints['lng'].to_numpy(dtype=np.float64),
+        segmentStart, segmentEnd, stopRadiusKm, minutesForAStop, noDataForMinutes)
+    # Stops: other columns of the last point, median coordinates and time of the first point
+    dfStops = dfPoints.take(lastIdx).reset_index(drop=True)
+    dfStops['lat'] = medianLat
+    dfStops['lng'] = medianLng
+    dfStops['datetime'] = dfPoints['datetime'].to_numpy()[firstIdx]
+    # Destination point of each trip
+    dfDestination = dfPoints.take(segmentEnd - 1).reset_index(drop=True)
+    dfAPL = pd.concat([dfStops, dfDestination], ignore_index=True)
+    aplSegment = np.concatenate([segmentIdx, np.arange(len(segmentStart))])
+    aplDestination = np.concatenate([np.zeros(len(dfStops), dtype=np.int8), np.ones(len(dfDestination), dtype=np.int8)])
+    aplOrder = np.lexsort((np.arange(len(dfAPL)), aplDestination, aplSegment))
+    return dfAPL.take(aplOrder).reset_index(drop=True)
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# STORAGE
+# Read and write the intermediate files (dataTransform) and the outputs
+# (GPSTrackingData, APLData, SummaryData) as CSV, Parquet or Arrow IPC.
+# The format of a file is given by its extension. Parquet and Arrow files have
+# a typed schema (timestamp[ms] datetime, float64 coordinates, dictionary
+# idFile) and are read with memory mapping, so datetime strings are neither
+# written nor parsed. pyarrow is only required by the Parquet and Arrow formats.
+# Tables can be compressed (gzip or zstd): CSV files get the extension of the
+# compression (.csv.gz, .csv.zst; zstd requires zstandard), Parquet and Arrow
+# files compress their pages and buffers and keep their extension.
+# =============================================================================
+import gzip, io, os
+
+import pandas as pd
+
+# =============================================================================
+# # CONSTANTS DEFINITION
+# =============================================================================
+FILE_FORMATS = {'csv': '.csv', 'parquet': '.parquet', 'arrow': '.arrow'}
+
+# Extensions of compressed CSV files
+COMPRESSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+
+# Compression level of gzip (1 fastest - 9 smallest)
+GZIP_LEVEL = 6
+
+# Bytes buffered before each write of a CSV file
+WRITE_BUFFER = 1 << 20
+
+# Columns with a fixed type in Parquet and Arrow files. Other columns keep the
+# type inferred from pandas
+DATETIME_COLUMNS = ['datetime']
+FLOAT_COLUMNS = ['latitude', 'longitude', 'lat', 'lon']
+CATEGORY_COLUMNS = ['idFile']
+STRING_COLUMNS = ['idWeek']
+
+
+def _import_pyarrow(fileFormat):
+    try:
+        import pyarrow
+    except ImportError:
+        msg = 'pyarrow is required to read and write {} files'.format(fileFormat)
+        raise RuntimeError(msg)
+    return pyarrow
+
+
+def _split_compression(fileName):
+    # Remove the extension of a compressed CSV file
+    name, extension = os.path.splitext(fileName)
+    if extension.lower() in COMPRESSIONS.values() and os.path.splitext(name)[1].lower() == FILE_FORMATS['csv']:
+        return name
+    return fileName
+
+
+def get_file_format(urlFile):
+    """
+    Return the format (csv, parquet or arrow) of a file from its extension
+    """
+    extension = os.path.splitext(_split_compression(urlFile))[1].lower()
+    for fileFormat, formatExtension in FILE_FORMATS.items():
+        if extension == formatExtension:
+            return fileFormat
+    msg = 'Wrong file extension ({}). Use {}'.format(os.path.basename(urlFile), ', '.join(FILE_FORMATS.values()))
+    raise RuntimeError(msg)
+
+
+def get_file_name(name, fileFormat, compression=None):
+    """
+    Return the file name of name (without extension) in fileFormat, with the
+    extension of the compression for CSV files
+    """
+    if fileFormat not in FILE_FORMATS:
+        msg = 'Wrong file format ({}). Use {}'.format(fileFormat, ', '.join(FILE_FORMATS))
+        raise RuntimeError(msg)
+    _validate_compression(compression)
+    if fileFormat == 'csv' and compression is not None:
+        return name + FILE_FORMATS[fileFormat] + COMPRESSIONS[compression]
+    return name + FILE_FORMATS[fileFormat]
+
+
+def split_file_name(fileName):
+    """
+    Return (idFile, fileFormat) of a file name, fileFormat is None when the
+    extension is not supported
+    """
+    idFile, extension = os.path.splitext(_split_compression(fileName))
+    for fileFormat, formatExtension in FILE_FORMATS.items():
+        if extension.lower() == formatExtension:
+            return idFile, fileFormat
+    return idFile, None
+
+
+def _validate_compression(compression):
+    if compression is not None and compression not in COMPRESSIONS:
+        msg = 'Wrong compression ({}). Use {}'.format(compression, ', '.join(COMPRESSIONS))
+        raise RuntimeError(msg)
+
+
+def open_text(urlFile, compression=None):
+    """
+    Open urlFile to write text through a buffer of WRITE_BUFFER bytes,
+    compressed with gzip or zstd
+    """
+    _validate_compression(compression)
+    if compression is None:
+        return open(urlFile, 'w', newline='', buffering=WRITE_BUFFER)
+    if compression == 'gzip':
+        binaryFile = gzip.open(urlFile, 'wb', compresslevel=GZIP_LEVEL)
+    else:
+        try:
+            import zstandard
+        except ImportError:
+            msg = 'zstandard is required to write zstd compressed CSV files'
+            raise RuntimeError(msg)
+        binaryFile = zstandard.ZstdCompressor().stream_writer(open(urlFile, 'wb'), closefd=True)
+    return io.TextIOWrapper(io.BufferedWriter(binaryFile, WRITE_BUFFER), newline='')
+
+
+def to_arrow_table(dataFrame):
+    """
+    Convert dataFrame into an Arrow table with the typed schema
+    """
+    pa = _import_pyarrow('Arrow')
+    dataFrame = dataFrame.copy()
+    for column in dataFrame.columns:
+        if column in DATETIME_COLUMNS:
+            dataFrame[column] = pd.to_datetime(dataFrame[column])
+        elif column in FLOAT_COLUMNS:
+            dataFrame[column] = dataFrame[column].astype('float64')
+        elif column in CATEGORY_COLUMNS:
+            dataFrame[column] = dataFrame[column].astype(str).astype('category')
+        elif column in STRING_COLUMNS:
+            dataFrame[column] = dataFrame[column].astype(str)
+    table = pa.Table.from_pandas(dataFrame, preserve_index=False)
+    fields = []
+    for field in table.schema:
+        if field.name in DATETIME_COLUMNS:
+            field = field.with_type(pa.timestamp('ms'))
+        elif field.name in CATEGORY_COLUMNS:
+            field = field.with_type(pa.dictionary(pa.int32(), pa.string()))
+        fields.append(field)
+    return table.cast(pa.schema(fields).remove_metadata())
+
+
+class TableWriter:
+    """
+    Write a table chunk by chunk in urlFile, compressed with gzip or zstd
+    (Arrow files only support zstd). All chunks must have the same columns.
+    """
+
+    def __init__(self, urlFile, compression=None):
+        _validate_compression(compression)
+        self.urlFile = urlFile
+        self.fileFormat = get_file_format(urlFile)
+        self.compression = compression
+        self.writer = None
+        self.numberRows = 0
+
+    def write(self, dataFrame):
+        if self.fileFormat == 'csv':
+            header = self.writer is None
+            if header:
+                self.writer = open_text(self.urlFile, self.compression)
+            dataFrame.to_csv(self.writer, header=header, index=False)
+        else:
+            table = to_arrow_table(dataFrame)
+            if self.writer is None:
+                pa = _import_pyarrow(self.fileFormat)
+                if self.fileFormat == 'parquet':
+                    import pyarrow.parquet as pq
+                    self.writer = pq.ParquetWriter(self.urlFile, table.schema, compression=self.compression or 'snappy')
+                else:
+                    options = pa.ipc.IpcWriteOptions(compression=self.compression)
+                    self.writer = pa.ipc.new_file(self.urlFile, table.schema, options=options)
+            self.writer.write_table(table)
+        self.numberRows += len(dataFrame)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def write_table(dataFrame, urlFile, compression=None):
+    """
+    Write dataFrame in urlFile (format given by the extension)
+    """
+    with TableWriter(urlFile, compression) as writer:
+        writer.write(dataFrame)
+
+
+def read_table(urlFile):
+    """
+    Read urlFile (format given by the extension) in a DataFrame. Parquet and
+    Arrow files are memory mapped; numeric columns without nulls are not
+    copied by pyarrow.
+    """
+    fileFormat = get_file_format(urlFile)
+    if fileFormat == 'csv':
+        return pd.read_csv(urlFile)
+    pa = _import_pyarrow(fileFormat)
+    if fileFormat == 'parquet':
+        import pyarrow.parquet as pq
+        table = pq.read_table(urlFile, memory_map=True)
+    else:
+        table = pa.ipc.open_file(pa.memory_map(urlFile, 'r')).read_all()
+    return table.to_pandas(split_blocks=True)
+
+
+def iter_table(urlFile, chunkRows):
+    """
+    Read urlFile (format given by the extension) in DataFrames of at most
+    chunkRows rows, in the order of the file
+    """
+    fileFormat = get_file_format(urlFile)
+    if fileFormat == 'csv':
+        for dataFrame in pd.read_csv(urlFile, chunksize=chunkRows):
+            yield dataFrame
+        return
+    pa = _import_pyarrow(fileFormat)
+    if fileFormat == 'parquet':
+        import pyarrow.parquet as pq
+        batches = pq.ParquetFile(urlFile, memory_map=True).iter_batches(batch_size=chunkRows)
+    else:
+        reader = pa.ipc.open_file(pa.memory_map(urlFile, 'r'))
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+    for batch in batches:
+        for offset in range(0, batch.num_rows, chunkRows):
+            yield batch.slice(offset, chunkRows).to_pandas(split_blocks=True)
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# SUMMARY DATA
+# Trips, stops and clusters summary of each trip (idFile, idWeek, idTrip)
+# computed with one sort and grouped aggregations.
+# Trip length is the sum of the haversine distances between consecutive points
+# (as distance_straight_line in scikit-mobility), taken from the stepKm column
+# of the trips when they have it (see trips.py)
+# =============================================================================
+import numpy as np
+import pandas as pd
+
+from anlocov import geo
+
+SUMMARY_KEYS = ['idFile', 'idWeek', 'numWeek', 'idTrip']
+
+
+def _group_start(dfSorted, keys):
+    groupIds = dfSorted.groupby(keys, sort=False).ngroup().to_numpy()
+    groupStart = np.ones(len(groupIds), dtype=bool)
+    groupStart[1:] = groupIds[1:] != groupIds[:-1]
+    return groupStart
+
+
+def trips_summary(dfTrajTrips):
+    """
+    tripTimeMin, tripLenKm, GPSPoints, covidStatus and restrictionLevel of each
+    trip. dfTrajTrips is indexed by time with columns uid, lat, lng, idWeek,
+    numWeek, idTrip, covidStatus, restrictionLevel and optionally stepKm
+    (distance from the previous point of the trip) and region (region of the
+    first point of the trip).
+    """
+    columns = SUMMARY_KEYS + ['tripTimeMin', 'tripLenKm', 'GPSPoints', 'covidStatus', 'restrictionLevel']
+    regions = 'region' in dfTrajTrips.columns
+    if regions:
+        columns.append('region')
+    if dfTrajTrips.empty:
+        return pd.DataFrame(columns=columns)
+    dfPoints = pd.DataFrame({'idFile': dfTrajTrips['uid'].to_numpy(), 'idWeek': dfTrajTrips['idWeek'].to_numpy(),
+                             'numWeek': dfTrajTrips['numWeek'].to_numpy(), 'idTrip': dfTrajTrips['idTrip'].to_numpy(),
+                             't': dfTrajTrips.index.to_numpy(), 'lat': dfTrajTrips['lat'].to_numpy(),
+                             'lng': dfTrajTrips['lng'].to_numpy(), 'covidStatus': dfTrajTrips['covidStatus'].to_numpy(),
+                             'restrictionLevel': dfTrajTrips['restrictionLevel'].to_numpy()})
+    if regions:
+        dfPoints['region'] = dfTrajTrips['region'].to_numpy()
+    if 'stepKm' in dfTrajTrips.columns:
+        dfPoints['delta_km'] = dfTrajTrips['stepKm'].to_numpy()
+    dfPoints = dfPoints.sort_values(SUMMARY_KEYS + ['t'], kind='mergesort', ignore_index=True)
+    if 'delta_km' not in dfPoints.columns:
+        groupStart = _group_start(dfPoints, SUMMARY_KEYS)
+        dfPoints['delta_km'] = geo.consecutive_haversine_km(dfPoints['lat'], dfPoints['lng'], groupStart)
+    aggregations = {'tStart': ('t', 'first'), 'tEnd': ('t', 'last'), 'tripLenKm': ('delta_km', 'sum'),
+                    'GPSPoints': ('t', 'size'), 'covidStatus': ('covidStatus', 'first'),
+                    'restrictionLevel': ('restrictionLevel', 'first')}
+    if regions:
+        aggregations['region'] = ('region', 'first')
+    dfSummary = dfPoints.groupby(SUMMARY_KEYS, sort=False).agg(**aggregations)
+    dfSummary['tripTimeMin'] = (dfSummary['tEnd'] - dfSummary['tStart']).dt.total_seconds()/60
+    dfSummary = dfSummary.reset_index()
+    return dfSummary[columns]
+
+
+def stops_clusters_summary(dfAPL):
+    """
+    Number of APL and clusters of each trip. dfAPL has columns uid, idWeek,
+    numWeek, idTrip and cluster.
+    """
+    columns = SUMMARY_KEYS + ['APLs', 'clusters']
+    if dfAPL.empty:
+        return pd.DataFrame(columns=columns)
+    dfStops = pd.DataFrame({'idFile': dfAPL['uid'].to_numpy(), 'idWeek': dfAPL['idWeek'].to_numpy(),
+                            'numWeek': dfAPL['numWeek'].to_numpy(), 'idTrip': dfAPL['idTrip'].to_numpy(),
+                            'cluster': dfAPL['cluster'].to_numpy()})
+    dfSummary = dfStops.groupby(SUMMARY_KEYS, sort=False).agg(APLs=('idTrip', 'count'), clusters=('cluster', 'nunique'))
+    dfSummary = dfSummary.reset_index()
+    return dfSummary[columns]
+
+
+def summary_data(dfTrajTrips, dfAPL):
+    """
+    Join the trips summary with the stops and clusters summary, sorted by
+    idFile, idWeek, numWeek and idTrip
+    """
+    return merge_summaries(trips_summary(dfTrajTrips), stops_clusters_summary(dfAPL))
+
+
+def merge_summaries(dfTripsSummary, dfStopClusterSummary):
+    """
+    Join a trips summary (trips_summary, or the concatenation of the trips
+    summaries of several weeks) with the stops and clusters summary
+    """
+    return pd.merge(dfTripsSummary, dfStopClusterSummary, on=SUMMARY_KEYS, how='outer', sort=True)
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# TAKEOUT ARCHIVES
+# Read the Location History JSON file of a Google Takeout archive (zip) from
+# a stream, without writing the archive or its members to disk: the members
+# are walked in order by their local headers and the member with the
+# locations (LOCATION_HISTORY_FILES) is inflated while it is parsed, as are
+# the monthly files of the Semantic Location History (see semantic.py).
+# The central directory at the end of the archive is not needed, so the
+# archive can be read while it is uploaded (see service.py). Members stored
+# without size (data descriptor) are only supported when they are deflated,
+# as Takeout writes them.
+# =============================================================================
+import io, os, struct, zlib
+
+# =============================================================================
+# # CONSTANTS DEFINITION
+# =============================================================================
+# Members of the archive with the locations of the participant (Takeout names
+# of the Location History file)
+LOCATION_HISTORY_FILES = ('Records.json', 'Location History.json')
+
+# Directory of the archive with the Semantic Location History (one JSON file per month)
+SEMANTIC_HISTORY_DIRECTORY = 'Semantic Location History'
+
+# Kinds of location files
+RECORDS = 'records'
+SEMANTIC = 'semantic'
+
+# Bytes read from the archive on each access
+READ_BLOCK_SIZE = 1 << 16
+
+ZIP_SIGNATURE = b'PK\x03\x04'
+DESCRIPTOR_SIGNATURE = b'PK\x07\x08'
+STORED = 0
+DEFLATED = 8
+ZIP64_EXTRA = 0x0001
+
+
+class _ByteSource(io.RawIOBase):
+    """
+    Binary stream with bytes put back (the bytes read after the end of a
+    deflated member belong to the next one)
+    """
+
+    def __init__(self, readFile):
+        self.readFile = readFile
+        self.pending = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.pending:
+            size = min(len(buffer), len(self.pending))
+            buffer[:size] = self.pending[:size]
+            self.pending = self.pending[size:]
+            return size
+        data = self.readFile.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def read_exact(self, size):
+        data = b''
+        while len(data) < size:
+            block = self.read(size - len(data))
+            if not block:
+                msg = 'Truncated zip archive'
+                raise RuntimeError(msg)
+            data += block
+        return data
+
+    def unread(self, data):
+        self.pending = data + self.pending
+
+
+class ZipMember(io.RawIOBase):
+    """
+    Content of one member of a zip archive read from the stream of the
+    archive (stored members with size or deflated members)
+    """
+
+    def __init__(self, source, name, method, compressedSize):
+        self.source = source
+        self.name = name
+        self.remaining = compressedSize
+        self.decompressor = zlib.decompressobj(-zlib.MAX_WBITS) if method == DEFLATED else None
+        self.done = compressedSize == 0 and self.decompressor is None
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.done:
+            if self.decompressor is None:
+                data = self.source.read(min(len(buffer), self.remaining))
+                if not data:
+                    msg = 'Truncated zip member {}'.format(self.name)
+                    raise RuntimeError(msg)
+                self.remaining -= len(data)
+                self.done = self.remaining == 0
+            else:
+                block = self.decompressor.unconsumed_tail or self.source.read(READ_BLOCK_SIZE)
+                if not block:
+                    msg = 'Truncated zip member {}'.format(self.name)
+                    raise RuntimeError(msg)
+                data = self.decompressor.decompress(block, len(buffer))
+                if self.decompressor.eof:
+                    self.source.unread(self.decompressor.unused_data)
+                    self.done = True
+            if data:
+                buffer[:len(data)] = data
+                return len(data)
+        return 0
+
+    def skip(self):
+        # Read the rest of the member
+        while self.read(READ_BLOCK_SIZE):
+            pass
+
+
+def _zip64_sizes(extra):
+    # Sizes of the zip64 extra field (uncompressed, compressed) or None
+    pos = 0
+    while pos + 4 <= len(extra):
+        headerId, size = struct.unpack_from('<HH', extra, pos)
+        if headerId == ZIP64_EXTRA:
+            values = extra[pos + 4:pos + 4 + size]
+            return struct.unpack_from('<QQ', values) if len(values) >= 16 else None
+        pos += 4 + size
+    return None
+
+
+def iter_zip_members(readFile):
+    """
+    Yield (name, ZipMember) of every member of the zip archive read from
+    the binary stream readFile, in the order of the archive. A member that is
+    not read is skipped when the next one is requested.
+    """
+    source = readFile if isinstance(readFile, _ByteSource) else _ByteSource(readFile)
+    while True:
+        signature = source.read(4)
+        while 0 < len(signature) < 4:
+            block = source.read(4 - len(signature))
+            if not block:
+                break
+            signature += block
+        if signature != ZIP_SIGNATURE:
+            # Central directory (or end of the stream): no more members
+            return
+        (_, flags, method, _, _, _, compressedSize, _, nameLength,
+         extraLength) = struct.unpack('<HHHHHIIIHH', source.read_exact(26))
+        name = source.read_exact(nameLength).decode('utf-8' if flags & 0x800 else 'cp437')
+        extra = source.read_exact(extraLength)
+        zip64Sizes = _zip64_sizes(extra)
+        if compressedSize == 0xFFFFFFFF and zip64Sizes is not None:
+            compressedSize = zip64Sizes[1]
+        if flags & 0x1:
+            msg = 'Encrypted zip member {}'.format(name)
+            raise RuntimeError(msg)
+        if method not in (STORED, DEFLATED) or (method == STORED and flags & 0x8):
+            msg = 'Zip member {} can not be read as a stream (compression method {})'.format(name, method)
+            raise RuntimeError(msg)
+        member = ZipMember(source, name, method, compressedSize)
+        yield name, member
+        member.skip()
+        if flags & 0x8:
+            # Data descriptor: optional signature, crc and sizes (8 bytes each with zip64)
+            descriptor = source.read_exact(4)
+            if descriptor == DESCRIPTOR_SIGNATURE:
+                source.read_exact(4)
+            source.read_exact(16 if zip64Sizes is not None else 8)
+
+
+def iter_location_files(readFile, encoding='utf-8'):
+    """
+    Yield (kind, text stream) of the location files of readFile, a binary
+    stream with a Takeout archive (zip) or with the Location History JSON
+    file itself: RECORDS for the Location History JSON file and SEMANTIC for
+    each month of the Semantic Location History, in the order of the
+    archive. A stream can only be read until the next one is requested.
+    """
+    source = _ByteSource(readFile)
+    signature = source.read(len(ZIP_SIGNATURE))
+    source.unread(signature)
+    if signature != ZIP_SIGNATURE:
+        yield RECORDS, io.TextIOWrapper(io.BufferedReader(source, READ_BLOCK_SIZE), encoding=encoding)
+        return
+    for name, member in iter_zip_members(source):
+        if os.path.basename(name) in LOCATION_HISTORY_FILES:
+            kind = RECORDS
+        elif SEMANTIC_HISTORY_DIRECTORY in name.split('/')[:-1] and name.endswith('.json'):
+            kind = SEMANTIC
+        else:
+            continue
+        yield kind, io.TextIOWrapper(io.BufferedReader(member, READ_BLOCK_SIZE), encoding=encoding)
+
+
+def open_location_history(readFile, encoding='utf-8'):
+    """
+    Return a text stream with the Location History JSON file of readFile, a
+    binary stream with a Takeout archive (zip) or with the JSON file itself
+    """
+    for kind, textFile in iter_location_files(readFile, encoding):
+        if kind == RECORDS:
+            return textFile
+    msg = 'No {} in Takeout archive'.format(' or '.join(LOCATION_HISTORY_FILES))
+    raise RuntimeError(msg)
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# GLH TRANSFORMATION
+# Streaming transformation of Google Location History (GLH) JSON files into
+# CSV, Parquet or Arrow files (see storage.py). The 'locations' array is parsed item by item and stored in typed
+# columns of fixed size, so the memory used tracks CHUNK_SIZE and not the size
+# of the JSON file.
+# The JSON file can also be an open text file (e.g. an upload streamed by
+# service.py or a member of a Takeout archive read by takeout.py).
+# =============================================================================
+import contextlib, json
+
+import numpy as np
+import pandas as pd
+
+from anlocov import storage
+
+# =============================================================================
+# # CONSTANTS DEFINITION
+# =============================================================================
+# Number of locations stored in memory before a chunk is written in the output file
+CHUNK_SIZE = 100000
+
+# Number of characters read from the JSON file on each access
+READ_BLOCK_SIZE = 1 << 20 #1 MiB
+
+# Characters of one JSON value read before a value that can not be decoded is
+# malformed (an item of the locations array is far smaller)
+MAX_VALUE_SIZE = 16 << 20 #16 Mi characters
+
+_WHITESPACE = ' \t\n\r'
+
+
+class _JSONStream:
+    """
+    Incremental reader over a JSON text file. Only the unread part of the
+    file is kept in the buffer (offset is the position of the buffer in the
+    file, in characters).
+    """
+
+    def __init__(self, readFile, blockSize=READ_BLOCK_SIZE, maxValueSize=MAX_VALUE_SIZE):
+        self.readFile = readFile
+        self.blockSize = blockSize
+        self.maxValueSize = maxValueSize
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.offset = 0
+        self.eof = False
+
+    def _fill(self):
+        if self.eof:
+            return False
+        block = self.readFile.read(self.blockSize)
+        if not block:
+            self.eof = True
+            return False
+        self.offset += self.pos
+        self.buffer = self.buffer[self.pos:] + block
+        self.pos = 0
+        return True
+
+    def peek(self):
+        # Return the next non blank character without consuming it
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            msg = "Malformed JSON file: '{}' expected".format(char)
+            raise RuntimeError(msg)
+        self.pos += 1
+
+    def value(self):
+        # Decode the next JSON value, reading more data until it is complete
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as error:
+                # Only a value cut at the end of the buffer (or a value still
+                # smaller than maxValueSize) can be completed by the next block
+                incomplete = error.pos >= len(self.buffer) - 1 or len(self.buffer) - self.pos < self.maxValueSize
+                if not (incomplete and self._fill()):
+                    msg = 'Malformed JSON file at character {}: {}'.format(self.offset + error.pos, error.msg)
+                    raise RuntimeError(msg) from error
+                continue
+            # A number at the end of the buffer may continue in the next block
+            if end == len(self.buffer) and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def _seek_array(stream, arrayKey):
+    # Move the stream to the first item of the top level array arrayKey
+    stream.expect('{')
+    while stream.peek() != '}':
+        key = stream.value()
+        stream.expect(':')
+        if key == arrayKey:
+            stream.expect('[')
+            return True
+        stream.value()
+        if stream.peek() == ',':
+            stream.pos += 1
+    return False
+
+
+def _open_json(urlFile):
+    # Path of a JSON file, or text file already open (not closed here)
+    if hasattr(urlFile, 'read'):
+        return contextlib.nullcontext(urlFile)
+    return open(urlFile, "r")
+
+
+def iter_json_array(urlFile, arrayKey):
+    """
+    Yield the items of the top level array arrayKey of a JSON file (path or
+    text file) one by one ('locations' of the GLH file, 'timelineObjects'
+    of the Semantic Location History files)
+    """
+    with _open_json(urlFile) as read_file:
+        stream = _JSONStream(read_file)
+        if not _seek_array(stream, arrayKey):
+            msg = 'No {} array in JSON File'.format(arrayKey)
+            raise RuntimeError(msg)
+        while stream.peek() != ']':
+            item = stream.value()
+            if stream.peek() == ',':
+                stream.pos += 1
+            yield item
+
+
+def iso_to_milliseconds(isoTimestamps):
+    """
+    Return the milliseconds since the epoch (int64) of ISO 8601 timestamps
+    (e.g. '2022-01-12T17:18:24.190Z') and the mask of the valid ones
+    """
+    datetimes = pd.to_datetime(pd.Series(isoTimestamps, dtype=object), format='ISO8601', utc=True, errors='coerce')
+    valid = datetimes.notna().to_numpy()
+    milliseconds = np.zeros(len(valid), dtype=np.int64)
+    milliseconds[valid] = datetimes[valid].dt.tz_convert(None).to_numpy().astype('datetime64[ms]').astype(np.int64)
+    return milliseconds, valid
+
+
+def _typed_chunk(timestampMs, latitudeE7, longitudeE7, count, isoPositions, isoTimestamps, stats):
+    # Copy of the first count rows of the chunk with the ISO timestamps converted (invalid ones are skipped)
+    chunk = {'timestampMs': timestampMs[:count].copy(), 'latitudeE7': latitudeE7[:count].copy(),
+             'longitudeE7': longitudeE7[:count].copy()}
+    if isoPositions:
+        isoPositions = np.asarray(isoPositions)
+        milliseconds, valid = iso_to_milliseconds(isoTimestamps)
+        chunk['timestampMs'][isoPositions] = milliseconds
+        if not valid.all():
+            keep = np.ones(count, dtype=bool)
+            keep[isoPositions[~valid]] = False
+            chunk = {column: values[keep] for column, values in chunk.items()}
+            stats['skipped'] += int((~valid).sum())
+    return chunk
+
+
+def iter_location_chunks(urlFile, chunkSize=CHUNK_SIZE, stats=None):
+    """
+    Walk the 'locations' array of a GLH JSON file (path or text file) and
+    yield typed columns (int64 timestampMs, int32 latitudeE7 and
+    longitudeE7) with at most chunkSize rows. The time is timestampMs or,
+    in the newer exports, the ISO 8601 timestamp. Locations without time,
+    latitudeE7 or longitudeE7, or with values out of the range of the
+    columns (e.g. latitudeE7 4284967296 of some exports, outside any zone),
+    are skipped. The number of locations read and skipped is stored in
+    stats.
+    """
+    if stats is None:
+        stats = {}
+    stats['locations'] = 0
+    stats['skipped'] = 0
+    timestampMs = np.empty(chunkSize, dtype=np.int64)
+    latitudeE7 = np.empty(chunkSize, dtype=np.int32)
+    longitudeE7 = np.empty(chunkSize, dtype=np.int32)
+    # Positions and values of the ISO timestamps of the chunk, converted together
+    isoPositions = []
+    isoTimestamps = []
+    count = 0
+    for location in iter_json_array(urlFile, 'locations'):
+        stats['locations'] += 1
+        try:
+            latitudeE7[count] = location['latitudeE7']
+            longitudeE7[count] = location['longitudeE7']
+            if 'timestampMs' in location:
+                timestampMs[count] = int(location['timestampMs'])
+            else:
+                isoTimestamps.append(str(location['timestamp']))
+                isoPositions.append(count)
+        except (KeyError, TypeError, ValueError, OverflowError):
+            stats['skipped'] += 1
+            continue
+        count += 1
+        if count == chunkSize:
+            yield _typed_chunk(timestampMs, latitudeE7, longitudeE7, count, isoPositions, isoTimestamps, stats)
+            isoPositions = []
+            isoTimestamps = []
+            count = 0
+    if count > 0:
+        yield _typed_chunk(timestampMs, latitudeE7, longitudeE7, count, isoPositions, isoTimestamps, stats)
+
+
+def chunk_to_dataframe(chunk):
+    """
+    Transform a chunk of typed GLH columns into the datetime, latitude and
+    longitude (decimal degrees) columns of the transformed file.
+    """
+    return pd.DataFrame({'datetime': pd.to_datetime(chunk['timestampMs'], unit='ms'),
+                         'latitude': chunk['latitudeE7'] / 1e7,
+                         'longitude': chunk['longitudeE7'] / 1e7})
+
+
+def _validate_stats(stats, numberObservations):
+    if stats['locations'] == 0:
+        msg = 'Empty JSON file. Replace test.json in dataJSON directory'
+        raise RuntimeError(msg)
+    if numberObservations == 0:
+        msg = 'No columns timestampMs (or timestamp), latitudeE7 or longitudeE7 in JSON File'
+        raise RuntimeError(msg)
+
+
+def transform_glh(urlFile, chunkSize=CHUNK_SIZE):
+    """
+    Transform a GLH JSON file into a DataFrame with the columns datetime,
+    latitude and longitude of the transformed file (input of
+    processing.compute_apl), without writing any file.
+    """
+    stats = {}
+    dataFrameChunks = [chunk_to_dataframe(chunk) for chunk in iter_location_chunks(urlFile, chunkSize, stats)]
+    _validate_stats(stats, sum(len(dataFrameChunk) for dataFrameChunk in dataFrameChunks))
+    return pd.concat(dataFrameChunks, ignore_index=True)
+
+
+def transform_json_file(urlFile, urlSaveFile, chunkSize=CHUNK_SIZE):
+    """
+    Transform a GLH JSON file (path or text file) into a CSV, Parquet or
+    Arrow file (given by the extension of urlSaveFile) written chunk by chunk.
+    Return the number of observations and the first and last datetime.
+    """
+    stats = {}
+    startDate = None
+    endDate = None
+    with storage.TableWriter(urlSaveFile) as writer:
+        for chunk in iter_location_chunks(urlFile, chunkSize, stats):
+            dataFrameChunk = chunk_to_dataframe(chunk)
+            if writer.numberRows == 0:
+                startDate = dataFrameChunk.iloc[0, 0]
+            writer.write(dataFrameChunk)
+            endDate = dataFrameChunk.iloc[-1, 0]
+        numberObservations = writer.numberRows
+    _validate_stats(stats, numberObservations)
+    return numberObservations, startDate, endDate
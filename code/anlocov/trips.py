@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# WEEKLY TRAJECTORIES AND TRIPS
+# Each week (idWeek, int32 code of the week from Monday to Sunday, see
+# week_codes) of a participant is an independent trajectory: it is
+# kept when it is longer than MIN_LENGTH_TRAJ_MTR and split into trips at the
+# time gaps longer than MIN_TIME_TRIP_GAP_THRESHOLD_MINUTES. Trips shorter
+# than MIN_LENGTH_TRIP_MTR are discarded.
+# The segmentation follows movingpandas (TrajectoryCollection with min_length
+# and ObservationGapSplitter) over the arrays of the week, without building
+# Shapely points and lines. Lengths are sums of haversine distances; the
+# lengths within GEODESIC_MARGIN of a threshold are measured again on the
+# WGS84 ellipsoid (geopy geodesic, as movingpandas) so the same trajectories
+# and trips are kept.
+# The haversine distance from the previous point of the trip (stepKm, 0 at
+# the first point) is kept in the trips for the trips summary.
+# Weeks are independent until the clustering, so trips and stops of several
+# weeks are computed in a pool of processes (or one by one with the serial
+# executor, useful to debug). Results keep the order of the weeks.
+# In cohort mode (cohort_trips_stops) the weeks of every participant are
+# segmented together in bulk passes over the arrays of the cohort.
+# =============================================================================
+import concurrent.futures as cf
+import os
+
+import numpy as np
+import pandas as pd
+
+from anlocov import geo, stops
+
+# =============================================================================
+# # CONSTANTS DEFINITION
+# =============================================================================
+WEEK_EXECUTORS = ('process', 'serial')
+WEEK_EXECUTOR = 'process'
+
+# Tasks per worker when weeks are sent to the pool
+CHUNKS_PER_WORKER = 4
+
+# Relative difference between haversine and WGS84 geodesic lengths (at most
+# about 0.5%) below which the geodesic length is computed
+GEODESIC_MARGIN = 0.01
+
+NANOSECONDS_MINUTE = 60 * 10**9
+NANOSECONDS_DAY = 24 * 60 * NANOSECONDS_MINUTE
+
+_geodesic = []
+
+
+def _get_geodesic():
+    # geopy is imported the first time a length is close to a threshold
+    if not _geodesic:
+        try:
+            from geopy.distance import geodesic
+        except ImportError:
+            geodesic = None
+        _geodesic.append(geodesic)
+    return _geodesic[0]
+
+
+def week_codes(t):
+    """
+    Week (Monday to Sunday, as the pandas period 'W') of the times t (int64
+    nanoseconds) as int32 codes
+    """
+    # 1970-01-01 is a Thursday: weeks are counted from Monday 1969-12-29
+    return ((np.asarray(t) // NANOSECONDS_DAY + 3) // 7).astype(np.int32)
+
+
+def week_start(weekCode):
+    """
+    First day (Monday) of the week weekCode
+    """
+    return np.datetime64(int(weekCode) * 7 - 3, 'D')
+
+
+def week_label(weekCode):
+    """
+    Label of the week weekCode: '<first day>/<last day>', as the pandas period 'W'
+    """
+    start = week_start(weekCode)
+    return '{}/{}'.format(start, start + 6)
+
+
+def is_long_enough(lengthM, lat, lng, minLengthM):
+    """
+    True when the path lat, lng with haversine length lengthM (meters) is at
+    least minLengthM meters long on the WGS84 ellipsoid
+    """
+    if lengthM >= minLengthM * (1. + GEODESIC_MARGIN):
+        return True
+    if lengthM < minLengthM * (1. - GEODESIC_MARGIN):
+        return False
+    geodesic = _get_geodesic()
+    if geodesic is None:
+        return lengthM >= minLengthM
+    return geodesic(*zip(lat, lng)).m >= minLengthM
+
+
+def week_trips(dfWeek, params):
+    """
+    Compute the trips of one week. dfWeek is indexed by time with the points
+    of the week (columns lat and lng). Return (hasTrajectory, dfWeekTrips),
+    where dfWeekTrips has the points of every trip with columns stepKm,
+    numWeek (0, set by the caller) and idTrip, or None when the week has no
+    trips. As in
+    movingpandas, idWeek of the trips is '<idWeek>_<split>'.
+    """
+    # Trajectory points: sorted by time, one point per time
+    dfWeek = dfWeek.sort_index(kind='mergesort')
+    dfWeek = dfWeek[~dfWeek.index.duplicated(keep='first')]
+    if len(dfWeek) < 2:
+        return False, None
+    lat = dfWeek['lat'].to_numpy(dtype=np.float64)
+    lng = dfWeek['lng'].to_numpy(dtype=np.float64)
+    stepKm = geo.consecutive_haversine_km(lat, lng)
+    stepM = stepKm * 1000.
+    if not is_long_enough(stepM.sum(), lat, lng, params['MIN_LENGTH_TRAJ_MTR']):
+        return False, None
+    # Trips: split where the time between two points is longer than the gap
+    t = dfWeek.index.to_numpy().astype('datetime64[ns]').astype(np.int64)
+    newTrip = np.ones(len(t), dtype=bool)
+    newTrip[1:] = np.diff(t) > params['MIN_TIME_TRIP_GAP_THRESHOLD_MINUTES'] * NANOSECONDS_MINUTE
+    tripStart = np.flatnonzero(newTrip)
+    tripEnd = np.append(tripStart[1:], len(t))
+    stepM[tripStart] = 0.
+    stepKm[tripStart] = 0.
+    tripLengthM = np.add.reduceat(stepM, tripStart)
+    tripPoints = []
+    tripIds = []
+    for i, (start, end, lengthM) in enumerate(zip(tripStart, tripEnd, tripLengthM)):
+        if end - start > 1 and is_long_enough(lengthM, lat[start:end], lng[start:end], params['MIN_LENGTH_TRIP_MTR']):
+            tripPoints.append(np.arange(start, end))
+            # Trajectory id given by movingpandas: idWeek and index of the gap split
+            tripIds.append('{}_{}'.format(week_label(dfWeek['idWeek'].iat[0]), i))
+    if not tripPoints:
+        return True, None
+    tripSizes = [len(points) for points in tripPoints]
+    points = np.concatenate(tripPoints)
+    dfWeekTrips = dfWeek.take(points)
+    dfWeekTrips['stepKm'] = stepKm[points]
+    dfWeekTrips['idWeek'] = np.repeat(np.array(tripIds, dtype=object), tripSizes)
+    dfWeekTrips['numWeek'] = 0
+    dfWeekTrips['idTrip'] = np.repeat(np.arange(len(tripPoints)), tripSizes)
+    return True, dfWeekTrips
+
+
+def week_trips_stops(dfWeek, params):
+    """
+    Compute the trips and stops of one week. dfWeek is indexed by time with
+    columns uid, datetime, lat, lng, covidStatus, restrictionLevel and
+    idWeek. Return (hasTrajectory, dfWeekTrips, dfWeekStops); the trips and
+    stops are None when the week has no trips and numWeek is 0.
+    """
+    hasTrajectory, dfWeekTrips = week_trips(dfWeek, params)
+    if dfWeekTrips is None:
+        return hasTrajectory, None, None
+    dfWeekStops = stops.detect_trip_stops(dfWeekTrips, minutesForAStop=params['MIN_MINUTES_FOR_A_STOP'],
+                                          stopRadiusKm=stops.stop_radius_km(params))
+    return hasTrajectory, dfWeekTrips, dfWeekStops
+
+
+def compute_weeks(dfWeeks, params, executor=WEEK_EXECUTOR, maxWorkers=None):
+    """
+    Apply week_trips_stops to every week of the list dfWeeks with the
+    executor 'process' (pool of maxWorkers processes, None uses the number
+    of processors) or 'serial'. Return the results in the order of dfWeeks.
+    """
+    if executor not in WEEK_EXECUTORS:
+        msg = 'Wrong week executor ({}). Use {}'.format(executor, ', '.join(WEEK_EXECUTORS))
+        raise RuntimeError(msg)
+    if executor == 'serial' or maxWorkers == 1 or len(dfWeeks) < 2:
+        return [week_trips_stops(dfWeek, params) for dfWeek in dfWeeks]
+    numberWorkers = maxWorkers or os.cpu_count() or 1
+    chunkSize = max(1, len(dfWeeks) // (numberWorkers * CHUNKS_PER_WORKER))
+    with cf.ProcessPoolExecutor(max_workers=numberWorkers) as pool:
+        return list(pool.map(week_trips_stops, dfWeeks, [params] * len(dfWeeks), chunksize=chunkSize))
+
+
+def _are_long_enough(lengthM, segmentStart, segmentEnd, lat, lng, minLengthM, candidates, stepM=None):
+    # is_long_enough of each segment (start:end) among candidates, without geodesic
+    # lengths far from the threshold. With stepM, lengths close to the threshold are
+    # summed again as in week_trips
+    longEnough = candidates & (lengthM >= minLengthM * (1. + GEODESIC_MARGIN))
+    close = candidates & ~longEnough & (lengthM >= minLengthM * (1. - GEODESIC_MARGIN))
+    for s in np.flatnonzero(close):
+        start, end = segmentStart[s], segmentEnd[s]
+        length = lengthM[s] if stepM is None else stepM[start:end].sum()
+        longEnough[s] = is_long_enough(length, lat[start:end], lng[start:end], minLengthM)
+    return longEnough
+
+
+def cohort_trips_stops(dfPoints, params):
+    """
+    Compute the trips and stops of every week of several participants, as
+    week_trips_stops, in bulk passes over the arrays. dfPoints is indexed by
+    time with columns uid, datetime, lat, lng, covidStatus, restrictionLevel
+    and idWeek. Return (dfWeeks, dfTrips, dfStops): dfWeeks has one row per
+    week of each participant (uid, idWeek, hasTrajectory and numWeek, the
+    order of the week among the weeks with trajectories of the participant,
+    -1 without trajectory); dfTrips and dfStops have the trips and stops of
+    every week.
+    """
+    # Points sorted by participant, week and time, one point per time
+    t = dfPoints.index.to_numpy().astype('datetime64[ns]').astype(np.int64)
+    uid = pd.factorize(dfPoints['uid'], sort=True)[0]
+    week = pd.factorize(dfPoints['idWeek'], sort=True)[0]
+    order = np.lexsort((t, week, uid))
+    t, uid, week = t[order], uid[order], week[order]
+    newWeek = np.ones(len(t), dtype=bool)
+    newWeek[1:] = (uid[1:] != uid[:-1]) | (week[1:] != week[:-1])
+    keep = np.ones(len(t), dtype=bool)
+    keep[1:] = newWeek[1:] | (t[1:] != t[:-1])
+    order, t, uid, newWeek = order[keep], t[keep], uid[keep], newWeek[keep]
+    dfSorted = dfPoints.take(order)
+    lat = dfSorted['lat'].to_numpy(dtype=np.float64)
+    lng = dfSorted['lng'].to_numpy(dtype=np.float64)
+    # Weeks with trajectory: at least two points and MIN_LENGTH_TRAJ_MTR
+    weekStart = np.flatnonzero(newWeek)
+    weekEnd = np.append(weekStart[1:], len(t))
+    stepKm = geo.consecutive_haversine_km(lat, lng, newWeek)
+    stepM = stepKm * 1000.
+    weekLengthM = np.add.reduceat(stepM, weekStart) if len(t) else np.zeros(0)
+    hasTrajectory = _are_long_enough(weekLengthM, weekStart, weekEnd, lat, lng, params['MIN_LENGTH_TRAJ_MTR'],
+                                     weekEnd - weekStart >= 2, stepM)
+    weekUid = uid[weekStart]
+    newUid = np.ones(len(weekStart), dtype=bool)
+    newUid[1:] = weekUid[1:] != weekUid[:-1]
+    trajectoryBefore = np.cumsum(hasTrajectory) - hasTrajectory
+    numWeek = np.where(hasTrajectory, trajectoryBefore - trajectoryBefore[np.flatnonzero(newUid)][np.cumsum(newUid) - 1], -1)
+    # Trips: split at the start of each week and where the time between two points is longer than the gap
+    newTrip = newWeek.copy()
+    newTrip[1:] |= np.diff(t) > params['MIN_TIME_TRIP_GAP_THRESHOLD_MINUTES'] * NANOSECONDS_MINUTE
+    tripStart = np.flatnonzero(newTrip)
+    tripEnd = np.append(tripStart[1:], len(t))
+    tripWeek = np.cumsum(newWeek)[tripStart] - 1
+    tripStep = stepM.copy()
+    tripStep[tripStart] = 0.
+    stepKm[tripStart] = 0.
+    tripLengthM = np.add.reduceat(tripStep, tripStart) if len(t) else np.zeros(0)
+    keepTrip = _are_long_enough(tripLengthM, tripStart, tripEnd, lat, lng, params['MIN_LENGTH_TRIP_MTR'],
+                                hasTrajectory[tripWeek] & (tripEnd - tripStart > 1))
+    # Index of the split (movingpandas trajectory id) and of the trip in the week
+    firstTrip = np.searchsorted(tripStart, weekStart)
+    tripSplit = np.arange(len(tripStart)) - firstTrip[tripWeek]
+    keptBefore = np.cumsum(keepTrip) - keepTrip
+    tripId = keptBefore - keptBefore[firstTrip[tripWeek]]
+    dfWeeks = pd.DataFrame({'uid': dfSorted['uid'].to_numpy()[weekStart], 'idWeek': dfSorted['idWeek'].to_numpy()[weekStart],
+                            'hasTrajectory': hasTrajectory, 'numWeek': numWeek})
+    kept = np.flatnonzero(keepTrip)
+    tripSizes = tripEnd[kept] - tripStart[kept]
+    tripPoints = np.repeat(tripStart[kept] - np.cumsum(tripSizes) + tripSizes, tripSizes) + np.arange(tripSizes.sum())
+    dfTrips = dfSorted.take(tripPoints)
+    dfTrips['stepKm'] = stepKm[tripPoints]
+    weekIds = dfSorted['idWeek'].to_numpy()[tripStart[kept]]
+    weekLabels = {weekCode: week_label(weekCode) for weekCode in np.unique(weekIds)}
+    tripIds = np.array(['{}_{}'.format(weekLabels[idWeek], split) for idWeek, split in zip(weekIds, tripSplit[kept])],
+                       dtype=object)
+    dfTrips['idWeek'] = np.repeat(tripIds, tripSizes)
+    dfTrips['numWeek'] = np.repeat(numWeek[tripWeek[kept]], tripSizes)
+    dfTrips['idTrip'] = np.repeat(tripId[kept], tripSizes)
+    dfStops = stops.detect_trip_stops(dfTrips, minutesForAStop=params['MIN_MINUTES_FOR_A_STOP'],
+                                      stopRadiusKm=stops.stop_radius_km(params))
+    return dfWeeks, dfTrips, dfStops
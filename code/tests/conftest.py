@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# TESTS OF THE KERNELS
+# Hand-built tracks with the results worked out by hand from the rules of
+# scikit-mobility and MovingPandas (as arrays, so the tests run without
+# them). With scikit-mobility installed, the stops are also compared with
+# skmob.preprocessing.detection.stops on random trips (test_stops.py).
+# Run from the project directory: python -m pytest code/tests
+# =============================================================================
+import os, sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+# Kilometers of one degree of latitude (geo.EARTH_RADIUS_KM)
+KM_PER_DEGREE = 6371.0 * np.pi / 180
+
+START = pd.Timestamp('2020-03-02 08:00:00')
+
+
+def _track(minutes, northKm, uid='u1', **columns):
+    # Points going north from (0, -78): minutes from START and km from the first point
+    df = pd.DataFrame({'uid': uid, 'datetime': START + pd.to_timedelta(np.asarray(minutes, dtype=float), unit='min'),
+                       'lat': np.asarray(northKm, dtype=float) / KM_PER_DEGREE, 'lng': -78.0})
+    for name, values in columns.items():
+        df[name] = values
+    return df
+
+
+@pytest.fixture
+def track():
+    """
+    Build a track: track(minutes, northKm, uid='u1', **columns) is a frame
+    with the columns uid, datetime, lat and lng (plus columns)
+    """
+    return _track
+
+
+@pytest.fixture
+def params():
+    from anlocov import parameters
+    return dict(parameters.get_parameters(), MIN_LENGTH_TRAJ_MTR=200, MIN_LENGTH_TRIP_MTR=100,
+                MIN_TIME_TRIP_GAP_THRESHOLD_MINUTES=30, MIN_MINUTES_FOR_A_STOP=5, MIN_SPATIAL_RADIUS_KM_STOP=0.1)
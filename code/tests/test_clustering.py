@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# CLUSTERING (skmob cluster: sklearn DBSCAN, ranked by size)
+# =============================================================================
+import numpy as np
+import pytest
+
+from anlocov import clustering
+
+# Two clusters of 4 points 0.08 km apart (radius 0.05 km, 4 samples) and a
+# border point between them, within the radius of a core point of each
+CLUSTER_A = [-.085, -.08, -.075, -.04]
+BORDER = [0.]
+CLUSTER_B = [.04, .075, .08, .085]
+FAR = [5.]
+
+
+def _clusters(track, northKm, minSamples=4):
+    dfAPL = track(np.arange(len(northKm)), northKm)
+    return clustering.cluster_apl(dfAPL, clusterRadiusKm=0.05, minSamples=minSamples)['cluster'].to_numpy()
+
+
+@pytest.mark.parametrize('northKm, expected', [
+    # The border point joins the first cluster (lowest DBSCAN label), which then is the largest
+    (CLUSTER_A + BORDER + CLUSTER_B + FAR, [0, 0, 0, 0, 0, 1, 1, 1, 1, -1]),
+    (CLUSTER_B + BORDER + CLUSTER_A + FAR, [0, 0, 0, 0, 0, 1, 1, 1, 1, -1]),
+    # Border point first: it is still given to the first cluster found, not left as noise
+    (BORDER + CLUSTER_A + CLUSTER_B + FAR, [0, 0, 0, 0, 0, 1, 1, 1, 1, -1]),
+])
+def test_shared_border_point(track, northKm, expected):
+    np.testing.assert_array_equal(_clusters(track, northKm), expected)
+
+
+def test_rank_ties_by_higher_label():
+    # Clusters of the same size: the higher DBSCAN label gets the lower rank (scikit-mobility)
+    np.testing.assert_array_equal(clustering.rank_clusters([0, 0, 1, 1, 2, 2, 2, -1]), [2, 2, 1, 1, 0, 0, 0, -1])
+
+
+def test_one_sample_and_participants(track):
+    # With one sample every APL is in a cluster; participants are clustered separately
+    dfAPL = track(np.arange(6), [0., .01, 3., 0., .02, .03], uid=['u1', 'u1', 'u1', 'u2', 'u2', 'u2'])
+    clusters = clustering.cluster_apl(dfAPL, clusterRadiusKm=0.05, minSamples=1)['cluster'].to_numpy()
+    np.testing.assert_array_equal(clusters, [0, 0, 1, 0, 0, 0])
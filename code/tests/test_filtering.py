@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# FILTERING AND COMPRESSION (skmob filter and compress)
+# =============================================================================
+import numpy as np
+import pandas as pd
+import pytest
+
+from anlocov import filtering
+
+# Track of one point per minute going north 0.05 km per minute, with a fast
+# 1 km loop (loop rule) and a second point at the time of the previous one
+# (infinite speed, speed rule)
+MINUTES = [0, 1, 2, 3, 4, 5, 6, 6, 7, 8, 9, 10, 11, 12]
+NORTH_KM = [0., .05, 1., .052, .1, .15, .2, .21, .25, .3, .35, .4, .45, .5]
+SPEED_POINT = 7
+LOOP_POINT = 2
+
+
+def _kept(dfCompressed, dfTrack):
+    # Positions in dfTrack of the points of dfCompressed (radius 0: one point per group)
+    return np.searchsorted(dfTrack['datetime'].to_numpy(), dfCompressed['datetime'].to_numpy())
+
+
+def test_speed_and_loop(track):
+    dfTrack = track(MINUTES, NORTH_KM)
+    dfCompressed, stats = filtering.filter_compress(dfTrack, maxSpeedKmh=200, spatialRadiusKm=0.)
+    expected = np.delete(np.arange(len(dfTrack)), [LOOP_POINT, SPEED_POINT])
+    np.testing.assert_array_equal(_kept(dfCompressed, dfTrack), expected)
+    assert stats == {'speed': 1, 'loops': 1, 'compression': 0}
+
+
+def test_compression_median_and_first_time(track):
+    dfTrack = track([0, 1, 2, 3, 4], [0., .01, .03, .5, .51], covidStatus=np.arange(5, dtype=np.int8))
+    dfCompressed, stats = filtering.filter_compress(dfTrack, maxSpeedKmh=200, spatialRadiusKm=0.05,
+                                                    includeLoops=False)
+    np.testing.assert_array_equal(dfCompressed['datetime'], dfTrack['datetime'].iloc[[0, 3]])
+    np.testing.assert_allclose(dfCompressed['lat'], [dfTrack['lat'].iloc[1], dfTrack['lat'].iloc[3:].median()])
+    np.testing.assert_array_equal(dfCompressed['covidStatus'], [0, 3])
+    assert stats['compression'] == 3
+
+
+@pytest.mark.parametrize('partitionSize', [1, 2, 3, 5, 8])
+@pytest.mark.parametrize('spatialRadiusKm', [0., .06])
+def test_stream_partitions(track, partitionSize, spatialRadiusKm):
+    # The decisions on the spike and the loop depend on points of the next
+    # partitions: the carried points give the result of the whole track
+    dfTrack = track(MINUTES, NORTH_KM)
+    dfExpected, statsExpected = filtering.filter_compress(dfTrack, maxSpeedKmh=200, spatialRadiusKm=spatialRadiusKm)
+    stream = filtering.FilterCompressStream(maxSpeedKmh=200, spatialRadiusKm=spatialRadiusKm)
+    partitions = [dfTrack.iloc[start:start + partitionSize] for start in range(0, len(dfTrack), partitionSize)]
+    dfStream = pd.concat([stream.push(dfPartition, final=i == len(partitions) - 1)
+                          for i, dfPartition in enumerate(partitions)], ignore_index=True)
+    pd.testing.assert_frame_equal(dfStream, dfExpected)
+    assert stream.stats == statsExpected
+    assert statsExpected['speed'] == 1 and statsExpected['loops'] == 1
+
+
+def test_stream_spike_at_partition_boundary(track):
+    dfTrack = track(MINUTES, NORTH_KM)
+    stream = filtering.FilterCompressStream(maxSpeedKmh=200, spatialRadiusKm=0.)
+    dfFirst = stream.push(dfTrack.iloc[:SPEED_POINT + 1])
+    dfLast = stream.push(dfTrack.iloc[SPEED_POINT + 1:], final=True)
+    dfStream = pd.concat([dfFirst, dfLast], ignore_index=True)
+    expected = np.delete(np.arange(len(dfTrack)), [LOOP_POINT, SPEED_POINT])
+    np.testing.assert_array_equal(_kept(dfStream, dfTrack), expected)
+    assert stream.stats == {'speed': 1, 'loops': 1, 'compression': 0}
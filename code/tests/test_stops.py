@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# STOP DETECTION (skmob stops, radius 0.1 km and 5 minutes)
+# =============================================================================
+import os, sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from anlocov import parameters, stops
+
+RADIUS_KM = 0.1
+MINUTES_FOR_A_STOP = 5
+
+APL_COLUMNS = ['uid', 'datetime', 'lat', 'lng', 'idWeek', 'numWeek', 'idTrip', 'covidStatus', 'restrictionLevel']
+
+URL_BENCHMARK = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, 'benchmark')
+
+
+def _trips(track, trips):
+    # Points of the trips [(minutes, northKm), ...] indexed by time, as trips.week_trips returns them
+    dfTrips = pd.concat([track(minutes, northKm, idTrip=idTrip, numWeek=0)
+                         for idTrip, (minutes, northKm) in enumerate(trips)], ignore_index=True)
+    dfTrips['point'] = np.arange(len(dfTrips))
+    return dfTrips.set_index('datetime').rename_axis('t')
+
+
+def _detect(dfTrips):
+    return stops.detect_trip_stops(dfTrips, MINUTES_FOR_A_STOP, RADIUS_KM)
+
+
+def test_stop_and_anchor_at_end_of_trip(track):
+    # A stop of 8 minutes, then the trip ends 20 minutes after its last anchor
+    # without leaving the radius: the last anchor is not a stop, only the destination
+    dfTrips = _trips(track, [([0, 2, 4, 6, 8, 10, 12, 20, 30], [0., .01, .02, .01, 0., 1., 1.01, 1.02, 1.])])
+    dfAPL = _detect(dfTrips)
+    np.testing.assert_array_equal(dfAPL['point'], [4, 8])
+    np.testing.assert_array_equal(dfAPL['datetime'], dfTrips.index[[0, 8]])
+    np.testing.assert_allclose(dfAPL['lat'], [dfTrips['lat'].iloc[:5].median(), dfTrips['lat'].iloc[8]])
+
+
+def test_anchor_not_carried_to_next_trip(track):
+    # The second trip starts where the first one ended: its anchor is its first
+    # point, so leaving after 4 minutes is not a stop
+    dfTrips = _trips(track, [([0, 2, 10, 30], [0., 1., 1.01, 1.]), ([31, 33, 35], [1., 1.01, 3.])])
+    dfAPL = _detect(dfTrips)
+    np.testing.assert_array_equal(dfAPL['point'], [3, 6])
+    np.testing.assert_array_equal(dfAPL['idTrip'], [0, 1])
+
+
+def test_stop_at_exact_minutes(track):
+    # Leaving exactly MINUTES_FOR_A_STOP minutes after the anchor is not a stop (strictly longer)
+    dfTrips = _trips(track, [([0, 3, 5, 9], [0., .01, 1., 2.])])
+    np.testing.assert_array_equal(_detect(dfTrips)['point'], [3])
+    dfTrips = _trips(track, [([0, 3, 5.5, 9], [0., .01, 1., 2.])])
+    np.testing.assert_array_equal(_detect(dfTrips)['point'], [1, 3])
+
+
+def test_stop_radius_factor(track, params):
+    # The radius of the weeks is MIN_STOP_RADIUS_FACTOR * MIN_SPATIAL_RADIUS_KM_STOP
+    from anlocov import trips
+    dfWeek = track([0, 2, 4, 6, 8, 10, 12], [0., .03, .06, .03, 0., 1., 1.2]).set_index('datetime').rename_axis('t')
+    dfWeek['idWeek'] = trips.week_codes(dfWeek.index.to_numpy().astype('datetime64[ns]').astype(np.int64))
+    for factor, expected in [(1, 0), (2, 1)]:
+        params = dict(params, MIN_STOP_RADIUS_FACTOR=factor, MIN_SPATIAL_RADIUS_KM_STOP=0.05)
+        _, _, dfWeekStops = trips.week_trips_stops(dfWeek, params)
+        assert len(dfWeekStops) == expected + 1
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_same_as_skmob(seed):
+    # Random trips of the stops benchmark against the former loop calling
+    # skmob.preprocessing.detection.stops on each trip
+    pytest.importorskip('skmob')
+    sys.path.insert(0, URL_BENCHMARK)
+    import stopsKernel
+    params = parameters.get_parameters()
+    dfTrajTrips = stopsKernel.synthetic_trips(30, seed=seed)
+    dfExpected = stopsKernel.skmob_trip_stops(dfTrajTrips, params)
+    dfResult = stops.detect_trip_stops(dfTrajTrips, minutesForAStop=params['MIN_MINUTES_FOR_A_STOP'],
+                                       stopRadiusKm=stops.stop_radius_km(params))
+    assert len(dfResult) > 30
+    pd.testing.assert_frame_equal(dfExpected[APL_COLUMNS].reset_index(drop=True),
+                                  dfResult[APL_COLUMNS].reset_index(drop=True), check_dtype=False, check_exact=False,
+                                  rtol=0, atol=1e-12)
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# TRANSFORMATION OF GLH JSON FILES (streamed parser and typed chunks)
+# =============================================================================
+import io, json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from anlocov import merge, transformation
+
+LOCATIONS = [{'timestampMs': '1583136000000', 'latitudeE7': -1806530, 'longitudeE7': -784678340},
+             {'timestampMs': '1583136060000', 'latitudeE7': 4284967296, 'longitudeE7': -784678340},
+             {'timestampMs': '1583136120000', 'latitudeE7': -1806531, 'longitudeE7': -784678341},
+             {'timestamp': '2020-03-02T08:03:00.500Z', 'latitudeE7': -1806532, 'longitudeE7': -784678342},
+             {'timestampMs': '1583136240000', 'latitudeE7': -1806533}]
+
+
+def _glh(locations=LOCATIONS):
+    return io.StringIO(json.dumps({'locations': locations}))
+
+
+@pytest.mark.parametrize('chunkSize', [1, 2, 100])
+def test_out_of_range_location_is_skipped(chunkSize):
+    # latitudeE7 above 2^31 (some exports) and a location without longitudeE7 are skipped
+    stats = {}
+    chunks = list(transformation.iter_location_chunks(_glh(), chunkSize, stats))
+    timestampMs = np.concatenate([chunk['timestampMs'] for chunk in chunks])
+    np.testing.assert_array_equal(timestampMs, [1583136000000, 1583136120000, 1583136180500])
+    assert stats == {'locations': 5, 'skipped': 2}
+
+
+def test_transform_json_file_with_out_of_range_location(tmp_path):
+    urlSaveFile = str(tmp_path / 'participant.csv')
+    numberObservations, _, _ = transformation.transform_json_file(_glh(), urlSaveFile)
+    assert numberObservations == 3
+    df = pd.read_csv(urlSaveFile)
+    np.testing.assert_allclose(df['latitude'], [-0.180653, -0.1806531, -0.1806532])
+
+
+def test_merge_with_out_of_range_location(tmp_path):
+    urlExport = tmp_path / 'export.json'
+    urlExport.write_text(json.dumps({'locations': LOCATIONS}))
+    numberObservations, _, _ = merge.merge_exports([str(urlExport)], str(tmp_path / 'merged.csv'))
+    assert numberObservations == 3
+
+
+def test_malformed_item_fails_without_reading_the_file():
+    # A value that can not be decoded is not completed with the rest of the file
+    text = '{"locations": [{"timestampMs": "1", "latitudeE7": 1, {]' + ' ' * 4096
+    readFile = io.StringIO(text)
+    stream = transformation._JSONStream(readFile, blockSize=64, maxValueSize=256)
+    assert transformation._seek_array(stream, 'locations')
+    with pytest.raises(RuntimeError, match='Malformed JSON file at character {}'.format(text.index(', {') + 2)):
+        stream.value()
+    assert readFile.tell() <= 256 + 64
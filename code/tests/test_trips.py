@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Giovanny Moncayo
+"""
+# =============================================================================
+# WEEKLY TRAJECTORIES AND TRIPS (MovingPandas ObservationGapSplitter, 30 minutes)
+# =============================================================================
+import numpy as np
+import pytest
+
+from anlocov import trips
+
+# Gaps of exactly 30 minutes (same trip) and of 30 minutes and 1 second (new trip)
+MINUTES = [0, 1, 2, 32, 33, 63 + 1 / 60, 64, 65]
+NORTH_KM = [0., .2, .4, .6, .8, 1., 1.2, 1.4]
+ID_TRIP = [0, 0, 0, 0, 0, 1, 1, 1]
+ID_WEEK = ['2020-03-02/2020-03-08_0'] * 5 + ['2020-03-02/2020-03-08_1'] * 3
+
+
+def _week(track, minutes=MINUTES, northKm=NORTH_KM, uid='u1'):
+    dfWeek = track(minutes, northKm, uid=uid).set_index('datetime').rename_axis('t')
+    dfWeek['idWeek'] = trips.week_codes(dfWeek.index.to_numpy().astype('datetime64[ns]').astype(np.int64))
+    return dfWeek
+
+
+def test_week_codes():
+    t = np.array(['2020-03-01T23:59:59', '2020-03-02T00:00:00', '2020-03-08T23:59:59'], dtype='datetime64[ns]')
+    codes = trips.week_codes(t.astype(np.int64))
+    assert codes[0] + 1 == codes[1] == codes[2]
+    assert trips.week_label(codes[1]) == '2020-03-02/2020-03-08'
+
+
+def test_gap_at_threshold(track, params):
+    hasTrajectory, dfWeekTrips = trips.week_trips(_week(track), params)
+    assert hasTrajectory
+    np.testing.assert_array_equal(dfWeekTrips['idTrip'], ID_TRIP)
+    np.testing.assert_array_equal(dfWeekTrips['idWeek'], ID_WEEK)
+    # The first step of each trip has no distance
+    np.testing.assert_allclose(dfWeekTrips['stepKm'], [0., .2, .2, .2, .2, 0., .2, .2], atol=1e-9)
+
+
+@pytest.mark.parametrize('minLengthTripM, expected', [(500, [0, 0, 0, 0, 0]), (1000, None)])
+def test_short_trips(track, params, minLengthTripM, expected):
+    # The second trip (0.4 km) is discarded with MIN_LENGTH_TRIP_MTR 500 and both with 1000
+    params = dict(params, MIN_LENGTH_TRIP_MTR=minLengthTripM)
+    hasTrajectory, dfWeekTrips = trips.week_trips(_week(track), params)
+    assert hasTrajectory
+    if expected is None:
+        assert dfWeekTrips is None
+    else:
+        np.testing.assert_array_equal(dfWeekTrips['idTrip'], expected)
+
+
+def test_cohort_gap_at_threshold(track, params):
+    # The bulk passes of the cohort split the trips as week_trips
+    dfPoints = _week(track).iloc[::-1]
+    dfWeeks, dfTrips, _ = trips.cohort_trips_stops(dfPoints, params)
+    np.testing.assert_array_equal(dfWeeks['numWeek'], [0])
+    np.testing.assert_array_equal(dfTrips['idTrip'], ID_TRIP)
+    np.testing.assert_array_equal(dfTrips['idWeek'], ID_WEEK)